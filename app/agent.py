@@ -1,16 +1,22 @@
 # mypy: disable-error-code="unused-ignore, union-attr"
 
-from typing import Dict
+from typing import Any, Dict, List, Tuple
 
 from langchain_core.messages import BaseMessage
-from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langchain_core.tools import tool
 from langchain_google_vertexai import ChatVertexAI
 from langgraph.graph import END, MessagesState, StateGraph
 from langgraph.prebuilt import ToolNode
 
+from app.utils.context import CONTEXT_WINDOW_KEY, ContextWindow, with_context_stats
+from app.utils.tool_cache import ToolCache
+
 LOCATION = "us-central1"
 LLM = "gemini-1.5-pro-002"
+TEMPERATURE = 0
+# Token budget of the conversation history sent to the model on each step
+CONTEXT_TOKEN_BUDGET = 32000
 
 
 # 1. Define tools
@@ -24,9 +30,14 @@ def search(query: str) -> str:
 
 tools = [search]
 
+# Memoize tool results across turns and conversations.
+# Wrap non-idempotent tools with enabled=False.
+tool_cache = ToolCache(ttl_seconds=300, max_entries=1024)
+cached_tools = [tool_cache.wrap(search)]
+
 # 2. Set up the language model
 llm = ChatVertexAI(
-    model=LLM, location=LOCATION, temperature=0, max_tokens=1024, streaming=True
+    model=LLM, location=LOCATION, temperature=TEMPERATURE, max_tokens=1024, streaming=True
 ).bind_tools(tools)
 
 
@@ -37,21 +48,45 @@ def should_continue(state: MessagesState) -> str:
     return "tools" if last_message.tool_calls else END
 
 
+SYSTEM_MESSAGE = "You are a helpful AI assistant."
+
+context_window = ContextWindow(max_tokens=CONTEXT_TOKEN_BUDGET)
+
+
+def prepare_messages(state: MessagesState) -> Tuple[List[Any], Dict[str, int]]:
+    """Trims the history to the token budget and prepends the system prompt."""
+    messages, context_stats = context_window.trim(state["messages"])
+    messages_with_system = [{"type": "system", "content": SYSTEM_MESSAGE}] + messages
+    return messages_with_system, context_stats
+
+
 def call_model(state: MessagesState, config: RunnableConfig) -> Dict[str, BaseMessage]:
     """Calls the language model and returns the response."""
-    system_message = "You are a helpful AI assistant."
-    messages_with_system = [{"type": "system", "content": system_message}] + state[
-        "messages"
-    ]
+    messages_with_system, context_stats = prepare_messages(state)
     # Forward the RunnableConfig object to ensure the agent is capable of streaming the response.
-    response = llm.invoke(messages_with_system, config)
+    response = llm.invoke(
+        messages_with_system, with_context_stats(config, context_stats)
+    )
+    response.response_metadata[CONTEXT_WINDOW_KEY] = context_stats
+    return {"messages": response}
+
+
+async def acall_model(
+    state: MessagesState, config: RunnableConfig
+) -> Dict[str, BaseMessage]:
+    """Async counterpart of `call_model`, used by `ainvoke`/`astream`."""
+    messages_with_system, context_stats = prepare_messages(state)
+    response = await llm.ainvoke(
+        messages_with_system, with_context_stats(config, context_stats)
+    )
+    response.response_metadata[CONTEXT_WINDOW_KEY] = context_stats
     return {"messages": response}
 
 
 # 4. Create the workflow graph
 workflow = StateGraph(MessagesState)
-workflow.add_node("agent", call_model)
-workflow.add_node("tools", ToolNode(tools))
+workflow.add_node("agent", RunnableLambda(call_model, afunc=acall_model))
+workflow.add_node("tools", ToolNode(cached_tools))
 workflow.set_entry_point("agent")
 
 # 5. Define graph edges
@@ -59,4 +94,4 @@ workflow.add_conditional_edges("agent", should_continue)
 workflow.add_edge("tools", "agent")
 
 # 6. Compile the workflow
-agent = workflow.compile()
\ No newline at end of file
+agent = workflow.compile()
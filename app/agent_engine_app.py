@@ -1,60 +1,282 @@
+import atexit
 import datetime
 import json
 import logging
 import os
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import google.auth
 import vertexai
 from google.cloud import logging as google_cloud_logging
 from langchain.load import dump as langchain_load_dump
 from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from opentelemetry.exporter.cloud_monitoring import CloudMonitoringMetricsExporter
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+from opentelemetry.sdk.trace import SpanProcessor
 from pydantic import BaseModel
 from traceloop.sdk import Instruments, Traceloop
 from typing import (
     Any,
+    AsyncIterable,
+    Dict,
     Iterable,
+    List,
     Literal,
     Mapping,
     Optional,
     Sequence,
+    Tuple,
     Union,
+    cast,
 )
 from vertexai.preview import reasoning_engines
 
+from app.utils.cache import ResponseCache, make_cache_key
+from app.utils.checkpoint import SQLiteCheckpointSaver
+from app.utils.context import aemit_context_stats, emit_context_stats
+from app.utils.export_queue import SpillingSpanProcessor
+from app.utils.feedback_queue import FeedbackQueue
 from app.utils.gcs import create_bucket_if_not_exists
+from app.utils.sampling import TailSamplingSpanProcessor
+from app.utils.serialization import DebugSink, encode_chunk
+from app.utils.startup import StartupProfiler
+from app.utils.streaming import ChunkCoalescer, acoalesce_chunks, coalesce_chunks
 from app.utils.tracing import CloudTraceLoggingSpanExporter
 
 logging.basicConfig(
     level=logging.INFO,
 )
 
+# Time to first request a fresh replica should stay under, see set_up
+STARTUP_TARGET_SECONDS = 10.0
+# Cloud Monitoring accepts one point per time series every 10 seconds at most;
+# one per minute matches the alignment period of its charts for a sixth of
+# the write requests
+METRICS_EXPORT_INTERVAL_MILLIS = 60000
+
+# Guards the lazy creation of the feedback queue; module level, as the app
+# itself is pickled on deployment
+_FEEDBACK_QUEUE_LOCK = threading.Lock()
+
 class AgentEngineApp:
-    def __init__(self, project_id: Optional[str] = None) -> None:
+    def __init__(
+        self,
+        project_id: Optional[str] = None,
+        debug: bool = False,
+        stream_window_ms: float = 50.0,
+        stream_window_bytes: int = 1024,
+        response_cache: Optional[ResponseCache] = None,
+        session_store_path: Optional[str] = None,
+        trace_sample_rate: float = 1.0,
+        trace_spill_path: Optional[str] = None,
+    ) -> None:
         """Initialize the AgentEngineApp variables
+
+        Args:
+            project_id: Google Cloud project ID
+            debug: Write every streamed chunk as a JSON line to stdout
+            stream_window_ms: Time window used to coalesce streamed tokens,
+                0 streams every token as its own chunk
+            stream_window_bytes: Size window used to coalesce streamed tokens
+            response_cache: Cache of responses to byte-identical message
+                histories, disabled when None
+            session_store_path: Path of the SQLite database keeping
+                conversation state server side, keyed by session_id. When
+                unset, clients must send the full conversation on every turn.
+                Checkpoints are never pruned: the database keeps every step
+                of a session until `checkpointer.delete_thread` removes it.
+            trace_sample_rate: Fraction of the uneventful traces exported.
+                Below 1, traces are sampled once complete: failed and slow
+                traces, and traces receiving feedback, are always exported.
+            trace_spill_path: Path of the file absorbing spans while the
+                tracing backends are slow or down. When unset, spans that do
+                not fit in the in-memory export queue are dropped.
         """
         self.project_id = project_id
+        self.debug_sink = DebugSink() if debug else None
+        self.stream_window_ms = stream_window_ms
+        self.stream_window_bytes = stream_window_bytes
+        self.response_cache = response_cache
+        self.session_store_path = session_store_path
+        self.trace_sample_rate = trace_sample_rate
+        self.trace_spill_path = trace_spill_path
+        self.span_sampler: Optional[TailSamplingSpanProcessor] = None
+        self.span_queue: Optional[SpillingSpanProcessor] = None
+        self.model_settings: Dict[str, Any] = {}
+        self.checkpointer: Optional[BaseCheckpointSaver] = None
+        self.startup_report: Dict[str, Any] = {}
+        self._logger: Optional[google_cloud_logging.Logger] = None
+        self._feedback_queue: Optional[FeedbackQueue] = None
 
     def set_up(self) -> None:
-        """The set_up method is used to define application initialization logic"""
-        # Lazy import agent at setup time to avoid deployment dependencies
-        from app.agent import agent
+        """The set_up method is used to define application initialization logic
 
-        logging_client = google_cloud_logging.Client()
-        self.logger = logging_client.logger(__name__)
-        
-        # Initialize Telemetry
-        try:
-            Traceloop.init(
-            app_name="Sample Chatbot Application",
-            disable_batch=False,
-            exporter=CloudTraceLoggingSpanExporter(project_id=self.project_id),
-            instruments={Instruments.VERTEXAI, Instruments.LANGCHAIN},
+        Telemetry is initialized first, so the instrumentation is in place
+        when the agent graph is imported. The Google Cloud clients of the span
+        exporter are then created on a worker thread while the agent graph is
+        imported and compiled. The Cloud Logging client of the app is created
+        on first use. Per-phase timings are logged and kept in
+        `startup_report`.
+        """
+        profiler = StartupProfiler(target_seconds=STARTUP_TARGET_SECONDS)
+        exporter = self._init_telemetry(profiler)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            if exporter is not None:
+                clients = executor.submit(self._create_clients, exporter, profiler)
+
+            with profiler.phase("agent"):
+                # Lazy import agent at setup time to avoid deployment dependencies
+                from app.agent import LLM, TEMPERATURE, workflow
+
+                self.checkpointer = self.create_checkpointer()
+                self.runnable = workflow.compile(checkpointer=self.checkpointer)
+                self.model_settings = {"model": LLM, "temperature": TEMPERATURE}
+
+            if exporter is not None:
+                clients.result()
+        self.startup_report = profiler.log()
+
+    def _init_telemetry(
+        self, profiler: StartupProfiler
+    ) -> Optional[CloudTraceLoggingSpanExporter]:
+        """Initializes Traceloop with the Cloud Trace and Logging exporter.
+
+        Returns:
+            The span exporter, None when the initialization failed
+        """
+        with profiler.phase("telemetry"):
+            try:
+                exporter = CloudTraceLoggingSpanExporter(
+                    project_id=self.project_id,
+                    meter_provider=self.create_meter_provider(),
+                )
+                self.span_queue = SpillingSpanProcessor(
+                    exporter, spill_path=self.trace_spill_path
+                )
+                processor: SpanProcessor = self.span_queue
+                if self.trace_sample_rate < 1.0:
+                    self.span_sampler = TailSamplingSpanProcessor(
+                        self.span_queue, sample_rate=self.trace_sample_rate
+                    )
+                    processor = self.span_sampler
+                Traceloop.init(
+                    app_name="Sample Chatbot Application",
+                    processor=processor,
+                    instruments={Instruments.VERTEXAI, Instruments.LANGCHAIN},
+                )
+                return exporter
+            except Exception as e:
+                logging.error("Failed to initialize Traceloop: %s", e)
+                return None
+
+    def create_meter_provider(self) -> Optional[MeterProvider]:
+        """Creates the meter provider receiving the span exporter metrics.
+
+        Exports them to Cloud Monitoring. Override this method to export them
+        elsewhere, or return None to send them to the global meter provider.
+        """
+        return MeterProvider(
+            metric_readers=[
+                PeriodicExportingMetricReader(
+                    CloudMonitoringMetricsExporter(project_id=self.project_id),
+                    export_interval_millis=METRICS_EXPORT_INTERVAL_MILLIS,
+                )
+            ]
         )
-        except Exception as e:
-            logging.error("Failed to initialize Traceloop: %s", e)
 
-        self.runnable = agent
+    @staticmethod
+    def _create_clients(
+        exporter: CloudTraceLoggingSpanExporter, profiler: StartupProfiler
+    ) -> None:
+        """Creates the clients of the span exporter, logging failures.
+
+        Clients failing to be created now are created again on first export.
+        """
+        with profiler.phase("exporter_clients"):
+            try:
+                exporter.create_clients()
+            except Exception as e:
+                logging.warning("Failed to create the span exporter clients: %s", e)
+
+    @property
+    def logger(self) -> google_cloud_logging.Logger:
+        """Cloud Logging logger, created on first use."""
+        if self._logger is None:
+            self._logger = google_cloud_logging.Client().logger(__name__)
+        return self._logger
+
+    @property
+    def feedback_queue(self) -> FeedbackQueue:
+        """Queue writing feedback in bulk, created on first use.
+
+        Queued feedback is written when the process exits.
+        """
+        with _FEEDBACK_QUEUE_LOCK:
+            if self._feedback_queue is None:
+                self._feedback_queue = FeedbackQueue(self._write_feedback)
+                atexit.register(self._feedback_queue.shutdown)
+        return self._feedback_queue
+
+    def _write_feedback(self, entries: List[Dict[str, Any]]) -> None:
+        """Writes feedback entries to Cloud Logging in a single request."""
+        batch = self.logger.batch()
+        for entry in entries:
+            batch.log_struct(entry, severity="INFO")
+        batch.commit()
+
+    def shutdown(self) -> None:
+        """Flushes and stops the background exports of the app.
+
+        Buffered spans are exported, or spilled to disk, and queued feedback
+        is written. Called when the app is replaced in process, e.g. by the
+        playground once the agent sources changed; the app must not be used
+        afterwards.
+        """
+        processor = self.span_sampler or self.span_queue
+        if processor is not None:
+            processor.shutdown()
+        if self._feedback_queue is not None:
+            self._feedback_queue.shutdown()
+
+    def create_checkpointer(self) -> Optional[BaseCheckpointSaver]:
+        """Creates the checkpointer holding server-side session state.
+
+        Uses a local SQLite database when `session_store_path` is set. Override
+        this method to keep sessions in a remote store instead.
+        """
+        if self.session_store_path is None:
+            return None
+        return SQLiteCheckpointSaver(path=self.session_store_path)
+
+    def _session_config(
+        self,
+        input: Union[str, Mapping[str, Any]],
+        config: Optional["RunnableConfig"] = None,
+    ) -> Optional["RunnableConfig"]:
+        """Binds a request to its server-side session, when sessions are enabled.
+
+        Sessions are scoped to the user of the request, so a user guessing the
+        session ID of another one does not get access to their conversation.
+        Must be called before `_set_tracing_properties`, which consumes the
+        user and session IDs of the input.
+        """
+        if (
+            self.checkpointer is None
+            or not isinstance(input, Mapping)
+            or "session_id" not in input
+        ):
+            return config
+        config = RunnableConfig(**(config or {}))
+        config["configurable"] = {
+            **config.get("configurable", {}),
+            "thread_id": f"{input.get('user_id', 'None')}:{input['session_id']}",
+        }
+        return config
+
     def _set_tracing_properties(
         self,
         input: Mapping[str, Any], 
@@ -78,34 +300,250 @@ class AgentEngineApp:
             }
         )
 
+    def _prepare_batch(
+        self,
+        inputs: Sequence[Union[str, Mapping[str, Any]]],
+        config: Optional["RunnableConfig"],
+        max_concurrency: int,
+    ) -> Tuple[List[Union[str, Mapping[str, Any]]], List["RunnableConfig"]]:
+        """Builds the items and configs of a batch, one config per item.
+
+        The user and session IDs of each item are moved to the item's run
+        metadata, and the shared run ID is only used as tracing association.
+        Items are copied, the caller's inputs are left untouched.
+        """
+        self._set_tracing_properties(input={}, config=config)
+        shared_config: Dict[str, Any] = {
+            k: v for k, v in (config or {}).items() if k != "run_id"
+        }
+        items: List[Union[str, Mapping[str, Any]]] = []
+        configs: List["RunnableConfig"] = []
+        for item in inputs:
+            item_config = cast("RunnableConfig", dict(shared_config))
+            item_config = self._session_config(item, item_config) or item_config
+            metadata = dict(item_config.get("metadata", {}))
+            if isinstance(item, Mapping):
+                item = dict(item)
+                metadata["user_id"] = item.pop("user_id", "None")
+                metadata["session_id"] = item.pop("session_id", "None")
+            item_config["metadata"] = metadata
+            item_config["max_concurrency"] = max_concurrency
+            items.append(item)
+            configs.append(item_config)
+        return items, configs
+
+    @staticmethod
+    def _dump_batch_result(result: Any) -> Dict[str, Any]:
+        """Serializes a batch item result, or the error it raised."""
+        if isinstance(result, Exception):
+            return {"error": {"type": type(result).__name__, "message": str(result)}}
+        return langchain_load_dump.dumpd(result)
+
+    def _cache_key(
+        self,
+        operation: str,
+        input: Union[str, Mapping[str, Any]],
+        config: Optional["RunnableConfig"] = None,
+    ) -> Optional[Tuple[ResponseCache, str]]:
+        """Returns the response cache and the key of a request, None if not cached.
+
+        Requests bound to a server-side session are not cached: their input
+        only holds the new messages.
+        """
+        if self.response_cache is None or not isinstance(input, Mapping):
+            return None
+        if config and "thread_id" in config.get("configurable", {}):
+            return None
+        return self.response_cache, make_cache_key(
+            operation, input.get("messages", []), self.model_settings
+        )
+
+    def _coalescer(self) -> ChunkCoalescer:
+        """Creates the per-request token coalescing stage."""
+        return ChunkCoalescer(
+            max_delay_ms=self.stream_window_ms, max_bytes=self.stream_window_bytes
+        )
+
     # The query method will be used to send inputs to the agent
     def stream_query(
         self,
         *,
         input: Union[str, Mapping[str, Any]],
         config: Optional["RunnableConfig"] = None,
-        **kwargs,
+        **kwargs: Any,
     ) -> Iterable[Any]:
+        config = self._session_config(input, config)
         self._set_tracing_properties(input=input, config=config)
-        for chunk in self.runnable.stream(input=input, config=config, **kwargs, stream_mode="messages"):
-            dumped_chunk = langchain_load_dump.dumpd(chunk)
-            print(dumped_chunk)
-            yield dumped_chunk
+        cache_entry = self._cache_key("stream", input, config)
+        if cache_entry is not None:
+            response_cache, cache_key = cache_entry
+            cached_chunks = response_cache.get(cache_key)
+            if cached_chunks is not None:
+                yield from cached_chunks
+                return
 
-    def register_feedback(self,feedback: dict):
-        """Collect and log feedback."""
-        feedback = Feedback.model_validate(feedback)
-        self.logger.log_struct(feedback.model_dump(), severity="INFO")
+        encoded_chunks = []
+        chunks = self.runnable.stream(input=input, config=config, **kwargs, stream_mode="messages")
+        for chunk in emit_context_stats(coalesce_chunks(chunks, self._coalescer())):
+            encoded_chunk = encode_chunk(chunk)
+            if self.debug_sink is not None:
+                self.debug_sink.write(encoded_chunk)
+            encoded_chunks.append(encoded_chunk)
+            yield encoded_chunk
 
-    def query(self,
+        if cache_entry is not None:
+            response_cache.set(cache_key, encoded_chunks)
+
+    async def async_stream_query(
+        self,
         *,
         input: Union[str, Mapping[str, Any]],
         config: Optional["RunnableConfig"] = None,
-        **kwargs
+        **kwargs: Any,
+    ) -> AsyncIterable[Any]:
+        """Asynchronously streams the agent response.
+
+        Built on the graph's `astream`, so concurrent conversations share the
+        event loop instead of each pinning a worker thread.
+        """
+        config = self._session_config(input, config)
+        self._set_tracing_properties(input=input, config=config)
+        cache_entry = self._cache_key("stream", input, config)
+        if cache_entry is not None:
+            response_cache, cache_key = cache_entry
+            cached_chunks = response_cache.get(cache_key)
+            if cached_chunks is not None:
+                for cached_chunk in cached_chunks:
+                    yield cached_chunk
+                return
+
+        encoded_chunks = []
+        chunks = self.runnable.astream(
+            input=input, config=config, **kwargs, stream_mode="messages"
+        )
+        async for chunk in aemit_context_stats(
+            acoalesce_chunks(chunks, self._coalescer())
         ):
-        return langchain_load_dump.dumpd(
+            encoded_chunk = encode_chunk(chunk)
+            if self.debug_sink is not None:
+                self.debug_sink.write(encoded_chunk)
+            encoded_chunks.append(encoded_chunk)
+            yield encoded_chunk
+
+        if cache_entry is not None:
+            response_cache.set(cache_key, encoded_chunks)
+
+    def register_feedback(self, feedback: Union[dict, List[dict]]):
+        """Collect and log feedback.
+
+        Feedback is validated, then acknowledged once queued: it is written to
+        Cloud Logging in bulk by a background thread.
+
+        Args:
+            feedback: A feedback record, or a list of records, for instance
+                collected offline by a client
+
+        Raises:
+            RuntimeError: When the queue is full and some records were
+                dropped. The records before the dropped ones were queued, only
+                the others should be sent again.
+        """
+        records = feedback if isinstance(feedback, list) else [feedback]
+        validated = [Feedback.model_validate(record) for record in records]
+        if self.span_sampler is not None:
+            for record in validated:
+                self.span_sampler.keep_run(record.run_id)
+        queued = self.feedback_queue.put([record.model_dump() for record in validated])
+        if queued < len(validated):
+            raise RuntimeError(
+                f"Feedback queue full: queued the first {queued} of "
+                f"{len(validated)} records, the others were dropped"
+            )
+
+    def query(self,
+        *,
+        input: Union[str, Mapping[str, Any]],
+        config: Optional["RunnableConfig"] = None,
+        **kwargs: Any,
+        ) -> Any:
+        config = self._session_config(input, config)
+        cache_entry = self._cache_key("query", input, config)
+        if cache_entry is not None:
+            response_cache, cache_key = cache_entry
+            cached_response = response_cache.get(cache_key)
+            if cached_response is not None:
+                return cached_response
+
+        response = langchain_load_dump.dumpd(
             self.runnable.invoke(input=input, config=config, **kwargs)
-        )    
+        )
+        if cache_entry is not None:
+            response_cache.set(cache_key, response)
+        return response
+
+    async def async_query(
+        self,
+        *,
+        input: Union[str, Mapping[str, Any]],
+        config: Optional["RunnableConfig"] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """Asynchronously invokes the agent and returns the final state."""
+        config = self._session_config(input, config)
+        cache_entry = self._cache_key("query", input, config)
+        if cache_entry is not None:
+            response_cache, cache_key = cache_entry
+            cached_response = response_cache.get(cache_key)
+            if cached_response is not None:
+                return cached_response
+
+        response = langchain_load_dump.dumpd(
+            await self.runnable.ainvoke(input=input, config=config, **kwargs)
+        )
+        if cache_entry is not None:
+            response_cache.set(cache_key, response)
+        return response
+
+    def batch_query(
+        self,
+        *,
+        inputs: Sequence[Union[str, Mapping[str, Any]]],
+        config: Optional["RunnableConfig"] = None,
+        max_concurrency: int = 8,
+        **kwargs: Any,
+    ) -> List[Dict[str, Any]]:
+        """Runs several inputs through the agent with bounded concurrency.
+
+        Results are returned in input order. An item that fails is returned as
+        ``{"error": {"type": ..., "message": ...}}`` instead of failing the batch.
+        """
+        items, configs = self._prepare_batch(inputs, config, max_concurrency)
+        results = self.runnable.batch(
+            items,
+            config=configs,
+            return_exceptions=True,
+            **kwargs,
+        )
+        return [self._dump_batch_result(result) for result in results]
+
+    async def async_batch_query(
+        self,
+        *,
+        inputs: Sequence[Union[str, Mapping[str, Any]]],
+        config: Optional["RunnableConfig"] = None,
+        max_concurrency: int = 8,
+        **kwargs: Any,
+    ) -> List[Dict[str, Any]]:
+        """Async counterpart of `batch_query`, built on the graph's `abatch`."""
+        items, configs = self._prepare_batch(inputs, config, max_concurrency)
+        results = await self.runnable.abatch(
+            items,
+            config=configs,
+            return_exceptions=True,
+            **kwargs,
+        )
+        return [self._dump_batch_result(result) for result in results]
+
     def register_operations(self) -> Mapping[str, Sequence[str]]:
         """Registers the operations of the Agent.
 
@@ -113,13 +551,16 @@ class AgentEngineApp:
         are implemented by specific methods of the Agent.  The "default" mode,
         represented by the empty string ``, is associated with the `query` API,
         while the "stream" mode is associated with the `stream_query` API.
+        The pinned Vertex AI SDK only supports these two modes: the coroutine
+        based `async_query`, `async_batch_query` and `async_stream_query` are
+        only available in process, e.g. in the playground.
 
         Returns:
             Mapping[str, Sequence[str]]: A mapping of operation modes to a list
             of method names that implement those operation modes.
         """
         return {
-            "": ["query", "register_feedback"],
+            "": ["query", "batch_query", "register_feedback"],
             "stream": ["stream_query"],
         }
 
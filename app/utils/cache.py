@@ -0,0 +1,238 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple
+
+import orjson
+from langchain_core.messages import BaseMessage
+
+# Message types that are equivalent for caching purposes
+MESSAGE_TYPE_ALIASES = {
+    "user": "human",
+    "assistant": "ai",
+    "AIMessageChunk": "ai",
+    "HumanMessageChunk": "human",
+    "ToolMessageChunk": "tool",
+    "SystemMessageChunk": "system",
+}
+
+
+def normalize_message(message: Any) -> Dict[str, Any]:
+    """
+    Reduce a message to the fields that influence the model response.
+
+    IDs (message IDs, tool call IDs) and provider metadata are dropped, so
+    the same conversation replayed by a client hashes to the same key.
+
+    :param message: A message as a dict, `BaseMessage`, `(type, content)` tuple or string
+    :return: The normalized message
+    """
+    if isinstance(message, BaseMessage):
+        message = message.model_dump()
+    elif isinstance(message, (tuple, list)):
+        message = {"type": message[0], "content": message[1]}
+    elif isinstance(message, str):
+        message = {"type": "human", "content": message}
+
+    message_type = message.get("type") or message.get("role")
+    normalized = {
+        "type": MESSAGE_TYPE_ALIASES.get(message_type, message_type),
+        "content": message.get("content"),
+    }
+    tool_calls = message.get("tool_calls")
+    if tool_calls:
+        normalized["tool_calls"] = [
+            {"name": tool_call["name"], "args": tool_call["args"]}
+            for tool_call in tool_calls
+        ]
+    return normalized
+
+
+def make_cache_key(
+    operation: str, messages: Sequence[Any], model_settings: Mapping[str, Any]
+) -> str:
+    """
+    Compute the cache key of a request.
+
+    :param operation: The operation the response belongs to (e.g. "query", "stream")
+    :param messages: The request message history
+    :param model_settings: Settings of the model answering (name, temperature, ...)
+    :return: A SHA-256 hex digest of the canonical request
+    """
+    canonical = orjson.dumps(
+        {
+            "operation": operation,
+            "messages": [normalize_message(message) for message in messages],
+            "model": dict(model_settings),
+        },
+        option=orjson.OPT_SORT_KEYS,
+    )
+    return hashlib.sha256(canonical).hexdigest()
+
+
+class CacheBackend(ABC):
+    """Storage interface of the response cache. Values are opaque bytes."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the value stored for `key`, or None if missing or expired."""
+
+    @abstractmethod
+    def set(self, key: str, value: bytes) -> None:
+        """Store `value` under `key`, evicting entries if needed."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove all entries."""
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """
+    In-process backend with LRU and TTL eviction.
+
+    Values are stored by reference, so it can also hold arbitrary objects.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """On-disk backend with LRU and TTL eviction, shared across processes."""
+
+    def __init__(
+        self,
+        path: str = ".cache/responses.sqlite",
+        max_entries: int = 10000,
+        ttl_seconds: float = 24 * 3600,
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """The SQLite connection, opened on first use."""
+        if self._connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value BLOB, expires_at REAL, accessed_at REAL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at "
+                "ON responses (accessed_at)"
+            )
+        return self._connection
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock, self.connection as connection:
+            row = connection.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            return row[0]
+
+    def set(self, key: str, value: bytes) -> None:
+        now = time.time()
+        with self._lock, self.connection as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, value, now + self.ttl_seconds, now),
+            )
+            connection.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+            connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._lock, self.connection as connection:
+            connection.execute("DELETE FROM responses")
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class ResponseCache:
+    """Exact-match cache of agent responses, on top of a `CacheBackend`."""
+
+    def __init__(self, backend: Optional[CacheBackend] = None) -> None:
+        self.backend = backend or InMemoryCacheBackend()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached response for `key`, if any."""
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return orjson.loads(value)
+
+    def set(self, key: str, response: Any) -> None:
+        """Cache a response (a query result or the list of streamed chunks)."""
+        self.backend.set(key, orjson.dumps(response))
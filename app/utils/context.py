@@ -0,0 +1,224 @@
+import hashlib
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import orjson
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import merge_configs
+
+from app.utils.cache import InMemoryCacheBackend
+
+# Flat cost of a non-text part (image, document, ...) and of the message envelope
+MEDIA_PART_TOKENS = 258
+MESSAGE_OVERHEAD_TOKENS = 4
+# Key of the trimming statistics in the response and stream metadata
+CONTEXT_WINDOW_KEY = "context_window"
+
+
+def approximate_token_count(message: BaseMessage) -> int:
+    """
+    Estimate the number of tokens of a message (about 4 characters per token).
+
+    Inline media is charged a flat cost instead of its encoded size.
+
+    :param message: The message to measure
+    :return: The estimated number of tokens
+    """
+    characters = 0
+    media_tokens = 0
+    if isinstance(message.content, str):
+        characters += len(message.content)
+    else:
+        for part in message.content:
+            if isinstance(part, str):
+                characters += len(part)
+            elif part.get("type") == "text":
+                characters += len(part.get("text", ""))
+            else:
+                media_tokens += MEDIA_PART_TOKENS
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        characters += len(tool_call["name"]) + len(orjson.dumps(tool_call["args"]))
+    return MESSAGE_OVERHEAD_TOKENS + media_tokens + characters // 4
+
+
+class ContextWindow:
+    """
+    Trims a conversation to a token budget before it is sent to the model.
+
+    The most recent messages are kept. The kept window always opens on a human
+    message when one fits, so tool results are never separated from the tool
+    call that produced them. Token counts are computed once per message ID.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        token_counter: Optional[Callable[[BaseMessage], int]] = None,
+        cache_size: int = 10000,
+    ) -> None:
+        """
+        Initialize the context window.
+
+        :param max_tokens: Token budget of the conversation history
+        :param token_counter: Function counting the tokens of a message
+        :param cache_size: Number of per-message token counts kept in memory
+        """
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter or approximate_token_count
+        self._token_counts = InMemoryCacheBackend(
+            max_entries=cache_size, ttl_seconds=float("inf")
+        )
+
+    def count(self, message: BaseMessage) -> int:
+        """Return the token count of a message, cached by message ID and content."""
+        if message.id is None:
+            return self.token_counter(message)
+        content = orjson.dumps(
+            [message.type, message.content, getattr(message, "tool_calls", None)],
+            default=str,
+        )
+        key = f"{message.id}:{hashlib.sha256(content).hexdigest()}"
+        count = self._token_counts.get(key)
+        if count is None:
+            count = self.token_counter(message)
+            self._token_counts.set(key, count)
+        return count
+
+    def trim(
+        self, messages: Sequence[BaseMessage]
+    ) -> Tuple[List[BaseMessage], Dict[str, int]]:
+        """
+        Keep the most recent messages that fit in the budget.
+
+        :param messages: The conversation history, oldest first
+        :return: The kept messages and statistics on what was dropped
+        """
+        counts = [self.count(message) for message in messages]
+        start = len(messages)
+        kept_tokens = 0
+        for index in reversed(range(len(messages))):
+            if kept_tokens + counts[index] > self.max_tokens and start < len(messages):
+                break
+            kept_tokens += counts[index]
+            start = index
+
+        if start > 0:
+            human_index = next(
+                (
+                    index
+                    for index in range(start, len(messages))
+                    if messages[index].type == "human"
+                ),
+                None,
+            )
+            if human_index is not None:
+                start = human_index
+            else:
+                while start < len(messages) - 1 and messages[start].type == "tool":
+                    start += 1
+
+        return list(messages[start:]), {
+            "kept_tokens": sum(counts[start:]),
+            "dropped_tokens": sum(counts[:start]),
+            "dropped_messages": start,
+        }
+
+
+def with_context_stats(
+    config: RunnableConfig, context_stats: Dict[str, int]
+) -> RunnableConfig:
+    """
+    Attach trimming statistics to the config of a model call.
+
+    The chunks streamed by the model then carry them in their metadata, see
+    `ContextStatsEmitter`.
+
+    :param config: The config of the node calling the model
+    :param context_stats: The statistics returned by `ContextWindow.trim`
+    :return: The config to call the model with
+    """
+    return merge_configs(config, {"metadata": {CONTEXT_WINDOW_KEY: context_stats}})
+
+
+class ContextStatsEmitter:
+    """
+    Emits the trimming statistics of each model call on a message stream.
+
+    A streamed model message is sent before the statistics can be attached to
+    its `response_metadata`, so they ride on the metadata of its chunks (see
+    `with_context_stats`). Once the message ends, they are emitted as a single
+    empty chunk of the same message, with the statistics in its
+    `response_metadata`. Messages emitted whole already carry them there.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the emitter."""
+        self._pending: Optional[Tuple[AIMessageChunk, Mapping[str, Any]]] = None
+
+    def add(self, chunk: Any) -> List[Any]:
+        """
+        Add a `(message, metadata)` chunk.
+
+        :param chunk: The chunk produced by ``stream(..., stream_mode="messages")``
+        :return: The chunks ready to be emitted, in order
+        """
+        message, metadata = (
+            chunk if isinstance(chunk, tuple) and len(chunk) == 2 else (None, None)
+        )
+        ready = []
+        if (
+            self._pending is not None
+            and getattr(message, "id", None) != self._pending[0].id
+        ):
+            ready = self.flush()
+        if (
+            isinstance(message, AIMessageChunk)
+            and isinstance(metadata, Mapping)
+            and CONTEXT_WINDOW_KEY in metadata
+            and CONTEXT_WINDOW_KEY not in message.response_metadata
+        ):
+            stats_message = AIMessageChunk(
+                content="",
+                id=message.id,
+                response_metadata={CONTEXT_WINDOW_KEY: metadata[CONTEXT_WINDOW_KEY]},
+            )
+            self._pending = (stats_message, metadata)
+        return ready + [chunk]
+
+    def flush(self) -> List[Any]:
+        """Emit the statistics of the current message, if any."""
+        if self._pending is None:
+            return []
+        pending, self._pending = self._pending, None
+        return [pending]
+
+
+def emit_context_stats(chunks: Iterable[Any]) -> Iterator[Any]:
+    """Add the trimming statistics of each model call to a message stream."""
+    emitter = ContextStatsEmitter()
+    for chunk in chunks:
+        yield from emitter.add(chunk)
+    yield from emitter.flush()
+
+
+async def aemit_context_stats(chunks: AsyncIterable[Any]) -> AsyncIterator[Any]:
+    """Async counterpart of `emit_context_stats`."""
+    emitter = ContextStatsEmitter()
+    async for chunk in chunks:
+        for ready in emitter.add(chunk):
+            yield ready
+    for ready in emitter.flush():
+        yield ready
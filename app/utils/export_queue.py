@@ -0,0 +1,467 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import orjson
+from opentelemetry.context import Context
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import Event, ReadableSpan, Span, SpanProcessor
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.sdk.util.instrumentation import InstrumentationScope
+from opentelemetry.trace import (
+    Link,
+    SpanContext,
+    SpanKind,
+    Status,
+    StatusCode,
+    TraceFlags,
+    TraceState,
+)
+
+# File header: magic, then the offset of the first record not yet exported.
+# The magic changes with the record format, older files are discarded.
+_MAGIC = b"SPN2"
+_HEADER = struct.Struct("<4sQ")
+# Record header: payload length and CRC32 of the payload
+_RECORD = struct.Struct("<II")
+# Time given to the export thread to spill the remaining spans on shutdown
+_SHUTDOWN_GRACE_SECONDS = 5.0
+
+
+def _dump_context(context: SpanContext) -> List[Any]:
+    return [
+        format(context.trace_id, "032x"),
+        format(context.span_id, "016x"),
+        int(context.trace_flags),
+        list(context.trace_state.items()),
+        context.is_remote,
+    ]
+
+
+def _load_context(context: List[Any]) -> SpanContext:
+    trace_id, span_id, trace_flags, trace_state, is_remote = context
+    return SpanContext(
+        trace_id=int(trace_id, 16),
+        span_id=int(span_id, 16),
+        is_remote=is_remote,
+        trace_flags=TraceFlags(trace_flags),
+        trace_state=TraceState([tuple(entry) for entry in trace_state]),
+    )
+
+
+def dump_span(span: ReadableSpan) -> bytes:
+    """
+    Serialize a finished span to JSON, keeping every field `load_span` needs.
+
+    IDs are written as hex strings and times as integer nanoseconds, so spans
+    round trip exactly; sequence attribute values are read back as lists.
+    """
+    scope = span.instrumentation_scope
+    return orjson.dumps(
+        {
+            "name": span.name,
+            "context": _dump_context(span.context) if span.context else None,
+            "parent": _dump_context(span.parent) if span.parent else None,
+            "resource": [dict(span.resource.attributes), span.resource.schema_url],
+            "attributes": dict(span.attributes or {}),
+            "events": [
+                [event.name, dict(event.attributes or {}), event.timestamp]
+                for event in span.events
+            ],
+            "links": [
+                [_dump_context(link.context), dict(link.attributes or {})]
+                for link in span.links
+            ],
+            "kind": span.kind.value,
+            "status": [span.status.status_code.value, span.status.description],
+            "start_time": span.start_time,
+            "end_time": span.end_time,
+            "scope": (
+                [
+                    scope.name,
+                    scope.version,
+                    scope.schema_url,
+                    dict(scope.attributes or {}),
+                ]
+                if scope is not None
+                else None
+            ),
+        }
+    )
+
+
+def load_span(data: bytes) -> ReadableSpan:
+    """Deserialize a span serialized with `dump_span`."""
+    span = orjson.loads(data)
+    status_code, description = span["status"]
+    return ReadableSpan(
+        name=span["name"],
+        context=_load_context(span["context"]) if span["context"] else None,
+        parent=_load_context(span["parent"]) if span["parent"] else None,
+        resource=Resource(*span["resource"]),
+        attributes=span["attributes"],
+        events=[Event(*event) for event in span["events"]],
+        links=[
+            Link(_load_context(context), attributes)
+            for context, attributes in span["links"]
+        ],
+        kind=SpanKind(span["kind"]),
+        status=Status(StatusCode(status_code), description),
+        start_time=span["start_time"],
+        end_time=span["end_time"],
+        instrumentation_scope=(
+            InstrumentationScope(*span["scope"]) if span["scope"] else None
+        ),
+    )
+
+
+class SpillFile:
+    """
+    Append-only, memory-mapped file of records, with a persisted read offset.
+
+    Each record is its length, its CRC32 and its payload, followed by a zero
+    length marking the end of the data. On open, records are scanned from the
+    read offset and the first incomplete or corrupted one ends the file, so a
+    crash while appending loses at most the record being written. Records
+    read but not committed are read again after a crash (at-least-once).
+    Space is reclaimed once every record has been committed, or once the read
+    offset passes half of the file, by moving the remaining records to its
+    start, so a backlog that never fully drains does not fill the file.
+    """
+
+    def __init__(self, path: str, size: int = 64 * 1024 * 1024) -> None:
+        """
+        Open the spill file, creating it or recovering its records.
+
+        :param path: Path of the file
+        :param size: Size of the file, the maximum amount of spilled data
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.size = size
+
+        magic, read_offset = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or not _HEADER.size <= read_offset <= size:
+            read_offset = _HEADER.size
+            self._write_header(read_offset)
+            self._write_end_marker(read_offset)
+        self.read_offset = read_offset
+        self.records = 0
+        self.write_offset = read_offset
+        for _, end in self._scan(read_offset):
+            self.write_offset = end
+            self.records += 1
+
+    def _write_header(self, read_offset: int) -> None:
+        _HEADER.pack_into(self._map, 0, _MAGIC, read_offset)
+
+    def _write_end_marker(self, offset: int) -> None:
+        if offset + 4 <= self.size:
+            self._map[offset : offset + 4] = b"\x00\x00\x00\x00"
+
+    def _scan(
+        self, offset: int, limit: Optional[int] = None
+    ) -> Iterator[Tuple[bytes, int]]:
+        """Yield the payloads of the valid records from `offset`, with their end."""
+        count = 0
+        while offset + _RECORD.size <= self.size and (limit is None or count < limit):
+            length, crc = _RECORD.unpack_from(self._map, offset)
+            start = offset + _RECORD.size
+            end = start + length
+            if length == 0 or end > self.size:
+                return
+            payload = self._map[start:end]
+            if zlib.crc32(payload) != crc:
+                return
+            yield payload, end
+            offset = end
+            count += 1
+
+    @property
+    def used_bytes(self) -> int:
+        """Bytes of records not yet committed."""
+        return self.write_offset - self.read_offset
+
+    def append(self, payload: bytes) -> bool:
+        """
+        Append a record.
+
+        :param payload: The record payload
+        :return: False if the file is full
+        """
+        end = self.write_offset + _RECORD.size + len(payload)
+        if end + 4 > self.size:
+            return False
+        # The end marker is written first, the record header last
+        self._write_end_marker(end)
+        self._map[self.write_offset + _RECORD.size : end] = payload
+        _RECORD.pack_into(
+            self._map, self.write_offset, len(payload), zlib.crc32(payload)
+        )
+        self.write_offset = end
+        self.records += 1
+        return True
+
+    def read(self, limit: int) -> Tuple[List[bytes], int]:
+        """
+        Read the oldest records without consuming them.
+
+        :param limit: Maximum number of records
+        :return: The payloads and the offset to pass to `commit`
+        """
+        payloads = []
+        end = self.read_offset
+        for payload, end in self._scan(self.read_offset, limit):
+            payloads.append(payload)
+        return payloads, end
+
+    def commit(self, offset: int, count: int) -> None:
+        """
+        Consume the records read up to `offset`.
+
+        :param offset: The offset returned by `read`
+        :param count: The number of records read
+        """
+        self.records -= count
+        if offset >= self.write_offset:
+            # Everything was consumed, write again from the start
+            offset = self.write_offset = _HEADER.size
+            self._write_end_marker(offset)
+            self.records = 0
+        self.read_offset = offset
+        self._write_header(offset)
+        if offset - _HEADER.size >= self.size // 2:
+            self._compact()
+
+    def _compact(self) -> None:
+        """
+        Move the records not yet committed to the start of the file.
+
+        Only done when the moved records and their end marker fit before the
+        read offset: until the header points at the moved copy, the original
+        records are left intact and are the ones recovered after a crash.
+        """
+        used = self.used_bytes
+        start = _HEADER.size
+        if start + used + 4 > self.read_offset:
+            return
+        self._map.move(start, self.read_offset, used)
+        self._write_end_marker(start + used)
+        self._map.flush()
+        self.read_offset, self.write_offset = start, start + used
+        self._write_header(start)
+
+    def flush(self) -> None:
+        """Write the mapped pages to disk."""
+        self._map.flush()
+
+    def close(self) -> None:
+        """Flush and unmap the file."""
+        self._map.flush()
+        self._map.close()
+
+
+class SpillingSpanProcessor(SpanProcessor):
+    """
+    Exports finished spans in batches from a bounded queue, spilling to disk.
+
+    Spans are queued in memory. When the queue is full, for instance while
+    Cloud Logging or Cloud Trace slow down, spans are appended to a
+    `SpillFile` instead of blocking the application or being dropped; they
+    are exported once the backend catches up, and survive a restart. Failed
+    exports are retried with exponential backoff, with the whole batch: the
+    exporter must be idempotent, as `CloudTraceLoggingSpanExporter` is, since
+    part of a failed batch may already be stored. Spans are only dropped
+    when the spill file is full, or without spill file.
+    """
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        max_queue_size: int = 2048,
+        max_export_batch_size: int = 512,
+        schedule_delay_millis: float = 5000,
+        spill_path: Optional[str] = None,
+        spill_bytes: int = 64 * 1024 * 1024,
+        max_backoff_seconds: float = 60.0,
+        shutdown_timeout_millis: int = 30000,
+    ) -> None:
+        """
+        Initialize the processor and start its export thread.
+
+        :param exporter: The exporter receiving the batches
+        :param max_queue_size: Maximum number of spans queued in memory
+        :param max_export_batch_size: Maximum number of spans per export
+        :param schedule_delay_millis: Maximum delay before queued spans are exported
+        :param spill_path: Path of the spill file, spans are dropped instead of
+            spilled when unset
+        :param spill_bytes: Size of the spill file
+        :param max_backoff_seconds: Maximum delay between failed exports
+        :param shutdown_timeout_millis: Time given to export the remaining spans
+            on shutdown, before they are spilled
+        """
+        self.exporter = exporter
+        self.max_queue_size = max_queue_size
+        self.max_export_batch_size = max_export_batch_size
+        self.schedule_delay = schedule_delay_millis / 1000
+        self.max_backoff_seconds = max_backoff_seconds
+        self.shutdown_timeout_millis = shutdown_timeout_millis
+        self.spill = SpillFile(spill_path, spill_bytes) if spill_path else None
+        self.dropped_spans = 0
+        self.exported_spans = 0
+
+        self._queue: Deque[ReadableSpan] = deque()
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._flush_requested = False
+        self._export_idle = threading.Event()
+        self._shutdown = False
+        self._worker = threading.Thread(
+            target=self._run, name="span-export-queue", daemon=True
+        )
+        self._worker.start()
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        pass
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if self._shutdown or not span.context.trace_flags.sampled:
+            return
+        with self._condition:
+            if len(self._queue) < self.max_queue_size:
+                self._queue.append(span)
+                if len(self._queue) >= self.max_export_batch_size:
+                    self._condition.notify()
+                return
+        self._spill([span])
+
+    def _spill(self, spans: List[ReadableSpan]) -> None:
+        """Append spans to the spill file, counting those that do not fit."""
+        if self.spill is None:
+            with self._lock:
+                self.dropped_spans += len(spans)
+            return
+        payloads = [dump_span(span) for span in spans]
+        with self._lock:
+            for payload in payloads:
+                if not self.spill.append(payload):
+                    self.dropped_spans += 1
+
+    def _next_batch(self) -> Tuple[List[ReadableSpan], List[ReadableSpan], int, int]:
+        """Take queued spans, completed with spilled spans, for the next export."""
+        batch = [
+            self._queue.popleft()
+            for _ in range(min(len(self._queue), self.max_export_batch_size))
+        ]
+        spilled: List[ReadableSpan] = []
+        spill_offset = spill_count = 0
+        if self.spill is not None and len(batch) < self.max_export_batch_size:
+            payloads, spill_offset = self.spill.read(
+                self.max_export_batch_size - len(batch)
+            )
+            spill_count = len(payloads)
+            spilled = [load_span(payload) for payload in payloads]
+        return batch, spilled, spill_offset, spill_count
+
+    def _has_work(self) -> bool:
+        return bool(self._queue) or (self.spill is not None and self.spill.records > 0)
+
+    def _run(self) -> None:
+        backoff = 0.0
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._shutdown
+                    or (
+                        not backoff
+                        and (
+                            self._flush_requested
+                            or len(self._queue) >= self.max_export_batch_size
+                            # Drain the backlog without waiting once healthy
+                            or (self.spill is not None and self.spill.records > 0)
+                        )
+                    ),
+                    timeout=backoff or self.schedule_delay,
+                )
+                if self.spill is not None:
+                    # Spilled pages reach the disk at least once per cycle
+                    self.spill.flush()
+                if self._shutdown:
+                    remaining = list(self._queue)
+                    self._queue.clear()
+                    break
+                if not self._has_work():
+                    self._flush_requested = False
+                    self._export_idle.set()
+                    continue
+                batch, spilled, spill_offset, spill_count = self._next_batch()
+
+            try:
+                result = self.exporter.export(batch + spilled)
+            except Exception as e:
+                logging.error("Failed to export spans: %s", e)
+                result = SpanExportResult.FAILURE
+
+            if result == SpanExportResult.SUCCESS:
+                backoff = 0.0
+                with self._lock:
+                    self.exported_spans += len(batch) + len(spilled)
+                    if self.spill is not None and spill_count:
+                        self.spill.commit(spill_offset, spill_count)
+            else:
+                # Keep the spans for a later attempt; spilled spans were not consumed
+                self._spill(batch)
+                backoff = min(max(backoff * 2, 1.0), self.max_backoff_seconds)
+
+        # Queued spans are kept on disk for the next process
+        self._spill(remaining)
+
+    def stats(self) -> Dict[str, int]:
+        """Queue depth, spilled spans and bytes, exported and dropped spans."""
+        with self._lock:
+            return {
+                "queue_depth": len(self._queue),
+                "spilled_spans": self.spill.records if self.spill else 0,
+                "spill_bytes": self.spill.used_bytes if self.spill else 0,
+                "exported_spans": self.exported_spans,
+                "dropped_spans": self.dropped_spans,
+            }
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        """Export the queued and spilled spans, waiting at most `timeout_millis`."""
+        with self._condition:
+            self._flush_requested = True
+            self._export_idle.clear()
+            self._condition.notify()
+        return self._export_idle.wait(timeout_millis / 1000)
+
+    def shutdown(self) -> None:
+        """Export what can be exported in time, keep the rest on disk and stop."""
+        if self._shutdown:
+            return
+        self.force_flush(self.shutdown_timeout_millis)
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify()
+        # The last export may hang on the backend, the remaining spans are
+        # then spilled by the worker when it returns
+        self._worker.join(self.shutdown_timeout_millis / 1000 + _SHUTDOWN_GRACE_SECONDS)
+        if self._worker.is_alive():
+            logging.warning("Span export still running after shutdown timeout")
+            return
+        if self.spill is not None:
+            self.spill.close()
+        self.exporter.shutdown()
@@ -0,0 +1,74 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from opentelemetry import metrics
+from opentelemetry.metrics import MeterProvider
+
+SINK_CLOUD_LOGGING = "cloud_logging"
+SINK_CLOUD_TRACE = "cloud_trace"
+SINK_GCS = "gcs"
+
+
+class ExporterMetrics:
+    """
+    Self-telemetry of `CloudTraceLoggingSpanExporter`, as OpenTelemetry metrics.
+
+    Instruments are created from `meter_provider`, or from the global meter
+    provider (a no-op until one is configured).
+    """
+
+    def __init__(self, meter_provider: Optional[MeterProvider] = None) -> None:
+        """
+        Create the instruments.
+
+        :param meter_provider: Meter provider receiving the metrics
+        """
+        meter = metrics.get_meter(__name__, meter_provider=meter_provider)
+        self.export_duration = meter.create_histogram(
+            "span_exporter.export.duration",
+            unit="s",
+            description="Duration of an export to a sink, per batch",
+        )
+        self.batch_spans = meter.create_histogram(
+            "span_exporter.batch.spans",
+            unit="{span}",
+            description="Number of spans per exported batch",
+        )
+        self.span_bytes = meter.create_histogram(
+            "span_exporter.span.encoded_bytes",
+            unit="By",
+            description="Encoded size of a span log entry",
+        )
+        self.offloads = meter.create_counter(
+            "span_exporter.offload.count",
+            unit="{payload}",
+            description="Span payloads offloaded to GCS",
+        )
+        self.offload_bytes = meter.create_counter(
+            "span_exporter.offload.bytes",
+            unit="By",
+            description="Uncompressed size of the span payloads offloaded to GCS",
+        )
+        self.upload_duration = meter.create_histogram(
+            "span_exporter.gcs_upload.duration",
+            unit="s",
+            description="Duration of a span payload upload to GCS",
+        )
+        self.failures = meter.create_counter(
+            "span_exporter.failures",
+            unit="{failure}",
+            description="Failed exports to a sink",
+        )
+
+    @contextmanager
+    def time_export(self, sink: str) -> Iterator[None]:
+        """Record the duration of the enclosed export, and its failure."""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.failures.add(1, {"sink": sink})
+            raise
+        finally:
+            self.export_duration.record(time.perf_counter() - started, {"sink": sink})
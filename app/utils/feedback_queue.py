@@ -0,0 +1,152 @@
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Sequence
+
+
+class FeedbackQueue:
+    """
+    Writes feedback entries in bulk from a background thread.
+
+    Entries are acknowledged as soon as they are queued. They are written by
+    `write` in batches, when `max_batch_size` entries are queued or at the
+    latest every `flush_interval_seconds`. Failed writes are retried with
+    exponential backoff; entries are only dropped when the queue is full.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[List[Dict[str, Any]]], None],
+        max_batch_size: int = 100,
+        flush_interval_seconds: float = 1.0,
+        max_queue_size: int = 10000,
+        max_backoff_seconds: float = 30.0,
+        shutdown_timeout_seconds: float = 10.0,
+    ) -> None:
+        """
+        Initialize the queue and start its flusher thread.
+
+        :param write: Function writing a batch of entries, raising on failure
+        :param max_batch_size: Maximum number of entries per write
+        :param flush_interval_seconds: Maximum delay before a queued entry is written
+        :param max_queue_size: Maximum number of entries waiting to be written
+        :param max_backoff_seconds: Maximum delay between failed writes
+        :param shutdown_timeout_seconds: Time given to write the remaining
+            entries on shutdown
+        """
+        self.write = write
+        self.max_batch_size = max_batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_queue_size = max_queue_size
+        self.max_backoff_seconds = max_backoff_seconds
+        self.shutdown_timeout_seconds = shutdown_timeout_seconds
+        self.written_entries = 0
+        self.dropped_entries = 0
+
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._flush_requested = False
+        self._idle = threading.Event()
+        self._shutdown = False
+        self._worker = threading.Thread(
+            target=self._run, name="feedback-flusher", daemon=True
+        )
+        self._worker.start()
+
+    def put(self, entries: Sequence[Dict[str, Any]]) -> int:
+        """
+        Queue entries for writing.
+
+        :param entries: The entries to write
+        :return: The number of entries queued, the others were dropped
+        """
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Feedback queue is shut down")
+            queued = min(len(entries), self.max_queue_size - len(self._queue))
+            self._queue.extend(entries[:queued])
+            self.dropped_entries += len(entries) - queued
+            if len(self._queue) >= self.max_batch_size:
+                self._condition.notify()
+        if queued < len(entries):
+            logging.error(
+                "Feedback queue full, dropped %d entries", len(entries) - queued
+            )
+        return queued
+
+    def _run(self) -> None:
+        backoff = 0.0
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._shutdown
+                    or (
+                        not backoff
+                        and (
+                            self._flush_requested
+                            or len(self._queue) >= self.max_batch_size
+                        )
+                    ),
+                    timeout=backoff or self.flush_interval_seconds,
+                )
+                if not self._queue:
+                    self._flush_requested = False
+                    self._idle.set()
+                    if self._shutdown:
+                        return
+                    continue
+                if self._shutdown and backoff:
+                    # Give up on a backend still failing
+                    self.dropped_entries += len(self._queue)
+                    logging.error(
+                        "Dropped %d feedback entries on shutdown", len(self._queue)
+                    )
+                    self._queue.clear()
+                    continue
+                batch = [
+                    self._queue.popleft()
+                    for _ in range(min(len(self._queue), self.max_batch_size))
+                ]
+
+            try:
+                self.write(batch)
+            except Exception as e:
+                logging.error("Failed to write feedback: %s", e)
+                with self._lock:
+                    # Retried first, unless newer entries filled the queue
+                    kept = batch[: self.max_queue_size - len(self._queue)]
+                    self._queue.extendleft(reversed(kept))
+                    self.dropped_entries += len(batch) - len(kept)
+                backoff = min(max(backoff * 2, 0.5), self.max_backoff_seconds)
+            else:
+                backoff = 0.0
+                with self._lock:
+                    self.written_entries += len(batch)
+
+    def stats(self) -> Dict[str, int]:
+        """Queue depth, written and dropped entries."""
+        with self._lock:
+            return {
+                "queue_depth": len(self._queue),
+                "written_entries": self.written_entries,
+                "dropped_entries": self.dropped_entries,
+            }
+
+    def flush(self, timeout_seconds: float = 30.0) -> bool:
+        """Write the queued entries, waiting at most `timeout_seconds`."""
+        with self._condition:
+            self._flush_requested = True
+            self._idle.clear()
+            self._condition.notify()
+        return self._idle.wait(timeout_seconds)
+
+    def shutdown(self) -> None:
+        """Write the remaining entries, within `shutdown_timeout_seconds`, and stop."""
+        if self._shutdown:
+            return
+        self.flush(self.shutdown_timeout_seconds)
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify()
+        self._worker.join()
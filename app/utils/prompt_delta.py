@@ -0,0 +1,199 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Mapping, MutableMapping, Optional, Tuple
+
+SESSION_ID_ATTRIBUTE = "traceloop.association.properties.session_id"
+# Attributes holding prompts, which repeat the conversation history
+DELTA_KEY_PREFIXES = ("gen_ai.prompt.", "llm.prompts.", "traceloop.entity.input")
+# Set next to a delta-encoded attribute: "<base span ID>:<shared prefix length>"
+DELTA_BASE_SUFFIX = ".delta_base"
+
+
+def common_prefix_length(a: str, b: str) -> int:
+    """
+    Length of the longest common prefix of two strings.
+
+    Binary search over slice comparisons, which run at C speed.
+
+    :param a: The first string
+    :param b: The second string
+    :return: The number of leading characters shared by both strings
+    """
+    low, high = 0, min(len(a), len(b))
+    if a[:high] == b[:high]:
+        return high
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class PromptDeltaEncoder:
+    """
+    Replaces prompt attributes extending a previously exported prompt by a delta.
+
+    Within a session (or a trace, for requests without session), each LLM call
+    sends the previous history again. When a prompt attribute shares a prefix
+    of at least `min_prefix_chars` with the same attribute of the previous
+    span, only the new suffix is kept, and `<key>.delta_base` references the
+    base span and the length of the shared prefix (see `restore_attributes`).
+
+    A full copy is written every `max_chain` deltas to bound the work of
+    restoring a value. Memory is bounded to the last prompts of
+    `max_sessions` sessions.
+    """
+
+    def __init__(
+        self,
+        min_prefix_chars: int = 1024,
+        max_chain: int = 16,
+        max_sessions: int = 256,
+        key_prefixes: Tuple[str, ...] = DELTA_KEY_PREFIXES,
+    ) -> None:
+        """
+        Initialize the encoder.
+
+        :param min_prefix_chars: Shortest shared prefix worth replacing
+        :param max_chain: Maximum number of consecutive deltas of an attribute
+        :param max_sessions: Number of sessions whose last prompts are kept
+        :param key_prefixes: Prefixes of the attributes to delta-encode
+        """
+        self.min_prefix_chars = min_prefix_chars
+        self.max_chain = max_chain
+        self.max_sessions = max_sessions
+        self.key_prefixes = key_prefixes
+        # Per session and attribute: span ID, full value and chain length
+        self._previous: "OrderedDict[str, Dict[str, Tuple[str, str, int]]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def _scope(self, scope: str) -> Dict[str, Tuple[str, str, int]]:
+        """Return the prompts of a scope, marked as the most recently used."""
+        previous = self._previous.pop(scope, {})
+        self._previous[scope] = previous
+        while len(self._previous) > self.max_sessions:
+            self._previous.popitem(last=False)
+        return previous
+
+    def encode(
+        self,
+        attributes: MutableMapping[str, Any],
+        span_id: str,
+        trace_id: str,
+        pending: Optional[Dict[str, Dict[str, Tuple[str, str, int]]]] = None,
+    ) -> MutableMapping[str, Any]:
+        """
+        Delta-encode the prompt attributes of a span, in place.
+
+        A span is never encoded against itself, e.g. when exported again.
+
+        :param attributes: The span attributes
+        :param span_id: The ID of the span, referenced by later spans
+        :param trace_id: The trace ID, scoping requests without a session
+        :param pending: Collects the prompts of the span instead of remembering
+            them as bases right away, see `commit`
+        :return: The updated attributes
+        """
+        session_id = attributes.get(SESSION_ID_ATTRIBUTE)
+        scope = session_id if session_id not in (None, "None") else trace_id
+        with self._lock:
+            committed = self._scope(scope)
+            latest = committed if pending is None else pending.setdefault(scope, {})
+
+            for key in list(attributes):
+                value = attributes[key]
+                if (
+                    not isinstance(value, str)
+                    or len(value) < self.min_prefix_chars
+                    or not key.startswith(self.key_prefixes)
+                ):
+                    continue
+                base = latest.get(key) or committed.get(key)
+                latest[key] = (span_id, value, 0)
+                if base is None or base[0] == span_id or base[2] >= self.max_chain:
+                    continue
+                base_span_id, base_value, chain = base
+                prefix_length = common_prefix_length(base_value, value)
+                if prefix_length < self.min_prefix_chars:
+                    continue
+                attributes[key] = value[prefix_length:]
+                attributes[key + DELTA_BASE_SUFFIX] = f"{base_span_id}:{prefix_length}"
+                latest[key] = (span_id, value, chain + 1)
+        return attributes
+
+    def commit(self, pending: Dict[str, Dict[str, Tuple[str, str, int]]]) -> None:
+        """
+        Remember the prompts collected by `encode` as bases of later spans.
+
+        Called once the spans are written, so deltas never reference a span
+        whose log entry is missing.
+
+        :param pending: The prompts collected by `encode`
+        """
+        with self._lock:
+            for scope, prompts in pending.items():
+                self._scope(scope).update(prompts)
+
+
+def _load_offloaded(
+    attributes: Mapping[str, Any],
+    load_payload: Optional[Callable[[str], Mapping[str, Any]]],
+) -> Dict[str, Any]:
+    """Put back the attributes a log entry stored in GCS, see `read_payload`."""
+    if "uri_payload" not in attributes:
+        return dict(attributes)
+    if load_payload is None:
+        # Imported here, the exporter depends on this module
+        from app.utils.tracing import read_payload
+
+        load_payload = read_payload
+    loaded = {
+        k: v for k, v in attributes.items() if k not in ("uri_payload", "url_payload")
+    }
+    loaded.update(load_payload(attributes["uri_payload"]))
+    return loaded
+
+
+def restore_attributes(
+    attributes: Mapping[str, Any],
+    load_attributes: Callable[[str], Optional[Mapping[str, Any]]],
+    load_payload: Optional[Callable[[str], Mapping[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """
+    Restore the delta-encoded attributes of a span exported with `PromptDeltaEncoder`.
+
+    Attributes the exporter stored in GCS, of the span or of its base spans,
+    are read back first.
+
+    :param attributes: The attributes of the span log entry
+    :param load_attributes: Function returning the attributes of the log entry
+        of a span ID, e.g. querying Cloud Logging for ``jsonPayload.span_id``
+    :param load_payload: Function returning the attributes stored at a
+        `uri_payload`, `read_payload` with a default client when not provided
+    :return: The attributes with their full values
+    """
+    restored = _load_offloaded(attributes, load_payload)
+    for key in list(restored):
+        if not key.endswith(DELTA_BASE_SUFFIX):
+            continue
+        base_span_id, prefix_length = restored.pop(key).rsplit(":", 1)
+        value_key = key[: -len(DELTA_BASE_SUFFIX)]
+        base_attributes = load_attributes(base_span_id)
+        if base_attributes is None:
+            raise KeyError(f"Span {base_span_id} referenced by {value_key} not found")
+        base_attributes = _load_offloaded(base_attributes, load_payload)
+        base_value = restore_attributes(
+            {
+                k: v
+                for k, v in base_attributes.items()
+                if k in (value_key, value_key + DELTA_BASE_SUFFIX)
+            },
+            load_attributes,
+            load_payload,
+        )[value_key]
+        restored[value_key] = base_value[: int(prefix_length)] + restored[value_key]
+    return restored
@@ -0,0 +1,208 @@
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.trace import StatusCode
+
+RUN_ID_ATTRIBUTE = "traceloop.association.properties.run_id"
+_TRACE_ID_MASK = (1 << 64) - 1
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """
+    Buffers spans per trace and decides whether to export the trace when it ends.
+
+    A trace ends when its local root span ends. It is kept when one of its
+    spans failed, when it is slower than the `latency_percentile` of recent
+    traces, or when feedback was registered for its run ID; other traces are
+    kept with probability `sample_rate`, decided from the trace ID.
+
+    Dropped traces are held in a small buffer so that feedback arriving
+    shortly after the response still exports them. Spans ending after the
+    decision follow it. Memory is bounded by `max_traces` buffered traces of at
+    most `max_spans_per_trace` spans each, plus `max_dropped_traces`.
+    """
+
+    def __init__(
+        self,
+        next_processor: SpanProcessor,
+        sample_rate: float = 0.1,
+        latency_percentile: float = 0.95,
+        min_latency_samples: int = 100,
+        latency_window: int = 1000,
+        max_traces: int = 1024,
+        max_spans_per_trace: int = 512,
+        max_dropped_traces: int = 256,
+    ) -> None:
+        """
+        Initialize the processor.
+
+        :param next_processor: Processor receiving the spans of kept traces,
+            usually a batch processor feeding the exporter
+        :param sample_rate: Fraction of the uneventful traces that are kept
+        :param latency_percentile: Traces slower than this percentile of the
+            recent trace durations are kept
+        :param min_latency_samples: Number of traces observed before slow
+            traces are detected
+        :param latency_window: Number of recent trace durations considered
+        :param max_traces: Maximum number of traces buffered while in progress,
+            the oldest is decided early when exceeded
+        :param max_spans_per_trace: Maximum number of spans buffered per trace,
+            the trace is decided early when exceeded
+        :param max_dropped_traces: Number of dropped traces kept in case
+            feedback is registered for them
+        """
+        self.next_processor = next_processor
+        self.sample_rate = sample_rate
+        self.latency_percentile = latency_percentile
+        self.min_latency_samples = min_latency_samples
+        self.max_traces = max_traces
+        self.max_spans_per_trace = max_spans_per_trace
+        self.max_dropped_traces = max_dropped_traces
+        self.kept_traces = 0
+        self.dropped_traces = 0
+
+        self._traces: "OrderedDict[int, List[ReadableSpan]]" = OrderedDict()
+        # Decisions of recent traces, for spans ending after their root
+        self._decisions: "OrderedDict[int, bool]" = OrderedDict()
+        self._dropped: "OrderedDict[str, List[ReadableSpan]]" = OrderedDict()
+        self._feedback_run_ids: "OrderedDict[str, None]" = OrderedDict()
+        self._durations: Deque[int] = deque(maxlen=latency_window)
+        self._latency_threshold: Optional[int] = None
+        self._recorded = 0
+        self._lock = threading.Lock()
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        self.next_processor.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        trace_id = span.context.trace_id
+        is_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            decision = self._decisions.get(trace_id)
+            if decision is not None:
+                if decision:
+                    self._export([span])
+                return
+
+            spans = self._traces.setdefault(trace_id, [])
+            spans.append(span)
+            if is_root or len(spans) >= self.max_spans_per_trace:
+                self._decide(trace_id, complete=is_root)
+            while len(self._traces) > self.max_traces:
+                self._decide(next(iter(self._traces)))
+
+    def keep_run(self, run_id: str) -> None:
+        """
+        Keep the trace of a run, e.g. because feedback was registered for it.
+
+        :param run_id: The run ID set as tracing association property
+        """
+        with self._lock:
+            spans = self._dropped.pop(run_id, None)
+            if spans is not None:
+                self._decisions[spans[0].context.trace_id] = True
+                self.dropped_traces -= 1
+                self.kept_traces += 1
+                self._export(spans)
+                return
+            self._feedback_run_ids[run_id] = None
+            while len(self._feedback_run_ids) > self.max_traces:
+                self._feedback_run_ids.popitem(last=False)
+
+    def _trace_duration(self, spans: List[ReadableSpan]) -> Optional[int]:
+        starts = [span.start_time for span in spans if span.start_time is not None]
+        ends = [span.end_time for span in spans if span.end_time is not None]
+        if not starts or not ends:
+            return None
+        return max(ends) - min(starts)
+
+    def _record_duration(self, duration: int) -> None:
+        self._durations.append(duration)
+        self._recorded += 1
+        # Refresh the threshold regularly rather than sorting on every trace
+        if len(self._durations) >= self.min_latency_samples and (
+            self._latency_threshold is None or self._recorded % 50 == 0
+        ):
+            durations = sorted(self._durations)
+            self._latency_threshold = durations[
+                min(int(len(durations) * self.latency_percentile), len(durations) - 1)
+            ]
+
+    def _should_keep(self, spans: List[ReadableSpan], duration: Optional[int]) -> bool:
+        for span in spans:
+            if span.status.status_code == StatusCode.ERROR:
+                return True
+            if (span.attributes or {}).get(RUN_ID_ATTRIBUTE) in self._feedback_run_ids:
+                return True
+        if (
+            self._latency_threshold is not None
+            and duration is not None
+            and duration > self._latency_threshold
+        ):
+            return True
+        # Same decision for a trace ID across processes, as TraceIdRatioBased
+        trace_id = spans[0].context.trace_id
+        return (trace_id & _TRACE_ID_MASK) < self.sample_rate * (_TRACE_ID_MASK + 1)
+
+    def _decide(self, trace_id: int, complete: bool = False) -> None:
+        spans = self._traces.pop(trace_id)
+        duration = self._trace_duration(spans)
+        keep = self._should_keep(spans, duration)
+        if complete and duration is not None:
+            self._record_duration(duration)
+        self._decisions[trace_id] = keep
+        while len(self._decisions) > self.max_traces:
+            self._decisions.popitem(last=False)
+
+        if keep:
+            self.kept_traces += 1
+            self._export(spans)
+            return
+        self.dropped_traces += 1
+        run_id = next(
+            (
+                span.attributes[RUN_ID_ATTRIBUTE]
+                for span in spans
+                if span.attributes and RUN_ID_ATTRIBUTE in span.attributes
+            ),
+            None,
+        )
+        # Requests without a run ID have the "None" run ID
+        if (
+            isinstance(run_id, str)
+            and run_id != "None"
+            and self.max_dropped_traces > 0
+        ):
+            self._dropped[run_id] = spans
+            while len(self._dropped) > self.max_dropped_traces:
+                self._dropped.popitem(last=False)
+
+    def _export(self, spans: List[ReadableSpan]) -> None:
+        for span in spans:
+            try:
+                self.next_processor.on_end(span)
+            except Exception as e:
+                logging.error("Failed to process span: %s", e)
+
+    def shutdown(self) -> None:
+        """Decide the traces still buffered, then shut the next processor down."""
+        with self._lock:
+            while self._traces:
+                self._decide(next(iter(self._traces)))
+        self.next_processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.next_processor.force_flush(timeout_millis)
+
+    def stats(self) -> Dict[str, int]:
+        """Number of kept, dropped and buffered traces."""
+        with self._lock:
+            return {
+                "kept_traces": self.kept_traces,
+                "dropped_traces": self.dropped_traces,
+                "buffered_traces": len(self._traces),
+            }
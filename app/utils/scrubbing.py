@@ -0,0 +1,110 @@
+import base64
+import binascii
+import hashlib
+import re
+from typing import Any, MutableMapping, Optional
+
+# Shortest base64 payload worth replacing
+MIN_BASE64_CHARS = 256
+
+_DATA_URL = re.compile(
+    r"data:(?P<mime>[\w.+-]+/[\w.+-]+);base64,(?P<data>[A-Za-z0-9+/]+={0,2})"
+)
+# "data" fields of content parts, also when the JSON is escaped in a string
+_DATA_FIELD = re.compile(
+    r"(?P<key>\\*[\"']data\\*[\"']\s*:\s*\\*[\"'])"
+    r"(?P<data>[A-Za-z0-9+/]{%d,}={0,2})(?=\\*[\"'])" % MIN_BASE64_CHARS
+)
+_MIME_FIELD = re.compile(
+    r"\\*[\"']mime_type\\*[\"']\s*:\s*\\*[\"'](?P<mime>[\w.+-]+/[\w.+-]+)"
+)
+# Window searched for the MIME type of a "data" field, around the field
+_MIME_WINDOW = 512
+
+_MAGIC_NUMBERS = (
+    (b"\x89PNG", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+    (b"%PDF", "application/pdf"),
+    (b"ID3", "audio/mpeg"),
+)
+
+
+def _sniff_mime_type(data: bytes) -> str:
+    for magic, mime_type in _MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return mime_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:8] == b"ftyp":
+        return "video/mp4"
+    return "application/octet-stream"
+
+
+def describe_base64(data: str, mime_type: Optional[str] = None) -> Optional[str]:
+    """
+    Short description of a base64 payload: MIME type, size and digest.
+
+    :param data: The base64 payload
+    :param mime_type: The MIME type, sniffed from the content when not provided
+    :return: The description, or None if `data` is not valid base64
+    """
+    try:
+        decoded = base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    digest = hashlib.sha256(decoded).hexdigest()[:16]
+    mime_type = mime_type or _sniff_mime_type(decoded)
+    return f"[{mime_type}, {len(decoded)} bytes, sha256:{digest}]"
+
+
+def scrub_base64(value: str, min_chars: int = MIN_BASE64_CHARS) -> str:
+    """
+    Replace the base64 blobs of a string by a short description.
+
+    Handles ``data:`` URLs and the ``data`` fields of content parts, as built by
+    the frontend for inline images and documents.
+
+    :param value: The string to scrub
+    :param min_chars: Shortest base64 payload to replace
+    :return: The scrubbed string
+    """
+    if "base64," in value:
+
+        def replace_url(match: "re.Match[str]") -> str:
+            if len(match["data"]) < min_chars:
+                return match[0]
+            return describe_base64(match["data"], match["mime"]) or match[0]
+
+        value = _DATA_URL.sub(replace_url, value)
+
+    if "data" in value:
+
+        def replace_field(match: "re.Match[str]") -> str:
+            if len(match["data"]) < min_chars:
+                return match[0]
+            window = value[
+                max(match.start() - _MIME_WINDOW, 0) : match.end() + _MIME_WINDOW
+            ]
+            mime = _MIME_FIELD.search(window)
+            description = describe_base64(match["data"], mime["mime"] if mime else None)
+            return match["key"] + description if description else match[0]
+
+        value = _DATA_FIELD.sub(replace_field, value)
+    return value
+
+
+def scrub_attributes(
+    attributes: MutableMapping[str, Any], min_chars: int = MIN_BASE64_CHARS
+) -> MutableMapping[str, Any]:
+    """
+    Replace base64 blobs in string attributes by a short description, in place.
+
+    :param attributes: The span attributes
+    :param min_chars: Shortest base64 payload to replace
+    :return: The updated attributes
+    """
+    for key, value in attributes.items():
+        if isinstance(value, str) and len(value) >= min_chars:
+            attributes[key] = scrub_base64(value, min_chars)
+    return attributes
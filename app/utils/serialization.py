@@ -0,0 +1,80 @@
+import sys
+from typing import Any, Dict, IO, Optional
+
+import orjson
+from langchain.load import dump as langchain_load_dump
+from langchain_core.messages import BaseMessage
+
+from app.utils.context import CONTEXT_WINDOW_KEY
+
+# Metadata keys forwarded to clients. Everything else LangGraph attaches
+# (checkpoint namespaces, triggers, model settings, ...) is dropped from the wire.
+METADATA_KEYS = ("langgraph_node", "langgraph_step")
+
+
+def encode_message(message: BaseMessage) -> Dict[str, Any]:
+    """
+    Encode a message into the compact wire shape.
+
+    Only fields that carry information are emitted, e.g.
+    ``{"type": "AIMessageChunk", "id": "run-1", "content": "Hel"}``.
+
+    :param message: The message (usually an `AIMessageChunk` or `ToolMessage`)
+    :return: A JSON-serializable dictionary
+    """
+    encoded: Dict[str, Any] = {"type": message.type, "content": message.content}
+    if message.id:
+        encoded["id"] = message.id
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        encoded["tool_calls"] = tool_calls
+    usage_metadata = getattr(message, "usage_metadata", None)
+    if usage_metadata:
+        encoded["usage_metadata"] = usage_metadata
+    context_window = message.response_metadata.get(CONTEXT_WINDOW_KEY)
+    if context_window:
+        encoded[CONTEXT_WINDOW_KEY] = context_window
+    tool_call_id = getattr(message, "tool_call_id", None)
+    if tool_call_id:
+        encoded["tool_call_id"] = tool_call_id
+        encoded["name"] = message.name
+        encoded["status"] = getattr(message, "status", "success")
+    return encoded
+
+
+def encode_chunk(chunk: Any) -> Any:
+    """
+    Encode a chunk produced by ``stream(..., stream_mode="messages")``.
+
+    `(message, metadata)` tuples are encoded as ``[message, metadata]`` with the
+    metadata reduced to `METADATA_KEYS`. Anything else falls back to the generic
+    LangChain serializer.
+
+    :param chunk: The streamed chunk
+    :return: A JSON-serializable representation of the chunk
+    """
+    if isinstance(chunk, tuple) and len(chunk) == 2:
+        message, metadata = chunk
+        if isinstance(message, BaseMessage):
+            return [
+                encode_message(message),
+                {k: metadata[k] for k in METADATA_KEYS if k in metadata},
+            ]
+    return langchain_load_dump.dumpd(chunk)
+
+
+def dumps_chunk(encoded_chunk: Any) -> bytes:
+    """Serialize an encoded chunk to a single JSON line."""
+    return orjson.dumps(encoded_chunk, option=orjson.OPT_APPEND_NEWLINE)
+
+
+class DebugSink:
+    """Writes encoded chunks as JSON lines to a stream (stdout by default)."""
+
+    def __init__(self, stream: Optional[IO[bytes]] = None) -> None:
+        self.stream = stream
+
+    def write(self, encoded_chunk: Any) -> None:
+        """Write one encoded chunk to the sink."""
+        stream = self.stream or sys.stdout.buffer
+        stream.write(dumps_chunk(encoded_chunk))
@@ -0,0 +1,119 @@
+from typing import Any, Dict, Mapping, Optional
+
+import orjson
+from opentelemetry import trace as trace_api
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.util import ns_to_iso_str
+from opentelemetry.trace import SpanContext
+
+
+def _to_json_value(value: Any) -> Any:
+    """Attribute values are primitives or sequences of primitives."""
+    if isinstance(value, (tuple, list)):
+        return list(value)
+    return value
+
+
+def _format_attributes(attributes: Optional[Mapping[str, Any]]) -> Dict[str, Any]:
+    if not attributes:
+        return {}
+    return {key: _to_json_value(value) for key, value in attributes.items()}
+
+
+def _format_context(context: SpanContext) -> Dict[str, str]:
+    return {
+        "trace_id": f"0x{trace_api.format_trace_id(context.trace_id)}",
+        "span_id": f"0x{trace_api.format_span_id(context.span_id)}",
+        "trace_state": repr(context.trace_state),
+    }
+
+
+def encode_attributes(attributes: Mapping[str, Any]) -> Dict[str, bytes]:
+    """
+    JSON-encode each attribute value once.
+
+    :param attributes: The span attributes
+    :return: The encoded value of each attribute
+    """
+    return {key: orjson.dumps(value) for key, value in attributes.items()}
+
+
+def encoded_size(encoded_attributes: Mapping[str, bytes]) -> int:
+    """Size in bytes of the JSON object made of the encoded attributes."""
+    # '{' and '}', then '"key":value' per attribute separated by ','
+    size = 2 + max(len(encoded_attributes) - 1, 0)
+    for key, value in encoded_attributes.items():
+        size += len(key.encode()) + 3 + len(value)
+    return size
+
+
+def join_encoded(encoded_attributes: Mapping[str, bytes]) -> bytes:
+    """Assemble encoded attributes into a JSON object without re-encoding values."""
+    return (
+        b"{"
+        + b",".join(
+            orjson.dumps(key) + b":" + value for key, value in encoded_attributes.items()
+        )
+        + b"}"
+    )
+
+
+def span_to_dict(span: ReadableSpan) -> Dict[str, Any]:
+    """
+    Convert a span to a log entry dictionary, reading the span fields directly.
+
+    The dictionary has the shape of ``json.loads(span.to_json())``.
+
+    :param span: The span to convert
+    :return: The span dictionary
+    """
+    status = {"status_code": str(span.status.status_code.name)}
+    if span.status.description:
+        status["description"] = span.status.description
+
+    return {
+        "name": span.name,
+        "context": _format_context(span.context) if span.context else None,
+        "kind": str(span.kind),
+        "parent_id": (
+            f"0x{trace_api.format_span_id(span.parent.span_id)}"
+            if span.parent is not None
+            else None
+        ),
+        "start_time": ns_to_iso_str(span.start_time) if span.start_time else None,
+        "end_time": ns_to_iso_str(span.end_time) if span.end_time else None,
+        "status": status,
+        "attributes": _format_attributes(span.attributes),
+        "events": [
+            {
+                "name": event.name,
+                "timestamp": ns_to_iso_str(event.timestamp),
+                "attributes": _format_attributes(event.attributes),
+            }
+            for event in span.events
+        ],
+        "links": [
+            {
+                "context": _format_context(link.context),
+                "attributes": _format_attributes(link.attributes),
+            }
+            for link in span.links
+        ],
+        "resource": {
+            "attributes": _format_attributes(span.resource.attributes),
+            "schema_url": span.resource.schema_url,
+        },
+    }
+
+
+def entry_size(span_dict: Mapping[str, Any], attributes_size: int) -> int:
+    """
+    Size in bytes of a span log entry, given the size of its attributes.
+
+    :param span_dict: The span dictionary
+    :param attributes_size: The encoded size of ``span_dict["attributes"]``
+    :return: The encoded size of the entry
+    """
+    others = {key: value for key, value in span_dict.items() if key != "attributes"}
+    # '"attributes":' and the ',' separating it from the other fields
+    return attributes_size + len(orjson.dumps(others)) + 14
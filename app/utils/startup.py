@@ -0,0 +1,66 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+
+class StartupProfiler:
+    """
+    Records how long each initialization phase takes.
+
+    Phases may run concurrently. The total is the wall-clock time from the
+    profiler creation to the report, which is what delays the first request.
+    """
+
+    def __init__(self, target_seconds: Optional[float] = None) -> None:
+        """
+        Initialize the profiler.
+
+        :param target_seconds: Time to first request the startup should stay under
+        """
+        self.target_seconds = target_seconds
+        self.phases: Dict[str, float] = {}
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as phase `name`."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] = time.perf_counter() - started
+
+    def report(self) -> Dict[str, Any]:
+        """Return the per-phase durations, the total and whether the target was met."""
+        total = time.perf_counter() - self._started
+        report: Dict[str, Any] = {
+            "phases": dict(self.phases),
+            "total_seconds": total,
+        }
+        if self.target_seconds is not None:
+            report["target_seconds"] = self.target_seconds
+            report["within_target"] = total <= self.target_seconds
+        return report
+
+    def log(self) -> Dict[str, Any]:
+        """Log the report, warning when the target is exceeded, and return it."""
+        report = self.report()
+        phases = ", ".join(
+            f"{name}={seconds:.3f}s" for name, seconds in report["phases"].items()
+        )
+        if report.get("within_target", True):
+            logging.info(
+                "Startup took %.3fs (%s)", report["total_seconds"], phases
+            )
+        else:
+            logging.warning(
+                "Startup took %.3fs, above the %.1fs target (%s)",
+                report["total_seconds"],
+                self.target_seconds,
+                phases,
+            )
+        return report
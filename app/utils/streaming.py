@@ -0,0 +1,261 @@
+import asyncio
+import contextvars
+import queue
+import threading
+import time
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Iterator, List, Optional
+
+from langchain_core.messages import AIMessageChunk
+
+# Message id before the first chunk, distinct from the None id of a chunk
+_NO_MESSAGE = object()
+
+
+class ChunkCoalescer:
+    """
+    Merges consecutive content chunks of the same AI message into larger frames.
+
+    The first chunk of every message is emitted immediately so time to first
+    token is unchanged. Following content chunks are buffered until the window
+    is exceeded (either `max_delay_ms` since the first buffered chunk or
+    `max_bytes` of buffered content), the message id changes, or a tool call
+    or tool result arrives. `coalesce_chunks` and `acoalesce_chunks` also flush
+    the buffer when the time window elapses while the model pauses, so content
+    is never held longer than `max_delay_ms`.
+    """
+
+    def __init__(self, max_delay_ms: float = 50.0, max_bytes: int = 1024) -> None:
+        """
+        Initialize the coalescer.
+
+        :param max_delay_ms: Maximum age of buffered content, 0 disables coalescing
+        :param max_bytes: Maximum size in bytes of buffered content
+        """
+        self.max_delay = max_delay_ms / 1000
+        self.max_bytes = max_bytes
+        self._buffer: List[Any] = []
+        self._buffer_bytes = 0
+        self._buffer_started = 0.0
+        self._last_message_id: Any = _NO_MESSAGE
+
+    @property
+    def enabled(self) -> bool:
+        """Whether chunks are coalesced at all."""
+        return self.max_delay > 0 and self.max_bytes > 0
+
+    def add(self, chunk: Any) -> List[Any]:
+        """
+        Add a `(message, metadata)` chunk.
+
+        :param chunk: The chunk produced by ``stream(..., stream_mode="messages")``
+        :return: The chunks ready to be emitted, in order
+        """
+        if not self.enabled:
+            return [chunk]
+        message = chunk[0] if isinstance(chunk, tuple) else None
+        if (
+            not isinstance(message, AIMessageChunk)
+            or message.tool_call_chunks
+            or message.tool_calls
+        ):
+            return self.flush() + [chunk]
+
+        ready = []
+        if self._buffer and message.id != self._buffer[0][0].id:
+            ready = self.flush()
+        if message.id != self._last_message_id:
+            self._last_message_id = message.id
+            return ready + [chunk]
+
+        if not self._buffer:
+            self._buffer_started = time.monotonic()
+        self._buffer.append(chunk)
+        if isinstance(message.content, str):
+            self._buffer_bytes += len(message.content.encode("utf-8"))
+        if (
+            self._buffer_bytes >= self.max_bytes
+            or time.monotonic() - self._buffer_started >= self.max_delay
+        ):
+            ready += self.flush()
+        return ready
+
+    def seconds_until_flush(self) -> Optional[float]:
+        """Time left before the buffered content is due, None if nothing is buffered."""
+        if not self._buffer:
+            return None
+        return max(self._buffer_started + self.max_delay - time.monotonic(), 0.0)
+
+    def flush(self) -> List[Any]:
+        """Emit the buffered content as a single merged chunk."""
+        if not self._buffer:
+            return []
+        first_message, metadata = self._buffer[0]
+        others = [message for message, _ in self._buffer[1:]]
+        merged = first_message + others if others else first_message
+        self._buffer = []
+        self._buffer_bytes = 0
+        return [(merged, metadata)]
+
+
+_END = object()
+
+
+class _Failure:
+    """Exception raised by the stream, re-raised to the consumer."""
+
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+def _produce(
+    context: contextvars.Context,
+    iterator: Iterator[Any],
+    items: "queue.Queue[Any]",
+    stopped: threading.Event,
+) -> None:
+    """Read the rest of the stream into `items` until it ends or `stopped` is set."""
+
+    def put(item: Any) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        while True:
+            try:
+                chunk = context.run(next, iterator)
+            except StopIteration:
+                break
+            if not put(chunk):
+                return
+    except BaseException as e:  # pylint: disable=W0718
+        put(_Failure(e))
+        return
+    finally:
+        _close(context, iterator)
+    put(_END)
+
+
+def _close(context: contextvars.Context, iterator: Iterator[Any]) -> None:
+    """Close the stream in the context it was read in."""
+    close = getattr(iterator, "close", None)
+    if close is not None:
+        context.run(close)
+
+
+def coalesce_chunks(chunks: Iterable[Any], coalescer: ChunkCoalescer) -> Iterator[Any]:
+    """
+    Coalesce a stream of `(message, metadata)` chunks.
+
+    Every step of the stream runs in one copy of the caller's context. Chunks
+    are read in the caller's thread while nothing is buffered, so streams that
+    never buffer content do not start a thread. Once content is buffered, the
+    rest of the stream is read on a worker thread so the buffer can be flushed
+    when the time window elapses between two chunks.
+    """
+    if not coalescer.enabled:
+        yield from chunks
+        return
+
+    context = contextvars.copy_context()
+    iterator = context.run(iter, chunks)
+    stopped = threading.Event()
+    handed_over = False
+    try:
+        while coalescer.seconds_until_flush() is None:
+            try:
+                chunk = context.run(next, iterator)
+            except StopIteration:
+                return
+            yield from coalescer.add(chunk)
+
+        items: "queue.Queue[Any]" = queue.Queue(maxsize=64)
+        threading.Thread(
+            target=_produce,
+            args=(context, iterator, items, stopped),
+            name="chunk-coalescer",
+            daemon=True,
+        ).start()
+        handed_over = True
+        while True:
+            try:
+                item = items.get(timeout=coalescer.seconds_until_flush())
+            except queue.Empty:
+                yield from coalescer.flush()
+                continue
+            if item is _END:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield from coalescer.add(item)
+        yield from coalescer.flush()
+    finally:
+        stopped.set()
+        if not handed_over:
+            _close(context, iterator)
+
+
+async def acoalesce_chunks(
+    chunks: AsyncIterable[Any], coalescer: ChunkCoalescer
+) -> AsyncIterator[Any]:
+    """
+    Coalesce an async stream of `(message, metadata)` chunks.
+
+    The stream is read by a single task feeding a queue, so every step of the
+    stream runs in the same context, and the buffer can be flushed when the
+    time window elapses between two chunks. The stream is closed when the
+    consumer stops early.
+    """
+    if not coalescer.enabled:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    items: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=64)
+
+    async def produce() -> None:
+        iterator = chunks.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                await items.put(chunk)
+        except Exception as e:  # pylint: disable=W0718
+            await items.put(_Failure(e))
+            return
+        finally:
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        await items.put(_END)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            try:
+                # Cancelling the queue read leaves the stream untouched
+                item = await asyncio.wait_for(
+                    items.get(), timeout=coalescer.seconds_until_flush()
+                )
+            except asyncio.TimeoutError:
+                for ready in coalescer.flush():
+                    yield ready
+                continue
+            if item is _END:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            for ready in coalescer.add(item):
+                yield ready
+        for ready in coalescer.flush():
+            yield ready
+    finally:
+        producer.cancel()
+        # Waits for the stream to close, without hiding a cancellation of the caller
+        await asyncio.gather(producer, return_exceptions=True)
@@ -0,0 +1,149 @@
+import threading
+from typing import Any, Dict, Mapping, Optional
+
+import orjson
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool, StructuredTool
+from pydantic import BaseModel
+
+from app.utils.cache import InMemoryCacheBackend
+
+
+def make_tool_cache_key(args: Mapping[str, Any]) -> str:
+    """Canonical representation of tool call arguments."""
+    return orjson.dumps(dict(args), option=orjson.OPT_SORT_KEYS, default=str).decode()
+
+
+def _normalize_args(tool: BaseTool, args: Mapping[str, Any]) -> Mapping[str, Any]:
+    """Fills in the defaults of the tool schema, so equivalent calls share a key."""
+    schema = tool.args_schema
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        return schema.model_validate(dict(args)).model_dump()
+    return args
+
+
+class ToolCache:
+    """
+    Memoizes tool results by (tool name, canonical arguments).
+
+    Each wrapped tool gets its own LRU+TTL store so bounds can be set per tool.
+    Tools with side effects should be wrapped with ``enabled=False`` (or not
+    wrapped at all). Failed calls are never cached, ``None`` results are.
+    Tools with ``response_format="content_and_artifact"`` cache both the
+    content and the artifact.
+    """
+
+    def __init__(self, ttl_seconds: float = 300, max_entries: int = 256) -> None:
+        """
+        Initialize the tool cache.
+
+        :param ttl_seconds: Default time to live of a cached result
+        :param max_entries: Default maximum number of cached results per tool
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stores: Dict[str, InMemoryCacheBackend] = {}
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def wrap(
+        self,
+        tool: BaseTool,
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        enabled: bool = True,
+    ) -> BaseTool:
+        """
+        Wrap a tool so repeated calls with the same arguments hit the cache.
+
+        :param tool: The tool to wrap
+        :param ttl_seconds: Time to live of cached results for this tool
+        :param max_entries: Maximum number of cached results for this tool
+        :param enabled: Set to False for non-idempotent tools
+        :return: A tool with the same name, description and schema
+        """
+        if not enabled:
+            return tool
+
+        store = InMemoryCacheBackend(
+            max_entries=self.max_entries if max_entries is None else max_entries,
+            ttl_seconds=self.ttl_seconds if ttl_seconds is None else ttl_seconds,
+        )
+        with self._lock:
+            self.stores[tool.name] = store
+            self.hits[tool.name] = 0
+            self.misses[tool.name] = 0
+        # Errors propagate to the wrapper, which handles them like the tool did
+        inner = tool.model_copy(
+            update={"handle_tool_error": False, "handle_validation_error": False}
+        )
+        with_artifact = tool.response_format == "content_and_artifact"
+        # Tools without a schema take the arguments of their `_run` method
+        args_schema = (
+            tool.get_input_schema() if tool.args_schema is None else tool.args_schema
+        )
+
+        def lookup(kwargs: Mapping[str, Any]) -> Any:
+            """Returns the cache key of a call and its cached result, if any."""
+            key = make_tool_cache_key(_normalize_args(tool, kwargs))
+            # Results are stored in a tuple, so None results are cached too
+            cached = store.get(key)
+            with self._lock:
+                if cached is None:
+                    self.misses[tool.name] += 1
+                else:
+                    self.hits[tool.name] += 1
+            return key, cached
+
+        def tool_input(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+            if not with_artifact:
+                return kwargs
+            # Only tool calls return the artifact
+            return {"type": "tool_call", "name": tool.name, "args": kwargs, "id": ""}
+
+        def output(result: Any) -> Any:
+            if isinstance(result, ToolMessage):
+                return result.content, result.artifact
+            return result
+
+        def run(config: RunnableConfig, **kwargs: Any) -> Any:
+            key, cached = lookup(kwargs)
+            if cached is not None:
+                return cached[0]
+            result = output(inner.invoke(tool_input(kwargs), config))
+            store.set(key, (result,))
+            return result
+
+        async def arun(config: RunnableConfig, **kwargs: Any) -> Any:
+            key, cached = lookup(kwargs)
+            if cached is not None:
+                return cached[0]
+            result = output(await inner.ainvoke(tool_input(kwargs), config))
+            store.set(key, (result,))
+            return result
+
+        return StructuredTool(
+            name=tool.name,
+            description=tool.description,
+            args_schema=args_schema,
+            return_direct=tool.return_direct,
+            response_format=tool.response_format,
+            handle_tool_error=tool.handle_tool_error,
+            handle_validation_error=tool.handle_validation_error,
+            func=run,
+            coroutine=arun,
+        )
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Hit/miss counts and current size per tool."""
+        with self._lock:
+            return {
+                name: {
+                    "hits": self.hits[name],
+                    "misses": self.misses[name],
+                    "size": len(store),
+                }
+                for name, store in self.stores.items()
+            }
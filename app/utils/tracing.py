@@ -1,14 +1,141 @@
 
-import json
+import datetime
+import gzip
+import hashlib
 import logging
-from typing import Any, Optional, Sequence
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
 
+import orjson
+from google.api_core.exceptions import PreconditionFailed
 from google.cloud import logging as google_cloud_logging
 from google.cloud import storage
+from google.cloud.storage.retry import DEFAULT_RETRY
 from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
+from opentelemetry.metrics import MeterProvider
 from opentelemetry.sdk.trace import ReadableSpan
 from opentelemetry.sdk.trace.export import SpanExportResult
 
+from app.utils.cache import InMemoryCacheBackend
+from app.utils.exporter_metrics import (
+    SINK_CLOUD_LOGGING,
+    SINK_CLOUD_TRACE,
+    SINK_GCS,
+    ExporterMetrics,
+)
+from app.utils.prompt_delta import PromptDeltaEncoder
+from app.utils.scrubbing import scrub_attributes
+from app.utils.span_encoding import (
+    encode_attributes,
+    encoded_size,
+    entry_size,
+    join_encoded,
+    span_to_dict,
+)
+
+# Limits of a single Cloud Logging entries.write request (1000 entries, 10 MB),
+# with headroom for the request envelope
+MAX_ENTRIES_PER_WRITE = 1000
+MAX_BYTES_PER_WRITE = 9 * 1024 * 1024
+# Attributes above this size are stored in GCS instead of the log entry
+MAX_ATTRIBUTES_BYTES = 255 * 1024
+# Offloaded attribute values above this size are stored as their own object,
+# shared by the spans carrying the same value (e.g. the system message)
+MIN_SHARED_VALUE_BYTES = 4 * 1024
+# How long a missing bucket is remembered before checking again
+BUCKET_RECHECK_SECONDS = 300
+# Payloads are mostly text, level 6 compresses them nearly as well as 9 for
+# a fraction of the CPU
+GZIP_LEVEL = 6
+PAYLOAD_URL_PREFIX = "https://storage.mtls.cloud.google.com/"
+
+
+def split_entries(
+    entries: Sequence[Tuple[Dict[str, Any], int]],
+    max_entries: int = MAX_ENTRIES_PER_WRITE,
+    max_bytes: int = MAX_BYTES_PER_WRITE,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Split log entries into groups that each fit in one write request.
+
+    :param entries: The entries with their estimated encoded size in bytes
+    :param max_entries: Maximum number of entries per group
+    :param max_bytes: Maximum total size of a group
+    :return: An iterator over the groups, in order
+    """
+    group: List[Dict[str, Any]] = []
+    group_bytes = 0
+    for entry, size in entries:
+        if group and (len(group) >= max_entries or group_bytes + size > max_bytes):
+            yield group
+            group = []
+            group_bytes = 0
+        group.append(entry)
+        group_bytes += size
+    if group:
+        yield group
+
+
+def entry_identity(span_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Insert ID and timestamp of the log entry of a span.
+
+    Both are derived from the span, so the entries written again when a failed
+    export is retried are deduplicated by Cloud Logging.
+
+    :param span_dict: The span dictionary, with its `trace` and `span_id`
+    :return: The `insert_id` and, for ended spans, `timestamp` of the entry
+    """
+    trace_id = span_dict["trace"].rsplit("/", 1)[-1]
+    identity: Dict[str, Any] = {"insert_id": f"{trace_id}-{span_dict['span_id']}"}
+    if span_dict.get("end_time"):
+        identity["timestamp"] = datetime.datetime.fromisoformat(
+            span_dict["end_time"].replace("Z", "+00:00")
+        )
+    return identity
+
+
+def _download(uri: str, storage_client: storage.Client) -> Any:
+    """Download and decode a JSON object stored by the exporter."""
+    path = uri.replace(PAYLOAD_URL_PREFIX, "", 1).replace("gs://", "", 1)
+    bucket_name, _, blob_name = path.partition("/")
+    blob = storage_client.bucket(bucket_name).blob(blob_name)
+    # Raw download skips the server-side decompression
+    content = blob.download_as_bytes(raw_download=True)
+    if content[:2] == b"\x1f\x8b":
+        content = gzip.decompress(content)
+    return orjson.loads(content)
+
+
+def read_payload(
+    uri: str, storage_client: Optional[storage.Client] = None
+) -> Dict[str, Any]:
+    """
+    Read span attributes stored in GCS by the exporter.
+
+    Compressed payloads are decompressed; uncompressed ones, written by
+    earlier versions of the exporter, are read as is. Attribute values stored
+    as their own object are read and put back in place.
+
+    :param uri: The `uri_payload` (gs://) or `url_payload` of a span
+    :param storage_client: Google Cloud Storage client
+    :return: The stored attributes
+    """
+    storage_client = storage_client or storage.Client()
+    attributes = _download(uri, storage_client)
+    # Attribute values are never objects, objects reference a shared value
+    return {
+        key: (
+            _download(value["uri_payload"], storage_client)
+            if isinstance(value, dict)
+            else value
+        )
+        for key, value in attributes.items()
+    }
+
 
 class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
     """
@@ -25,6 +152,12 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
         storage_client: Optional[storage.Client] = None,
         bucket_name: Optional[str] = None,
         debug: bool = False,
+        upload_workers: int = 4,
+        max_pending_uploads: int = 64,
+        uploaded_digests_cache_size: int = 4096,
+        delta_encode_prompts: bool = True,
+        scrub_inline_media: bool = True,
+        meter_provider: Optional[MeterProvider] = None,
         **kwargs: Any,
     ) -> None:
         """
@@ -34,84 +167,291 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
         :param storage_client: Google Cloud Storage client
         :param bucket_name: Name of the GCS bucket to store large payloads
         :param debug: Enable debug mode for additional logging
+        :param upload_workers: Number of threads uploading large payloads to GCS
+        :param max_pending_uploads: Number of uploads that may be in flight before
+            the export waits for one to finish
+        :param uploaded_digests_cache_size: Number of stored payload digests
+            remembered to skip uploading them again
+        :param delta_encode_prompts: Log only the new suffix of prompts extending
+            the prompt of a previous span of the session, see `PromptDeltaEncoder`
+        :param scrub_inline_media: Replace base64 images and documents in the
+            attributes by their MIME type, size and digest
+        :param meter_provider: Meter provider receiving the exporter metrics,
+            the global one when not provided
         :param kwargs: Additional arguments to pass to the parent class
         """
         super().__init__(**kwargs)
         self.debug = debug
-        self.logging_client = logging_client or google_cloud_logging.Client(
-            project=self.project_id
-        )
-        self.logger = self.logging_client.logger(__name__)
-        self.storage_client = storage_client or storage.Client(project=self.project_id)
         self.bucket_name = bucket_name or f"{self.project_id}-logs-data"
-        self.bucket = self.storage_client.bucket(self.bucket_name)
+        # Clients not provided are created on first use, on the export thread,
+        # to keep them off the application startup path
+        self._logging_client = logging_client
+        self._storage_client = storage_client
+        self._logger: Optional[google_cloud_logging.Logger] = None
+        self._bucket: Optional[storage.Bucket] = None
+        # Reentrant, as the logger and bucket create their client
+        self._clients_lock = threading.RLock()
+        # Cloud Logging writes run on this thread while spans go to Cloud Trace
+        self._log_writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="span-log-writer"
+        )
+        # Large payloads are uploaded in the background, with bounded backlog
+        self._uploader = ThreadPoolExecutor(
+            max_workers=upload_workers, thread_name_prefix="span-gcs-uploader"
+        )
+        self._upload_slots = threading.BoundedSemaphore(max_pending_uploads)
+        self._bucket_exists: Optional[bool] = None
+        self._bucket_checked_at = 0.0
+        # Digests of the payloads already stored, or being uploaded
+        self._uploaded_digests = InMemoryCacheBackend(
+            max_entries=uploaded_digests_cache_size, ttl_seconds=float("inf")
+        )
+        self._pending_digests: Set[str] = set()
+        self._digests_lock = threading.Lock()
+        self.prompt_delta = PromptDeltaEncoder() if delta_encode_prompts else None
+        self.scrub_inline_media = scrub_inline_media
+        self.metrics = ExporterMetrics(meter_provider)
+
+    @property
+    def logging_client(self) -> google_cloud_logging.Client:
+        """Google Cloud Logging client."""
+        if self._logging_client is None:
+            with self._clients_lock:
+                if self._logging_client is None:
+                    self._logging_client = google_cloud_logging.Client(
+                        project=self.project_id
+                    )
+        return self._logging_client
+
+    @property
+    def logger(self) -> google_cloud_logging.Logger:
+        """Logger receiving the span entries."""
+        if self._logger is None:
+            with self._clients_lock:
+                if self._logger is None:
+                    self._logger = self.logging_client.logger(__name__)
+        return self._logger
+
+    @property
+    def storage_client(self) -> storage.Client:
+        """Google Cloud Storage client."""
+        if self._storage_client is None:
+            with self._clients_lock:
+                if self._storage_client is None:
+                    self._storage_client = storage.Client(project=self.project_id)
+        return self._storage_client
+
+    @property
+    def bucket(self) -> storage.Bucket:
+        """Bucket receiving the large span payloads."""
+        if self._bucket is None:
+            with self._clients_lock:
+                if self._bucket is None:
+                    self._bucket = self.storage_client.bucket(self.bucket_name)
+        return self._bucket
+
+    def create_clients(self) -> None:
+        """Creates the Google Cloud clients ahead of the first export."""
+        _ = self.logger, self.bucket
 
     def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
         """
         Export the spans to Google Cloud Logging and Cloud Trace.
 
+        The log entries of the whole batch are written with bulk requests,
+        concurrently with the Cloud Trace export.
+
         :param spans: A sequence of spans to export
         :return: The result of the export operation
         """
+        self.metrics.batch_spans.record(len(spans))
+        entries = []
+        # Prompts of the batch, used as delta bases once their entries are written
+        pending_prompts: Dict[str, Dict[str, Tuple[str, str, int]]] = {}
         for span in spans:
             span_context = span.get_span_context()
             trace_id = format(span_context.trace_id, "x")
             span_id = format(span_context.span_id, "x")
-            span_dict = json.loads(span.to_json())
+            span_dict = span_to_dict(span)
 
             span_dict["trace"] = f"projects/{self.project_id}/traces/{trace_id}"
             span_dict["span_id"] = span_id
 
+            if self.scrub_inline_media:
+                scrub_attributes(span_dict["attributes"])
+            if self.prompt_delta is not None:
+                self.prompt_delta.encode(
+                    span_dict["attributes"], span_id, trace_id, pending_prompts
+                )
+            encoded_attributes = encode_attributes(span_dict["attributes"])
+
+            attributes = span_dict["attributes"]
             span_dict = self._process_large_attributes(
-                span_dict=span_dict, span_id=span_id
+                span_dict=span_dict,
+                span_id=span_id,
+                encoded_attributes=encoded_attributes,
             )
+            if span_dict["attributes"] is attributes:
+                attributes_size = encoded_size(encoded_attributes)
+            else:
+                # Offloaded to GCS, only a few small attributes are left
+                attributes_size = len(orjson.dumps(span_dict["attributes"]))
 
             if self.debug:
                 print(span_dict)
 
-            # Log the span data to Google Cloud Logging
-            self.logger.log_struct(span_dict, severity="INFO")
+            size = entry_size(span_dict, attributes_size)
+            self.metrics.span_bytes.record(size)
+            entries.append((span_dict, size))
+
+        # Log the span data to Google Cloud Logging
+        log_write = self._log_writer.submit(self.write_entries, entries)
 
         # Export spans to Google Cloud Trace using the parent class method
-        return super().export(spans)
+        started = time.perf_counter()
+        result = super().export(spans)
+        self.metrics.export_duration.record(
+            time.perf_counter() - started, {"sink": SINK_CLOUD_TRACE}
+        )
+        if result != SpanExportResult.SUCCESS:
+            self.metrics.failures.add(1, {"sink": SINK_CLOUD_TRACE})
 
-    def store_in_gcs(self, content: str, span_id: str) -> str:
+        try:
+            log_write.result()
+        except Exception as e:
+            logging.error("Failed to write span logs to Cloud Logging: %s", e)
+            return SpanExportResult.FAILURE
+        if self.prompt_delta is not None:
+            self.prompt_delta.commit(pending_prompts)
+        return result
+
+    def write_entries(self, entries: Sequence[Tuple[Dict[str, Any], int]]) -> None:
         """
-        Initiate storing large content in Google Cloud Storage/
+        Write log entries to Google Cloud Logging, one request per size-bounded group.
 
-        :param content: The content to store
-        :param span_id: The ID of the span
+        :param entries: The entries with their estimated encoded size in bytes
+        """
+        with self.metrics.time_export(SINK_CLOUD_LOGGING):
+            for group in split_entries(entries):
+                batch = self.logger.batch()
+                for entry in group:
+                    batch.log_struct(entry, severity="INFO", **entry_identity(entry))
+                batch.commit()
+
+    def shutdown(self) -> None:
+        """Wait for pending log writes and uploads and release their threads."""
+        self._log_writer.shutdown(wait=True)
+        self._uploader.shutdown(wait=True)
+        super().shutdown()
+
+    def bucket_exists(self) -> bool:
+        """
+        Check whether the payload bucket exists.
+
+        An existing bucket is only checked once; a missing one is checked again
+        after `BUCKET_RECHECK_SECONDS`.
+        """
+        now = time.monotonic()
+        if self._bucket_exists is None or (
+            not self._bucket_exists
+            and now - self._bucket_checked_at > BUCKET_RECHECK_SECONDS
+        ):
+            self._bucket_exists = self.bucket.exists()
+            self._bucket_checked_at = now
+        return self._bucket_exists
+
+    def store_in_gcs(self, content: bytes) -> str:
+        """
+        Initiate storing large content in Google Cloud Storage.
+
+        The content is gzip-compressed and stored under its SHA-256 digest, so
+        identical contents are uploaded once and shared. The upload runs in the
+        background; the URI is returned right away.
+
+        :param content: The JSON content to store
         :return: The  GCS URI of the stored content
         """
-        if not self.storage_client.bucket(self.bucket_name).exists():
+        if not self.bucket_exists():
             logging.warning(
                 f"Bucket {self.bucket_name} not found. "
                 "Unable to store span attributes in GCS."
             )
             return "GCS bucket not found"
 
-        blob_name = f"spans/{span_id}.json"
+        digest = hashlib.sha256(content).hexdigest()
+        blob_name = f"spans/{digest}.json"
+        uri = f"gs://{self.bucket_name}/{blob_name}"
+        with self._digests_lock:
+            if self._uploaded_digests.get(digest) or digest in self._pending_digests:
+                return uri
+            self._pending_digests.add(digest)
+
         blob = self.bucket.blob(blob_name)
+        # Served decompressed to clients that do not accept gzip
+        blob.content_encoding = "gzip"
+        self._upload_slots.acquire()
+        upload = self._uploader.submit(self._upload, blob, content)
+        upload.add_done_callback(partial(self._upload_done, digest))
+        return uri
 
-        blob.upload_from_string(content, "application/json")
-        return f"gs://{self.bucket_name}/{blob_name}"
+    def _upload(self, blob: storage.Blob, content: bytes) -> None:
+        """Upload a payload, retrying transient errors with exponential backoff."""
+        compressed = gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)
+        started = time.perf_counter()
+        try:
+            # Objects are never overwritten, so retrying is idempotent
+            blob.upload_from_string(
+                compressed,
+                "application/json",
+                retry=DEFAULT_RETRY,
+                if_generation_match=0,
+            )
+        except PreconditionFailed:
+            pass  # Already stored by another span or process
+        finally:
+            self.metrics.upload_duration.record(time.perf_counter() - started)
+
+    def _upload_done(self, digest: str, upload: "Future[None]") -> None:
+        """Release the upload slot, remember stored payloads and report failures."""
+        self._upload_slots.release()
+        with self._digests_lock:
+            self._pending_digests.discard(digest)
+            if upload.exception() is None:
+                self._uploaded_digests.set(digest, True)
+        if upload.exception() is not None:
+            self.metrics.failures.add(1, {"sink": SINK_GCS})
+            logging.error("Failed to store span attributes in GCS: %s", upload.exception())
 
-    def _process_large_attributes(self, span_dict: dict, span_id: str) -> dict:
+    def _process_large_attributes(
+        self,
+        span_dict: dict,
+        span_id: str,
+        encoded_attributes: Optional[Dict[str, bytes]] = None,
+    ) -> dict:
         """
         Process large attribute values by storing them in GCS if they exceed the size
         limit of Google Cloud Logging.
 
+        The size of the attributes is summed from their encoded values, and the
+        payload stored in GCS is assembled from them, so each value is encoded once.
+        Values of at least `MIN_SHARED_VALUE_BYTES` are stored under their own
+        digest and referenced from the payload as ``{"uri_payload": uri}``, so a
+        prompt or system message repeated across spans is stored once.
+
         :param span_dict: The span data dictionary
-        :param trace_id: The trace ID
         :param span_id: The span ID
+        :param encoded_attributes: The JSON-encoded attribute values, encoded here
+            when not provided
         :return: The updated span dictionary
         """
         attributes = span_dict["attributes"]
-        if len(json.dumps(attributes).encode()) > 255 * 1024:  # 250 KB
+        if encoded_attributes is None:
+            encoded_attributes = encode_attributes(attributes)
+        if encoded_size(encoded_attributes) > MAX_ATTRIBUTES_BYTES:
             # Separate large payload from other attributes
-            attributes_payload = {
+            payload = {
                 k: v
-                for k, v in attributes.items()
+                for k, v in encoded_attributes.items()
                 if "traceloop.association.properties" not in k
             }
             attributes_retain = {
@@ -120,12 +460,18 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
                 if "traceloop.association.properties" in k
             }
 
+            self.metrics.offloads.add(1)
+            self.metrics.offload_bytes.add(encoded_size(payload))
+            for key, value in payload.items():
+                if len(value) >= MIN_SHARED_VALUE_BYTES and self.bucket_exists():
+                    value_uri = self.store_in_gcs(value)
+                    payload[key] = b'{"uri_payload":"' + value_uri.encode() + b'"}'
+
             # Store large payload in GCS
-            gcs_uri = self.store_in_gcs(json.dumps(attributes_payload), span_id)
+            gcs_uri = self.store_in_gcs(join_encoded(payload))
             attributes_retain["uri_payload"] = gcs_uri
-            attributes_retain["url_payload"] = (
-                f"https://storage.mtls.cloud.google.com/"
-                f"{self.bucket_name}/spans/{span_id}.json"
+            attributes_retain["url_payload"] = gcs_uri.replace(
+                "gs://", PAYLOAD_URL_PREFIX, 1
             )
 
             span_dict["attributes"] = attributes_retain
@@ -6,6 +6,7 @@ import uuid
 import json
 import google.auth
 from frontend.utils.chat_utils import save_chat
+from frontend.utils.local_agents import invalidate_local_agents
 from frontend.utils.multimodal_utils import (
     HELP_GCS_CHECKBOX,
     HELP_MESSAGE_MULTIMODALITY,
@@ -15,6 +16,16 @@ from frontend.utils.multimodal_utils import (
 
 EMPTY_CHAT_NAME = "Empty chat"
 NUM_CHAT_IN_RECENT = 3
+HELP_SERVER_SIDE_SESSIONS = (
+    "Keep the conversation in the agent's session store and only send the new "
+    "message on each turn. The remote agent must be deployed with a "
+    "session_store_path. Edits to past messages are not sent to the agent."
+)
+HELP_RELOAD_AGENT = (
+    "The local agent is set up once and reused across messages. It is rebuilt "
+    "when its source files change; reload it to also pick up other changes, "
+    "such as environment variables."
+)
 
 
 DEFAULT_REMOTE_AGENT_ENGINE_ID = "N/A"
@@ -37,6 +48,16 @@ class SideBar:
         """
         self.st = st
 
+    def open_chat(self, chat_id: str) -> None:
+        """Make a saved chat the current one, loading its messages if needed."""
+        self.st.session_state.run_id = None
+        self.st.session_state["session_id"] = chat_id
+        self.st.session_state.session_db.get_session(session_id=chat_id)
+        if "messages" not in self.st.session_state.user_chats[chat_id]:
+            self.st.session_state.user_chats[chat_id] = (
+                self.st.session_state.session_db.load_session(chat_id)
+            )
+
     def init_side_bar(self) -> None:
         """Initialize and render the sidebar components."""
         with self.st.sidebar:
@@ -51,6 +72,8 @@ class SideBar:
                     label="Agent Callable Path",
                     value=os.environ.get("AGENT_CALLABLE_PATH", DEFAULT_AGENT_CALLABLE_PATH),
                 )
+                if self.st.button("Reload agent", help=HELP_RELOAD_AGENT):
+                    invalidate_local_agents(self.agent_callable_path)
                 self.remote_agent_engine_id = None
             else:
                 self.remote_agent_engine_id = self.st.text_input(
@@ -59,6 +82,12 @@ class SideBar:
                 )
                 self.agent_callable_path = None
 
+            self.server_side_sessions = self.st.checkbox(
+                "Server-side session state",
+                value=False,
+                help=HELP_SERVER_SIDE_SESSIONS,
+            )
+
             col1, col2, col3 = self.st.columns(3)
             with col1:
                 if self.st.button("+ New chat"):
@@ -92,10 +121,7 @@ class SideBar:
                     )
                     if len(self.st.session_state.user_chats) > 0:
                         chat_id = list(self.st.session_state.user_chats.keys())[0]
-                        self.st.session_state["session_id"] = chat_id
-                        self.st.session_state.session_db.get_session(
-                            session_id=self.st.session_state["session_id"],
-                        )
+                        self.open_chat(chat_id)
                     else:
                         self.st.session_state["session_id"] = str(uuid.uuid4())
                         self.st.session_state.user_chats[
@@ -113,20 +139,12 @@ class SideBar:
             all_chats = list(reversed(self.st.session_state.user_chats.items()))
             for chat_id, chat in all_chats[:NUM_CHAT_IN_RECENT]:
                 if self.st.button(chat["title"], key=chat_id):
-                    self.st.session_state.run_id = None
-                    self.st.session_state["session_id"] = chat_id
-                    self.st.session_state.session_db.get_session(
-                        session_id=self.st.session_state["session_id"],
-                    )
+                    self.open_chat(chat_id)
 
             with self.st.expander("Other chats"):
                 for chat_id, chat in all_chats[NUM_CHAT_IN_RECENT:]:
                     if self.st.button(chat["title"], key=chat_id):
-                        self.st.session_state.run_id = None
-                        self.st.session_state["session_id"] = chat_id
-                        self.st.session_state.session_db.get_session(
-                            session_id=self.st.session_state["session_id"],
-                        )
+                        self.open_chat(chat_id)
 
             self.st.divider()
             self.st.header("Upload files from local")
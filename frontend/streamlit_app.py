@@ -167,7 +167,8 @@ def handle_user_input(side_bar: SideBar) -> None:
         display_user_input(parts)
         generate_ai_response(
             remote_agent_engine_id=side_bar.remote_agent_engine_id,
-            agent_callable_path=side_bar.agent_callable_path
+            agent_callable_path=side_bar.agent_callable_path,
+            server_side_sessions=side_bar.server_side_sessions,
         )
         update_chat_title()
         if len(parts) > 1:
@@ -185,7 +186,8 @@ def display_user_input(parts: List[Dict[str, Any]]) -> None:
 
 def generate_ai_response(
     remote_agent_engine_id: str,
-    agent_callable_path: str
+    agent_callable_path: str,
+    server_side_sessions: bool = False,
 ) -> None:
     """Generate and display the AI's response to the user's input."""
     ai_message = st.chat_message("ai")
@@ -194,7 +196,8 @@ def generate_ai_response(
         stream_handler = StreamHandler(st=st)
         client = Client(
             remote_agent_engine_id=remote_agent_engine_id,
-            agent_callable_path=agent_callable_path
+            agent_callable_path=agent_callable_path,
+            server_side_sessions=server_side_sessions,
         )
         get_chain_response(st=st, client=client, stream_handler=stream_handler)
         status.update(label="Finished!", state="complete", expanded=False)
@@ -226,6 +229,7 @@ def display_feedback(side_bar: SideBar) -> None:
             client = Client(
                 agent_callable_path=side_bar.agent_callable_path,
                 remote_agent_engine_id=side_bar.remote_agent_engine_id,
+                server_side_sessions=side_bar.server_side_sessions,
             )
             client.log_feedback(
                 feedback_dict=feedback,
@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+
+class ChatIndex:
+    """SQLite index of saved chat sessions.
+
+    Keeps the title, update time and message count of each session, so the
+    sessions of a user can be listed without reading their messages.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Initialize the index.
+
+        Args:
+            path: Path of the SQLite database, created on first use
+        """
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """The SQLite connection, opened on first use."""
+        if self._connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.executescript(
+                """
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS sessions (
+                    user_id TEXT NOT NULL,
+                    session_id TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    update_time TEXT NOT NULL DEFAULT '',
+                    message_count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_id, session_id)
+                );
+                CREATE INDEX IF NOT EXISTS sessions_by_update_time
+                    ON sessions (user_id, update_time);
+                """
+            )
+        return self._connection
+
+    def _upsert(self, user_id: str, session_id: str, session: Dict) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)",
+            (
+                user_id,
+                session_id,
+                session.get("title") or session_id,
+                session.get("update_time", ""),
+                len(session.get("messages") or []),
+            ),
+        )
+
+    def upsert(self, user_id: str, session_id: str, session: Dict) -> None:
+        """Adds or updates the entry of a session."""
+        with self._lock, self.connection:
+            self._upsert(user_id, session_id, session)
+
+    def delete(self, user_id: str, session_id: str) -> None:
+        """Removes the entry of a session."""
+        with self._lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM sessions WHERE user_id = ? AND session_id = ?",
+                (user_id, session_id),
+            )
+
+    def sync(
+        self,
+        user_id: str,
+        stored_session_ids: Iterable[str],
+        load_session: Callable[[str], Dict],
+    ) -> None:
+        """Indexes the stored sessions missing from the index, drops the others.
+
+        Only missing sessions are loaded, for instance sessions saved before
+        the index existed.
+
+        Args:
+            user_id: The user owning the sessions
+            stored_session_ids: IDs of the sessions in storage
+            load_session: Loads a session, with its messages, by ID
+        """
+        stored = set(stored_session_ids)
+        with self._lock, self.connection:
+            indexed = {
+                row[0]
+                for row in self.connection.execute(
+                    "SELECT session_id FROM sessions WHERE user_id = ?", (user_id,)
+                )
+            }
+            for session_id in stored - indexed:
+                self._upsert(user_id, session_id, load_session(session_id))
+            self.connection.executemany(
+                "DELETE FROM sessions WHERE user_id = ? AND session_id = ?",
+                [(user_id, session_id) for session_id in indexed - stored],
+            )
+
+    def list(self, user_id: str) -> Dict[str, Dict]:
+        """Returns the sessions of a user, least recently updated first.
+
+        Each session holds its title, message count and, when known, its
+        update time.
+        """
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT session_id, title, update_time, message_count FROM sessions "
+                "WHERE user_id = ? ORDER BY update_time, session_id",
+                (user_id,),
+            ).fetchall()
+        sessions = {}
+        for session_id, title, update_time, message_count in rows:
+            sessions[session_id] = {"title": title, "message_count": message_count}
+            if update_time:
+                sessions[session_id]["update_time"] = update_time
+        return sessions
@@ -5,7 +5,7 @@ import os
 from pathlib import Path
 from typing import Any, Dict, List, Union
 
-import yaml
+from frontend.utils.session_log import export_yaml
 
 SAVED_CHAT_PATH = str(os.getcwd()) + "/.saved_chats"
 
@@ -45,12 +45,5 @@ def save_chat(st: Any) -> None:
     if len(messages) > 0:
         session["messages"] = sanitize_messages(session["messages"])
         filename = f"{session_id}.yaml"
-        with open(Path(SAVED_CHAT_PATH) / filename, "w") as file:
-            yaml.dump(
-                [session],
-                file,
-                allow_unicode=True,
-                default_flow_style=False,
-                encoding="utf-8",
-            )
+        export_yaml(session, str(Path(SAVED_CHAT_PATH) / filename))
         st.toast(f"Chat saved to path: ↓ {Path(SAVED_CHAT_PATH) / filename}")
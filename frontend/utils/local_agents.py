@@ -0,0 +1,112 @@
+import importlib
+import logging
+import os
+import sys
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+LOCAL_SESSION_STORE_PATH = ".sessions/checkpoints.sqlite"
+
+_lock = threading.Lock()
+# (agent_callable_path, server_side_sessions) -> (source fingerprint, agent)
+_agents: Dict[Tuple[str, bool], Tuple[int, Any]] = {}
+
+
+def _package_dir(package: str) -> Optional[str]:
+    """Returns the directory of an imported top-level package, if any."""
+    module = sys.modules.get(package)
+    path = getattr(module, "__file__", None)
+    return os.path.dirname(path) if path else None
+
+
+def source_fingerprint(package: str) -> int:
+    """Returns a fingerprint of the Python sources of a top-level package.
+
+    The fingerprint changes when a source file is added, removed or modified.
+    """
+    directory = _package_dir(package)
+    if directory is None:
+        return 0
+    fingerprint = 0
+    pending = [directory]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir() and entry.name != "__pycache__":
+                    pending.append(entry.path)
+                elif entry.name.endswith(".py"):
+                    fingerprint ^= hash((entry.path, entry.stat().st_mtime_ns))
+    return fingerprint
+
+
+def _shut_down(agent: Any) -> None:
+    """Flushes the background work of an agent before it is dropped.
+
+    Spans and feedback still queued by the agent would be lost otherwise,
+    and its export threads would keep running next to the new agent's.
+    """
+    shutdown = getattr(agent, "shutdown", None)
+    if shutdown is None:
+        return
+    try:
+        shutdown()
+    except Exception as e:
+        logging.error("Failed to shut down local agent: %s", e)
+
+
+def _unload(package: str) -> None:
+    """Removes a package and its submodules, so they are imported again."""
+    for name in list(sys.modules):
+        if name == package or name.startswith(f"{package}."):
+            del sys.modules[name]
+
+
+def get_local_agent(
+    agent_callable_path: str, server_side_sessions: bool = False
+) -> Any:
+    """Returns a set-up local agent, shared by the sessions of the process.
+
+    The agent is created and set up on first use. It is created again, with
+    its package re-imported, when the package sources changed since; the
+    previous agent is shut down first.
+
+    Args:
+        agent_callable_path: Import path of the agent class
+        server_side_sessions: Whether the agent keeps the conversation state
+    """
+    module_path, class_name = agent_callable_path.rsplit(".", 1)
+    package = module_path.split(".", 1)[0]
+    key = (agent_callable_path, server_side_sessions)
+    with _lock:
+        fingerprint = source_fingerprint(package)
+        cached = _agents.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        if cached is not None:
+            _shut_down(cached[1])
+            # Get the latest changes of the agent and its submodules
+            _unload(package)
+        module = importlib.import_module(module_path)
+        if server_side_sessions:
+            agent = getattr(module, class_name)(
+                session_store_path=LOCAL_SESSION_STORE_PATH
+            )
+        else:
+            agent = getattr(module, class_name)()
+        agent.set_up()
+        # Fingerprinted once imported, set_up imports the rest of the package
+        _agents[key] = (source_fingerprint(package), agent)
+        return agent
+
+
+def invalidate_local_agents(agent_callable_path: Optional[str] = None) -> None:
+    """Drops cached local agents, all of them or those of one callable path.
+
+    The dropped agents are shut down, and their packages are imported again on
+    next use.
+    """
+    with _lock:
+        for key in list(_agents):
+            if agent_callable_path is None or key[0] == agent_callable_path:
+                _shut_down(_agents.pop(key)[1])
+                _unload(key[0].split(".", 1)[0])
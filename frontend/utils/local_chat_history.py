@@ -5,12 +5,25 @@ import os
 from typing import Dict
 
 from langchain_core.chat_history import BaseChatMessageHistory
+from frontend.utils.chat_index import ChatIndex
+from frontend.utils.session_log import SessionLogWriter, read_session_log
 from frontend.utils.title_summary import chain_title
 import yaml
 
+INDEX_FILENAME = "index.sqlite"
+LOG_EXTENSION = ".jsonl"
+
 
 class LocalChatMessageHistory(BaseChatMessageHistory):
-    """Manages local storage and retrieval of chat message history."""
+    """Manages local storage and retrieval of chat message history.
+
+    Each session is stored in its own append-only log, see `session_log`;
+    sessions saved as YAML files by earlier versions are still read, and
+    moved to a log on their next write. A SQLite index of the
+    sessions (title, update time, message count) is maintained on write, so
+    listing the conversations does not read the session files; messages are
+    only loaded for the sessions that are opened.
+    """
 
     def __init__(
         self,
@@ -22,51 +35,77 @@ class LocalChatMessageHistory(BaseChatMessageHistory):
         self.session_id = session_id
         self.base_dir = base_dir
         self.user_dir = os.path.join(self.base_dir, self.user_id)
-        self.session_file = os.path.join(self.user_dir, f"{session_id}.yaml")
+        self.session_file = self._session_path(session_id)
+        self.index = ChatIndex(os.path.join(self.base_dir, INDEX_FILENAME))
+        self._writers: Dict[str, SessionLogWriter] = {}
 
         os.makedirs(self.user_dir, exist_ok=True)
 
     def get_session(self, session_id: str) -> None:
         """Updates the session ID and file path for the current session."""
         self.session_id = session_id
-        self.session_file = os.path.join(self.user_dir, f"{session_id}.yaml")
+        self.session_file = self._session_path(session_id)
+
+    def _session_path(self, session_id: str) -> str:
+        return os.path.join(self.user_dir, f"{session_id}{LOG_EXTENSION}")
+
+    def _legacy_session_path(self, session_id: str) -> str:
+        return os.path.join(self.user_dir, f"{session_id}.yaml")
+
+    def load_session(self, session_id: str) -> Dict:
+        """Loads a session, with its messages, by streaming its log."""
+        if os.path.exists(self._session_path(session_id)):
+            conversation = read_session_log(self._session_path(session_id))
+            conversation.setdefault("title", session_id)
+            return conversation
+        file_path = self._legacy_session_path(session_id)
+        with open(file_path, "r") as f:
+            conversation = yaml.safe_load(f)
+        if not isinstance(conversation, list) or len(conversation) > 1:
+            raise ValueError(
+                f"""Invalid format in {file_path}.
+            YAML file can only contain one conversation with the following
+            structure.
+              - messages:
+                  - content: [message text]
+                  - type: (human or ai)"""
+            )
+        conversation = conversation[0]
+        if "title" not in conversation:
+            conversation["title"] = f"{session_id}.yaml"
+        return conversation
 
     def get_all_conversations(self) -> Dict[str, Dict]:
-        """Retrieves all conversations for the current user."""
-        conversations = {}
-        for filename in os.listdir(self.user_dir):
-            if filename.endswith(".yaml"):
-                file_path = os.path.join(self.user_dir, filename)
-                with open(file_path, "r") as f:
-                    conversation = yaml.safe_load(f)
-                    if not isinstance(conversation, list) or len(conversation) > 1:
-                        raise ValueError(
-                            f"""Invalid format in {file_path}.
-                        YAML file can only contain one conversation with the following
-                        structure.
-                          - messages:
-                              - content: [message text]
-                              - type: (human or ai)"""
-                        )
-                    conversation = conversation[0]
-                    if "title" not in conversation:
-                        conversation["title"] = filename
-                conversations[filename[:-5]] = conversation
-        return dict(
-            sorted(conversations.items(), key=lambda x: x[1].get("update_time", ""))
+        """Retrieves all conversations for the current user, oldest first.
+
+        Conversations hold their title, update time and message count; their
+        messages are loaded with `load_session`.
+        """
+        self.index.sync(
+            self.user_id,
+            (
+                os.path.splitext(filename)[0]
+                for filename in os.listdir(self.user_dir)
+                if filename.endswith((LOG_EXTENSION, ".yaml"))
+            ),
+            self.load_session,
         )
+        return self.index.list(self.user_id)
 
     def upsert_session(self, session: Dict) -> None:
-        """Updates or inserts a session into the local storage."""
+        """Updates or inserts a session into the local storage.
+
+        Only the messages and fields changed since the last write are appended
+        to the session log.
+        """
         session["update_time"] = datetime.now().isoformat()
-        with open(self.session_file, "w") as f:
-            yaml.dump(
-                [session],
-                f,
-                allow_unicode=True,
-                default_flow_style=False,
-                encoding="utf-8",
-            )
+        if self.session_id not in self._writers:
+            self._writers[self.session_id] = SessionLogWriter(self.session_file)
+        self._writers[self.session_id].write(session)
+        legacy_file = self._legacy_session_path(self.session_id)
+        if os.path.exists(legacy_file):
+            os.remove(legacy_file)
+        self.index.upsert(self.user_id, self.session_id, session)
 
     def set_title(self, session: Dict) -> None:
         """
@@ -103,6 +142,12 @@ class LocalChatMessageHistory(BaseChatMessageHistory):
             self.upsert_session(session)
 
     def clear(self) -> None:
-        """Removes the current session file if it exists."""
-        if os.path.exists(self.session_file):
-            os.remove(self.session_file)
+        """Removes the current session files if they exist."""
+        self._writers.pop(self.session_id, None)
+        for file_path in (
+            self.session_file,
+            self._legacy_session_path(self.session_id),
+        ):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        self.index.delete(self.user_id, self.session_id)
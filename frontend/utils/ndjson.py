@@ -0,0 +1,43 @@
+from typing import Any, List, Union
+
+import orjson
+
+
+class NDJSONDecoder:
+    """Incrementally decodes newline-delimited JSON from arbitrary chunks.
+
+    Bytes are kept in a buffer across chunks, so records split over several
+    chunks, or several records in one chunk, are decoded as soon as their
+    terminating newline arrives. Records are parsed in place from the buffer.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        # Bytes of the buffer already known not to hold a newline
+        self._scanned = 0
+
+    def feed(self, data: Union[bytes, str]) -> List[Any]:
+        """Adds a chunk and returns the records it completes."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        buffer = self._buffer
+        buffer += data
+        records = []
+        start = 0
+        end = buffer.find(b"\n", self._scanned)
+        with memoryview(buffer) as view:
+            while end != -1:
+                if end > start:
+                    records.append(orjson.loads(view[start:end]))
+                start = end + 1
+                end = buffer.find(b"\n", start)
+        del buffer[:start]
+        self._scanned = len(buffer)
+        return records
+
+    def close(self) -> List[Any]:
+        """Returns the last record when the stream does not end with a newline."""
+        remainder = bytes(self._buffer)
+        self._buffer.clear()
+        self._scanned = 0
+        return [orjson.loads(remainder)] if remainder.strip() else []
@@ -0,0 +1,83 @@
+import queue
+import threading
+from typing import Any, Callable, Generator, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Events decoded ahead of the renderer
+MAX_PREFETCHED_EVENTS = 256
+
+_END = object()
+
+
+class _Failure:
+    """Exception raised by the producer, re-raised by the consumer."""
+
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+def prefetch(
+    iterable: Iterable[T],
+    max_queue_size: int = MAX_PREFETCHED_EVENTS,
+    cancel: Optional[Callable[[], None]] = None,
+) -> Generator[T, None, None]:
+    """Iterates `iterable` on a background thread, yielding its items in order.
+
+    Items are handed over through a bounded queue, so reading and decoding
+    the stream overlaps with the work done by the consumer between items.
+    Exceptions raised by the iterable are re-raised to the consumer. Closing
+    the generator stops the producer at its next item; `cancel` stops a
+    producer blocked waiting for that item.
+
+    Args:
+        iterable: The items to produce, iterated on the background thread
+        max_queue_size: Maximum number of items produced ahead of the consumer
+        cancel: Called when the consumer stops before the end of the items,
+            for instance to close the connection the producer is reading
+    """
+    items: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue_size)
+    stopped = threading.Event()
+
+    def put(item: Any) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+        except BaseException as e:  # pylint: disable=W0718
+            put(_Failure(e))
+            return
+        finally:
+            # Releases the underlying stream when the consumer stopped early
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+        put(_END)
+
+    producer = threading.Thread(target=produce, name="stream-prefetch", daemon=True)
+    producer.start()
+    ended = False
+    try:
+        while True:
+            item = items.get()
+            if item is _END:
+                ended = True
+                return
+            if isinstance(item, _Failure):
+                ended = True
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+        if cancel is not None and not ended:
+            cancel()
@@ -0,0 +1,217 @@
+"""Append-only storage of chat sessions.
+
+A session log holds one JSON record per line:
+
+- ``{"message": {...}}`` appends a message,
+- ``{"truncate": n}`` keeps the first ``n`` messages, when messages are edited
+  or deleted,
+- ``{"session": {...}}`` sets the other fields of the session (title, update
+  time).
+
+Each turn only appends the records of what changed. Logs are compacted once
+they hold mostly superseded records.
+
+Export a log to the YAML format of saved chats with:
+    python -m frontend.utils.session_log export <session.jsonl> [<output.yaml>]
+"""
+
+import argparse
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import orjson
+import yaml
+
+# Logs with fewer records are never compacted
+COMPACT_MIN_RECORDS = 64
+
+
+def iter_session_log(path: str) -> Iterator[Dict[str, Any]]:
+    """Yields the records of a session log, one line at a time.
+
+    A last line left incomplete by an interrupted write is skipped.
+    """
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            yield orjson.loads(line)
+
+
+def read_session_log(path: str) -> Dict[str, Any]:
+    """Rebuilds a session by streaming its log."""
+    session: Dict[str, Any] = {}
+    messages: List[Any] = []
+    for record in iter_session_log(path):
+        if "message" in record:
+            messages.append(record["message"])
+        elif "truncate" in record:
+            del messages[record["truncate"] :]
+        elif "session" in record:
+            session.update(record["session"])
+    session["messages"] = messages
+    return session
+
+
+def export_yaml(session: Dict[str, Any], path: str) -> None:
+    """Writes a session in the YAML format of saved chats."""
+    with open(path, "w") as f:
+        yaml.dump(
+            [session],
+            f,
+            allow_unicode=True,
+            default_flow_style=False,
+            encoding="utf-8",
+        )
+
+
+def _message_record(message: bytes) -> bytes:
+    return b'{"message":' + message + b"}"
+
+
+def _session_record(fields: bytes) -> bytes:
+    return b'{"session":' + fields + b"}"
+
+
+class SessionLogWriter:
+    """Persists the successive states of a session to its append-only log.
+
+    The persisted state is kept in memory between writes, and read again when
+    the log was changed by another writer, e.g. another tab on the same chat.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Initialize the writer.
+
+        Args:
+            path: Path of the session log, created on first write
+        """
+        self.path = path
+        # Encoded messages and fields of the session, as persisted
+        self._messages: Optional[List[bytes]] = None
+        self._fields = b""
+        self._records = 0
+        # Size and modification time of the log once last read or written
+        self._file_state: Optional[Tuple[int, int]] = None
+
+    def _current_file_state(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _load(self) -> List[bytes]:
+        """Reads the persisted state, dropping a last incomplete record."""
+        self._messages = []
+        self._fields = b""
+        self._records = 0
+        if not os.path.exists(self.path):
+            self._file_state = None
+            return self._messages
+        valid_bytes = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                record = orjson.loads(line)
+                valid_bytes += len(line)
+                self._records += 1
+                if "message" in record:
+                    self._messages.append(orjson.dumps(record["message"]))
+                elif "truncate" in record:
+                    del self._messages[record["truncate"] :]
+                elif "session" in record:
+                    self._fields = orjson.dumps(record["session"])
+        if valid_bytes < os.path.getsize(self.path):
+            with open(self.path, "rb+") as f:
+                f.truncate(valid_bytes)
+        self._file_state = self._current_file_state()
+        return self._messages
+
+    def write(self, session: Dict[str, Any]) -> int:
+        """Appends the changes since the last write, compacting when due.
+
+        Args:
+            session: The session, with its messages
+
+        Returns:
+            The number of records written
+        """
+        persisted = self._messages
+        if persisted is None or self._current_file_state() != self._file_state:
+            # First write, or the log was written by another writer since
+            persisted = self._load()
+        messages = [orjson.dumps(message) for message in session.get("messages", [])]
+        fields = orjson.dumps({k: v for k, v in session.items() if k != "messages"})
+
+        kept = 0
+        for persisted_message, message in zip(persisted, messages):
+            if persisted_message != message:
+                break
+            kept += 1
+        records = []
+        if kept < len(persisted):
+            records.append(orjson.dumps({"truncate": kept}))
+        records.extend(_message_record(message) for message in messages[kept:])
+        if fields != self._fields:
+            records.append(_session_record(fields))
+
+        # Compact once superseded records outnumber the current ones
+        limit = max(COMPACT_MIN_RECORDS, 2 * (len(messages) + 1))
+        if self._records + len(records) > limit:
+            return self._compact(messages, fields)
+        if records:
+            self._make_dirs()
+            with open(self.path, "ab") as f:
+                f.write(b"\n".join(records) + b"\n")
+            self._file_state = self._current_file_state()
+        self._messages = messages
+        self._fields = fields
+        self._records += len(records)
+        return len(records)
+
+    def _make_dirs(self) -> None:
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def _compact(self, messages: List[bytes], fields: bytes) -> int:
+        """Rewrites the log with only the records of the current state."""
+        records = [_message_record(message) for message in messages]
+        records.append(_session_record(fields))
+        self._make_dirs()
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(b"\n".join(records) + b"\n")
+            # The log is only replaced by a complete copy, even on power loss
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.path)
+        self._file_state = self._current_file_state()
+        self._messages = messages
+        self._fields = fields
+        self._records = len(records)
+        return len(records)
+
+
+def main() -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Export a session log to YAML")
+    export.add_argument("log", help="Path of the session log")
+    export.add_argument(
+        "output",
+        nargs="?",
+        help="Path of the YAML file, named after the log in the current directory "
+        "by default",
+    )
+    args = parser.parse_args()
+    name = os.path.splitext(os.path.basename(args.log))[0]
+    output = args.output or f"{name}.yaml"
+    export_yaml(read_session_log(args.log), output)
+    print(f"Session exported to {output}")
+
+
+if __name__ == "__main__":
+    main()
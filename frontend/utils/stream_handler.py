@@ -1,13 +1,18 @@
+import contextlib
 import json
+import time
 import uuid
-from typing import Any, Dict, Generator, List, Optional
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional
 from urllib.parse import urljoin
-import importlib
 
 from langchain_core.messages import AIMessage, ToolMessage
 import requests
 import streamlit as st
+from frontend.utils.local_agents import get_local_agent
 from frontend.utils.multimodal_utils import format_content
+from frontend.utils.ndjson import NDJSONDecoder
+from frontend.utils.prefetch import prefetch
+from google.cloud.aiplatform_v1beta1 import types as aip_types
 from vertexai.preview import reasoning_engines
 
 from google.api.httpbody_pb2 import HttpBody
@@ -18,19 +23,31 @@ def get_remote_agent(remote_agent_engine_id: str) -> Any:
     return reasoning_engines.ReasoningEngine(remote_agent_engine_id)
 
 
+# Minimum delay between two repaints of a streamed answer
+RENDER_INTERVAL_MS = 100.0
+
+
 class Client:
     """A client for streaming events from a server."""
-    def __init__(self, agent_callable_path: str, remote_agent_engine_id: str) -> None:
-        """Initialize the Client with a base URL."""
+    def __init__(
+        self,
+        agent_callable_path: str,
+        remote_agent_engine_id: str,
+        server_side_sessions: bool = False,
+    ) -> None:
+        """Initialize the Client with a base URL.
 
+        When `server_side_sessions` is set, the agent keeps the conversation
+        state and only new messages are sent on each turn. Local agents are
+        set up once and shared across turns, see `get_local_agent`.
+        """
+        self.server_side_sessions = server_side_sessions
+        # Response of the remote stream in progress, see `cancel_stream`
+        self._response: Any = None
         if remote_agent_engine_id:
             self.agent = get_remote_agent(remote_agent_engine_id)
         else:
-            # Force reload all submodules to get latest changes
-            module_path, class_name = agent_callable_path.rsplit('.', 1)
-            module = importlib.import_module(module_path)
-            self.agent = getattr(module, class_name)()
-            self.agent.set_up()
+            self.agent = get_local_agent(agent_callable_path, server_side_sessions)
 
     def log_feedback(self, feedback_dict: Dict[str, Any], run_id: str) -> None:
         """Log user feedback for a specific run."""
@@ -60,43 +77,116 @@ class Client:
     def stream_events(
         self, data: Dict[str, Any]
     ) -> Generator[Dict[str, Any], None, None]:
-        """Stream events from the server, yielding parsed event data."""
-        for event in self.agent.stream_query(input=data):
+        """Stream events from the server, yielding parsed event data.
+
+        `HttpBody` chunks hold newline-delimited JSON events, possibly split
+        across chunks; each event is yielded as soon as it is complete.
+        """
+        decoder = NDJSONDecoder()
+        for event in self._stream_query(data):
             if isinstance(event, HttpBody):
-                    # Handle multiline strings by splitting on newlines
-                    if isinstance(event.data, bytes):
-                        event_data = event.data.decode('utf-8')
-                    else:
-                        event_data = event.data
-                    if "\n" in event_data:
-                        lines = event_data.splitlines()
-                        for line in lines:
-                            yield json.loads(line)
+                yield from decoder.feed(event.data)
             else:
                 # If already a dict/object, yield as-is
                 yield event
+        yield from decoder.close()
+
+    def _stream_query(self, data: Dict[str, Any]) -> Iterable[Any]:
+        """Starts a streamed query, keeping the response of remote agents.
+
+        Remote agents are queried through their API client, instead of their
+        `stream_query` wrapper, so the response can be cancelled.
+        """
+        if not isinstance(self.agent, reasoning_engines.ReasoningEngine):
+            return self.agent.stream_query(input=data)
+        self._response = self.agent.execution_api_client.stream_query_reasoning_engine(
+            request=aip_types.StreamQueryReasoningEngineRequest(
+                name=self.agent.resource_name,
+                input={"input": data},
+                class_method="stream_query",
+            ),
+        )
+        return self._response
+
+    def cancel_stream(self) -> None:
+        """Closes the connection of the remote stream in progress, if any.
+
+        Unblocks a reader waiting for the next event. Local agents stop once
+        their next event is produced.
+        """
+        response, self._response = self._response, None
+        if response is not None:
+            response.cancel()
 
 
 class StreamHandler:
-    """Handles streaming updates to a Streamlit interface."""
+    """Handles streaming updates to a Streamlit interface.
 
-    def __init__(self, st: Any, initial_text: str = "") -> None:
+    Tokens are buffered and repainted at most every `render_interval_ms`,
+    instead of re-rendering the whole answer on every token. The first token
+    is painted right away; call `flush` at the end of the stream to paint the
+    last buffered tokens. Status updates are painted right away, with the
+    buffered tokens: tools may run for a while after them.
+    """
+
+    def __init__(
+        self,
+        st: Any,
+        initial_text: str = "",
+        render_interval_ms: float = RENDER_INTERVAL_MS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
         """Initialize the StreamHandler with Streamlit context and initial text."""
         self.st = st
         self.tool_expander = st.expander("Tool Calls:", expanded=False)
         self.container = st.empty()
-        self.text = initial_text
-        self.tools_logs = initial_text
+        self.render_interval = render_interval_ms / 1000
+        self.clock = clock
+        self._text_parts = [initial_text]
+        self._tools_log_parts = [initial_text]
+        self._pending_statuses: List[str] = []
+        self._text_changed = False
+        self._last_render = float("-inf")
+
+    @property
+    def text(self) -> str:
+        """The answer received so far."""
+        if len(self._text_parts) > 1:
+            self._text_parts = ["".join(self._text_parts)]
+        return self._text_parts[0]
+
+    @property
+    def tools_logs(self) -> str:
+        """The status updates received so far."""
+        if len(self._tools_log_parts) > 1:
+            self._tools_log_parts = ["".join(self._tools_log_parts)]
+        return self._tools_log_parts[0]
 
     def new_token(self, token: str) -> None:
         """Add a new token to the main text display."""
-        self.text += token
-        self.container.markdown(format_content(self.text), unsafe_allow_html=True)
+        self._text_parts.append(token)
+        self._text_changed = True
+        self._render_if_due()
 
     def new_status(self, status_update: str) -> None:
-        """Add a new status update to the tool calls expander."""
-        self.tools_logs += status_update
-        self.tool_expander.markdown(status_update)
+        """Add a new status update to the tool calls expander, painting it."""
+        self._tools_log_parts.append(status_update)
+        self._pending_statuses.append(status_update)
+        self.flush()
+
+    def flush(self) -> None:
+        """Paint the buffered tokens and status updates."""
+        if self._text_changed:
+            self.container.markdown(format_content(self.text), unsafe_allow_html=True)
+            self._text_changed = False
+        if self._pending_statuses:
+            self.tool_expander.markdown("".join(self._pending_statuses))
+            self._pending_statuses.clear()
+        self._last_render = self.clock()
+
+    def _render_if_due(self) -> None:
+        if self.clock() - self._last_render >= self.render_interval:
+            self.flush()
 
 
 class EventProcessor:
@@ -117,26 +207,39 @@ class EventProcessor:
         messages = self.st.session_state.user_chats[
             self.st.session_state["session_id"]
         ]["messages"]
+        if self.client.server_side_sessions:
+            # The agent already holds the history: only send the new message
+            messages = messages[-1:]
         run_id = str(uuid.uuid4())
         self.current_run_id = run_id
-        stream = self.client.stream_events(
-            data={
-                "messages": messages,
-                "config": {"run_id": run_id},
-                "user_id": self.st.session_state["user_id"],
-                "session_id": self.st.session_state["session_id"],
-            }
+        # Events are read and decoded on a background thread while this
+        # thread renders them. Stopping early, e.g. on a rerun, closes the
+        # connection.
+        stream = prefetch(
+            self.client.stream_events(
+                data={
+                    "messages": messages,
+                    "config": {"run_id": run_id},
+                    "user_id": self.st.session_state["user_id"],
+                    "session_id": self.st.session_state["session_id"],
+                }
+            ),
+            cancel=self.client.cancel_stream,
         )
 
-        for event in stream:
-            # Each event is a list with message and metadata
-            for chunk in event:
-                if not isinstance(chunk, dict) or 'type' not in chunk:
-                    continue
-                    
-                if chunk['type'] == 'constructor':
-                    message = chunk['kwargs']
-                    
+        with contextlib.closing(stream):
+            for event in stream:
+                # Each event is a list with message and metadata
+                for chunk in event:
+                    if not isinstance(chunk, dict) or 'type' not in chunk:
+                        continue
+
+                    # Compact wire shape, or the LangChain constructor envelope
+                    # still sent by older deployments
+                    message = (
+                        chunk['kwargs'] if chunk['type'] == 'constructor' else chunk
+                    )
+
                     # Handle tool calls
                     if message.get('tool_calls'):
                         tool_calls = message['tool_calls']
@@ -145,7 +248,7 @@ class EventProcessor:
                         for tool_call in tool_calls:
                             msg = f"\n\nCalling tool: `{tool_call['name']}` with args: `{tool_call['args']}`"
                             self.stream_handler.new_status(msg)
-                            
+                        
                     # Handle tool responses
                     elif message.get('tool_call_id'):
                         content = message['content']
@@ -158,13 +261,14 @@ class EventProcessor:
                         self.tool_calls.append(tool_message)
                         msg = f"\n\nTool response: `{content}`"
                         self.stream_handler.new_status(msg)
-                        
+                    
                     # Handle AI responses
                     elif content := message.get('content'):
                         self.final_content += content
                         self.stream_handler.new_token(content)
 
         # Handle end of stream
+        self.stream_handler.flush()
         if self.final_content:
             final_message = AIMessage(
                 content=self.final_content,
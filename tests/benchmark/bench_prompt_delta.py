@@ -0,0 +1,53 @@
+"""
+Bytes of prompt attributes logged for a conversation, with and without
+delta encoding of the prompts.
+
+Each turn makes two LLM calls (a tool call, then the answer), and each call
+sends the whole history as its prompt.
+
+Usage:
+    uv run python tests/benchmark/bench_prompt_delta.py
+"""
+
+from typing import Any, Dict, Iterator
+
+from app.utils.prompt_delta import SESSION_ID_ATTRIBUTE, PromptDeltaEncoder
+from app.utils.span_encoding import encode_attributes, encoded_size
+from app.utils.tracing import MAX_ATTRIBUTES_BYTES
+
+
+def llm_span_attributes(turns: int) -> Iterator[Dict[str, Any]]:
+    """Prompt attributes of the LLM spans of a conversation."""
+    history = "system: You are a helpful assistant. " * 50 + "\n"
+    for turn in range(turns):
+        history += f"user: question {turn} " + "Tell me about the weather. " * 40
+        for call in ("tool", "answer"):
+            yield {
+                SESSION_ID_ATTRIBUTE: "session",
+                "gen_ai.prompt.0.content": history,
+            }
+            history += f"\n{call}: " + "It is sunny. " * 30
+
+
+def main() -> None:
+    """Run the benchmark."""
+    for turns in (10, 30):
+        encoder = PromptDeltaEncoder()
+        full_bytes = delta_bytes = full_offloads = delta_offloads = 0
+        for index, attributes in enumerate(llm_span_attributes(turns)):
+            size = encoded_size(encode_attributes(attributes))
+            full_bytes += size
+            full_offloads += size > MAX_ATTRIBUTES_BYTES
+            encoder.encode(attributes, f"span-{index}", "trace")
+            size = encoded_size(encode_attributes(attributes))
+            delta_bytes += size
+            delta_offloads += size > MAX_ATTRIBUTES_BYTES
+        print(
+            f"{turns:3d} turns: full {full_bytes / 1024:9.0f} KB "
+            f"({full_offloads} GCS offloads), "
+            f"delta {delta_bytes / 1024:7.0f} KB ({delta_offloads} GCS offloads)"
+        )
+
+
+if __name__ == "__main__":
+    main()
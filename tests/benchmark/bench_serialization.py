@@ -0,0 +1,61 @@
+"""
+Per-chunk cost of the stream_query serialization path.
+
+Compares the previous path (`dumpd` + `print`) with the compact encoder.
+
+Usage:
+    uv run python tests/benchmark/bench_serialization.py
+"""
+
+import contextlib
+import io
+import timeit
+
+from app.utils.serialization import dumps_chunk, encode_chunk
+from langchain.load import dump as langchain_load_dump
+from langchain_core.messages import AIMessageChunk
+
+NUMBER = 20_000
+
+CHUNK = (
+    AIMessageChunk(content="token ", id="run-6f1d7c2e-1b4f-4c5e-9d1a-0a1b2c3d4e5f"),
+    {
+        "langgraph_step": 1,
+        "langgraph_node": "agent",
+        "langgraph_triggers": ["start:agent"],
+        "langgraph_path": ("__pregel_pull", "agent"),
+        "langgraph_checkpoint_ns": "agent:1f0e1c2d-3a4b-5c6d-7e8f-9a0b1c2d3e4f",
+        "checkpoint_ns": "agent:1f0e1c2d-3a4b-5c6d-7e8f-9a0b1c2d3e4f",
+        "ls_provider": "google_vertexai",
+        "ls_model_name": "gemini-1.5-pro-002",
+        "ls_model_type": "chat",
+        "ls_temperature": 0.0,
+        "ls_max_tokens": 1024,
+    },
+)
+
+
+def previous_path() -> None:
+    """Serialization as previously done in stream_query."""
+    print(langchain_load_dump.dumpd(CHUNK))
+
+
+def compact_path() -> None:
+    """Compact encoding, serialized as it would be on the wire."""
+    dumps_chunk(encode_chunk(CHUNK))
+
+
+def main() -> None:
+    """Run the benchmark and print the per-chunk cost of both paths."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        previous = timeit.timeit(previous_path, number=NUMBER)
+    compact = timeit.timeit(compact_path, number=NUMBER)
+    print(f"dumpd + print:  {previous / NUMBER * 1e6:8.2f} us/chunk")
+    print(f"compact encode: {compact / NUMBER * 1e6:8.2f} us/chunk")
+    print(f"speedup:        {previous / compact:8.1f}x")
+    print(f"wire size:      {len(str(langchain_load_dump.dumpd(CHUNK)))} -> "
+          f"{len(dumps_chunk(encode_chunk(CHUNK)))} bytes")
+
+
+if __name__ == "__main__":
+    main()
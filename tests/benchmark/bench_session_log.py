@@ -0,0 +1,61 @@
+"""
+Time and bytes written per turn to persist a growing chat session, when the
+whole session is rewritten as YAML and with the append-only session log.
+
+Usage:
+    uv run python tests/benchmark/bench_session_log.py
+"""
+
+import os
+import tempfile
+import time
+from typing import Any, Dict
+
+from frontend.utils.session_log import SessionLogWriter, export_yaml
+
+ANSWER = "The weather is sunny, with a light breeze from the west. " * 20
+
+
+def add_turn(session: Dict[str, Any], turn: int) -> None:
+    """Add a question and its answer to the session."""
+    session["messages"] = session["messages"] + [
+        {"type": "human", "content": f"question {turn}", "additional_kwargs": {}},
+        {"type": "ai", "content": ANSWER, "additional_kwargs": {}, "id": str(turn)},
+    ]
+    session["update_time"] = f"2024-01-01T00:00:{turn:02d}"
+
+
+def main() -> None:
+    """Run the benchmark."""
+    for turns in (20, 100):
+        with tempfile.TemporaryDirectory() as directory:
+            yaml_path = os.path.join(directory, "session.yaml")
+            log_path = os.path.join(directory, "session.jsonl")
+            writer = SessionLogWriter(log_path)
+            yaml_session: Dict[str, Any] = {"title": "Chat", "messages": []}
+            log_session: Dict[str, Any] = {"title": "Chat", "messages": []}
+            yaml_seconds = log_seconds = 0.0
+            yaml_bytes = log_bytes = 0
+            for turn in range(turns):
+                add_turn(yaml_session, turn)
+                started = time.perf_counter()
+                export_yaml(yaml_session, yaml_path)
+                yaml_seconds += time.perf_counter() - started
+                yaml_bytes += os.path.getsize(yaml_path)
+
+                add_turn(log_session, turn)
+                size = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+                started = time.perf_counter()
+                writer.write(log_session)
+                log_seconds += time.perf_counter() - started
+                log_bytes += os.path.getsize(log_path) - size
+        print(
+            f"{turns:3d} turns: YAML rewrite {yaml_seconds / turns * 1e3:6.2f} ms/turn "
+            f"{yaml_bytes / 1024:7.0f} KB written, "
+            f"log {log_seconds / turns * 1e3:5.2f} ms/turn "
+            f"{log_bytes / 1024:4.0f} KB written"
+        )
+
+
+if __name__ == "__main__":
+    main()
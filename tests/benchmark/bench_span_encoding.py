@@ -0,0 +1,76 @@
+"""
+Microseconds per span to turn a span into a log entry and measure its size.
+
+Compares the JSON round trip (``span.to_json()``, ``json.loads``, then
+``json.dumps`` of the attributes to check their size and of the payload
+stored in GCS) with the single-pass encoding of
+`CloudTraceLoggingSpanExporter.export`.
+
+Usage:
+    uv run python tests/benchmark/bench_span_encoding.py
+"""
+
+import json
+import timeit
+from typing import List
+
+from app.utils.span_encoding import (
+    encode_attributes,
+    encoded_size,
+    entry_size,
+    join_encoded,
+    span_to_dict,
+)
+from app.utils.tracing import MAX_ATTRIBUTES_BYTES
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+
+ITERATIONS = 20
+
+
+def make_spans(prompt_chars: int, count: int = 100) -> List[ReadableSpan]:
+    """Create finished spans with a prompt attribute of the given size."""
+    tracer = TracerProvider().get_tracer(__name__)
+    spans = []
+    for index in range(count):
+        with tracer.start_as_current_span(f"span-{index}") as span:
+            span.set_attribute("gen_ai.prompt.0.content", "x" * prompt_chars)
+            span.set_attribute("gen_ai.completion.0.content", "Sunny, 21°C.\n" * 10)
+            span.set_attribute("traceloop.association.properties.session_id", "s")
+        spans.append(span)
+    return spans
+
+
+def round_trip(spans: List[ReadableSpan]) -> None:
+    """Previous behavior."""
+    for span in spans:
+        span_json = span.to_json()
+        span_dict = json.loads(span_json)
+        if len(json.dumps(span_dict["attributes"]).encode()) > 255 * 1024:
+            json.dumps(span_dict["attributes"])
+
+
+def single_pass(spans: List[ReadableSpan]) -> None:
+    """Single-pass encoding with incremental size accounting, as exported."""
+    for span in spans:
+        span_dict = span_to_dict(span)
+        encoded_attributes = encode_attributes(span_dict["attributes"])
+        attributes_size = encoded_size(encoded_attributes)
+        if attributes_size > MAX_ATTRIBUTES_BYTES:
+            join_encoded(encoded_attributes)
+        entry_size(span_dict, attributes_size)
+
+
+def main() -> None:
+    """Run the benchmark."""
+    for prompt_chars in (1_000, 100_000, 400_000):
+        spans = make_spans(prompt_chars)
+        for name, encode in (("round-trip", round_trip), ("single-pass", single_pass)):
+            seconds = timeit.timeit(lambda: encode(spans), number=ITERATIONS)
+            print(
+                f"{prompt_chars:>7} chars {name:<12} "
+                f"{seconds / ITERATIONS / len(spans) * 1e6:10.2f} µs/span"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Spans/sec of CloudTraceLoggingSpanExporter against fake Cloud Logging and
+Cloud Trace clients with a fixed per-RPC latency.
+
+Compares one log_struct RPC per span followed by the Cloud Trace export (the
+previous behavior) with the bulk, concurrent export.
+
+Usage:
+    uv run python tests/benchmark/bench_span_export.py
+"""
+
+import json
+import time
+from typing import Any, List
+from unittest.mock import Mock, patch
+
+from app.utils.tracing import CloudTraceLoggingSpanExporter
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+
+RPC_LATENCY_SECONDS = 0.005
+BATCH_SIZE = 512
+BATCHES = 4
+
+
+class FakeBatch:
+    """Cloud Logging batch issuing a single write on commit."""
+
+    def __init__(self, logger: "FakeLogger") -> None:
+        self.logger = logger
+        self.entries: List[Any] = []
+
+    def log_struct(self, info: Any, **_: Any) -> None:
+        self.entries.append(info)
+
+    def commit(self) -> None:
+        time.sleep(RPC_LATENCY_SECONDS)
+        self.logger.rpcs += 1
+
+
+class FakeLogger:
+    """Cloud Logging logger counting write RPCs."""
+
+    def __init__(self) -> None:
+        self.rpcs = 0
+
+    def log_struct(self, info: Any, **_: Any) -> None:
+        time.sleep(RPC_LATENCY_SECONDS)
+        self.rpcs += 1
+
+    def batch(self) -> FakeBatch:
+        return FakeBatch(self)
+
+
+class FakeTraceClient:
+    """Cloud Trace client with a fixed latency per batch write."""
+
+    def batch_write_spans(self, **_: Any) -> None:
+        time.sleep(RPC_LATENCY_SECONDS)
+
+
+def make_spans(count: int) -> List[ReadableSpan]:
+    """Create finished spans with LLM-like attributes."""
+    tracer = TracerProvider().get_tracer(__name__)
+    spans = []
+    for index in range(count):
+        with tracer.start_as_current_span(f"span-{index}") as span:
+            span.set_attribute("gen_ai.prompt.0.content", "What's the weather? " * 20)
+            span.set_attribute("traceloop.association.properties.session_id", "s")
+        spans.append(span)
+    return spans
+
+
+def make_exporter(logger: FakeLogger) -> CloudTraceLoggingSpanExporter:
+    """Create an exporter wired to the fake clients."""
+    logging_client = Mock()
+    logging_client.logger.return_value = logger
+    return CloudTraceLoggingSpanExporter(
+        project_id="bench-project",
+        client=FakeTraceClient(),
+        logging_client=logging_client,
+        storage_client=Mock(),
+        bucket_name="bench-bucket",
+    )
+
+
+def per_span_export(
+    exporter: CloudTraceLoggingSpanExporter, spans: List[ReadableSpan]
+) -> None:
+    """Previous behavior: one synchronous log RPC per span, then Cloud Trace."""
+    for span in spans:
+        span_dict = json.loads(span.to_json())
+        exporter.logger.log_struct(span_dict, severity="INFO")
+    exporter.client.batch_write_spans(request=None)
+
+
+def run(name: str, export: Any, logger: FakeLogger, spans: List[ReadableSpan]) -> None:
+    """Time BATCHES exports and print the throughput."""
+    started = time.perf_counter()
+    for _ in range(BATCHES):
+        export(spans)
+    elapsed = time.perf_counter() - started
+    print(
+        f"{name:<10} {BATCH_SIZE * BATCHES / elapsed:10.0f} spans/s "
+        f"{logger.rpcs:6d} logging RPCs"
+    )
+
+
+def main() -> None:
+    """Run the benchmark."""
+    spans = make_spans(BATCH_SIZE)
+    with patch("google.auth.default", return_value=(Mock(), "bench-project")):
+        legacy_logger, bulk_logger = FakeLogger(), FakeLogger()
+        legacy = make_exporter(legacy_logger)
+        bulk = make_exporter(bulk_logger)
+        # Translation to Cloud Trace protos is not what is being measured
+        legacy._translate_to_cloud_trace = bulk._translate_to_cloud_trace = Mock(
+            return_value=[]
+        )
+        run("per-span", lambda s: per_span_export(legacy, s), legacy_logger, spans)
+        run("bulk", bulk.export, bulk_logger, spans)
+        bulk.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Render calls and characters sent to the browser to stream one answer, when
+every token repaints the answer and with repaints capped by
+`RENDER_INTERVAL_MS`.
+
+Tokens arrive every 20 ms, as on a fast model; time is simulated.
+
+Usage:
+    uv run python tests/benchmark/bench_stream_render.py
+"""
+
+from unittest.mock import Mock
+
+from frontend.utils.stream_handler import RENDER_INTERVAL_MS, StreamHandler
+
+TOKEN = "word "
+TOKEN_INTERVAL_SECONDS = 0.02
+
+
+class SimulatedClock:
+    """Clock advanced by the benchmark."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def stream(tokens: int, render_interval_ms: float) -> Mock:
+    """Stream an answer, returning the Streamlit container mock."""
+    clock = SimulatedClock()
+    handler = StreamHandler(Mock(), render_interval_ms=render_interval_ms, clock=clock)
+    for _ in range(tokens):
+        handler.new_token(TOKEN)
+        clock.now += TOKEN_INTERVAL_SECONDS
+    handler.flush()
+    return handler.container
+
+
+def main() -> None:
+    """Run the benchmark."""
+    for tokens in (200, 1000, 4000):
+        results = []
+        for interval in (0.0, RENDER_INTERVAL_MS):
+            container = stream(tokens, interval)
+            chars = sum(len(c.args[0]) for c in container.markdown.call_args_list)
+            results.append((container.markdown.call_count, chars))
+        (before_calls, before_chars), (after_calls, after_chars) = results
+        print(
+            f"{tokens:5d} tokens: per token {before_calls:5d} renders "
+            f"{before_chars / 1e6:7.2f} M chars, capped {after_calls:4d} renders "
+            f"{after_chars / 1e6:6.2f} M chars"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -31,9 +31,11 @@ def test_agent_stream_query(agent_app):
     assert len(chunks) > 0, "Expected at least one chunk in response"
 
     for chunk in chunks:
-        assert isinstance(chunk, dict), f"Expected dict chunk, got {type(chunk)}"
-        # The chunk structure includes nested agent messages
-        assert any(key in chunk for key in ["agent", "tools"]), f"Expected agent or tool in chunk, got {chunk}"
+        # Each chunk is a compact [message, metadata] pair
+        assert isinstance(chunk, list), f"Expected list chunk, got {type(chunk)}"
+        message, metadata = chunk
+        assert "type" in message and "content" in message, f"Unexpected message {message}"
+        assert metadata.get("langgraph_node") in ["agent", "tools"], f"Expected agent or tool in chunk, got {chunk}"
         
     logging.info("All assertions passed for agent stream query test")
 
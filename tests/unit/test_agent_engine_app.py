@@ -0,0 +1,408 @@
+# pylint: disable=W0621, W0212
+
+import asyncio
+import threading
+import types
+from pathlib import Path
+from typing import Any, Dict, List
+from unittest.mock import Mock, patch
+
+from app.agent_engine_app import AgentEngineApp
+from app.utils.cache import ResponseCache
+from app.utils.checkpoint import SQLiteCheckpointSaver
+from app.utils.export_queue import SpillingSpanProcessor
+from app.utils.feedback_queue import FeedbackQueue
+from app.utils.sampling import TailSamplingSpanProcessor
+from opentelemetry.sdk.metrics.export import MetricExporter, MetricExportResult
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.graph import END, MessagesState, StateGraph
+from vertexai.reasoning_engines import _reasoning_engines
+import pytest
+
+
+def build_fake_agent(responses: List[str], checkpointer: Any = None) -> Any:
+    """Build a single-node graph backed by a fake chat model."""
+    llm = GenericFakeChatModel(messages=iter([AIMessage(content=r) for r in responses]))
+
+    def call_model(
+        state: MessagesState, config: RunnableConfig
+    ) -> Dict[str, BaseMessage]:
+        return {"messages": llm.invoke(state["messages"], config)}
+
+    async def acall_model(
+        state: MessagesState, config: RunnableConfig
+    ) -> Dict[str, BaseMessage]:
+        return {"messages": await llm.ainvoke(state["messages"], config)}
+
+    workflow = StateGraph(MessagesState)
+    workflow.add_node("agent", RunnableLambda(call_model, afunc=acall_model))
+    workflow.set_entry_point("agent")
+    workflow.add_edge("agent", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def build_echo_agent() -> Any:
+    """Build a graph answering with the content of the last message."""
+
+    def echo(state: MessagesState) -> Dict[str, BaseMessage]:
+        content = state["messages"][-1].content
+        if content == "fail":
+            raise ValueError("echo failed")
+        return {"messages": AIMessage(content=f"echo: {content}")}
+
+    workflow = StateGraph(MessagesState)
+    workflow.add_node("agent", echo)
+    workflow.set_entry_point("agent")
+    workflow.add_edge("agent", END)
+    return workflow.compile()
+
+
+@pytest.fixture
+def agent_app() -> AgentEngineApp:
+    """Create an AgentEngineApp wired to a fake graph, skipping set_up."""
+    app = AgentEngineApp()
+    app.runnable = build_fake_agent(["Hello world", "Second answer"])
+    return app
+
+
+def make_input() -> Dict[str, Any]:
+    """Build a minimal request payload."""
+    return {
+        "messages": [{"type": "human", "content": "Hi"}],
+        "user_id": "test-user",
+        "session_id": "test-session",
+    }
+
+
+def test_register_operations_are_supported_by_sdk(agent_app: AgentEngineApp) -> None:
+    """Test the SDK generates and registers the methods of every operation."""
+    operations = agent_app.register_operations()
+    schemas = _reasoning_engines._generate_class_methods_spec_or_raise(
+        agent_app, operations
+    )
+    remote_agent = types.SimpleNamespace(
+        operation_schemas=lambda: [
+            _reasoning_engines._utils.to_dict(schema) for schema in schemas
+        ]
+    )
+    _reasoning_engines._register_api_methods_or_raise(remote_agent)
+    for method_names in operations.values():
+        for method_name in method_names:
+            assert callable(getattr(remote_agent, method_name))
+
+
+def test_async_stream_query(agent_app: AgentEngineApp) -> None:
+    """Test async_stream_query yields the same chunks as stream_query."""
+
+    async def collect() -> List[Any]:
+        return [chunk async for chunk in agent_app.async_stream_query(input=make_input())]
+
+    chunks = asyncio.run(collect())
+    assert len(chunks) > 0
+    content = "".join(chunk[0]["content"] for chunk in chunks)
+    assert content == "Hello world"
+
+
+def test_async_query(agent_app: AgentEngineApp) -> None:
+    """Test async_query returns the final graph state."""
+    response = asyncio.run(agent_app.async_query(input=make_input()))
+    assert response["messages"][-1]["kwargs"]["content"] == "Hello world"
+
+
+def test_stream_query_coalesces_tokens(agent_app: AgentEngineApp) -> None:
+    """Test stream_query merges tokens without altering the answer."""
+    agent_app.runnable = build_fake_agent(["one two three four five six"])
+    agent_app.stream_window_bytes = 8
+    chunks = list(agent_app.stream_query(input=make_input()))
+    assert "".join(chunk[0]["content"] for chunk in chunks) == (
+        "one two three four five six"
+    )
+    assert len(chunks) < 11
+
+
+def make_batch_inputs() -> List[Dict[str, Any]]:
+    """Build a batch where the second item fails."""
+    return [
+        {"messages": [{"type": "human", "content": text}], "user_id": "test-user"}
+        for text in ["a", "fail", "c"]
+    ]
+
+
+def test_batch_query_returns_ordered_results_and_errors(
+    agent_app: AgentEngineApp,
+) -> None:
+    """Test batch_query keeps input order and reports per item errors."""
+    agent_app.runnable = build_echo_agent()
+    results = agent_app.batch_query(inputs=make_batch_inputs(), max_concurrency=2)
+    assert results[0]["messages"][-1]["kwargs"]["content"] == "echo: a"
+    assert results[1] == {"error": {"type": "ValueError", "message": "echo failed"}}
+    assert results[2]["messages"][-1]["kwargs"]["content"] == "echo: c"
+
+
+def test_batch_query_leaves_inputs_untouched(agent_app: AgentEngineApp) -> None:
+    """Test the user and session IDs are moved to metadata on copies of the items."""
+    agent_app.runnable = build_echo_agent()
+    inputs = make_batch_inputs()
+    agent_app.batch_query(inputs=inputs)
+    assert inputs == make_batch_inputs()
+
+
+def test_async_batch_query(agent_app: AgentEngineApp) -> None:
+    """Test async_batch_query mirrors batch_query."""
+    agent_app.runnable = build_echo_agent()
+    results = asyncio.run(agent_app.async_batch_query(inputs=make_batch_inputs()))
+    assert [result.get("error", {}).get("type") for result in results] == [
+        None,
+        "ValueError",
+        None,
+    ]
+
+
+def test_response_cache_replays_stream_and_query(agent_app: AgentEngineApp) -> None:
+    """Test cached responses are served without calling the graph again."""
+    agent_app.response_cache = ResponseCache()
+    first_stream = list(agent_app.stream_query(input=make_input()))
+    first_query = agent_app.query(input=make_input())
+
+    # The fake model has no responses left: any cache miss would fail
+    agent_app.runnable = build_fake_agent([])
+    assert list(agent_app.stream_query(input=make_input())) == first_stream
+    assert agent_app.query(input=make_input()) == first_query
+    assert agent_app.response_cache.hits == 2
+
+
+def test_server_side_session_state(agent_app: AgentEngineApp, tmp_path: Path) -> None:
+    """Test clients only need to send the new message when sessions are on."""
+    agent_app.session_store_path = str(tmp_path / "sessions.sqlite")
+    agent_app.response_cache = ResponseCache()
+    agent_app.checkpointer = agent_app.create_checkpointer()
+    assert isinstance(agent_app.checkpointer, SQLiteCheckpointSaver)
+    agent_app.runnable = build_fake_agent(
+        ["Hello world", "Second answer"], checkpointer=agent_app.checkpointer
+    )
+
+    agent_app.query(input=make_input())
+    response = agent_app.query(input=make_input())
+    contents = [message["kwargs"]["content"] for message in response["messages"]]
+    assert contents == ["Hi", "Hello world", "Hi", "Second answer"]
+    # Session-bound requests bypass the response cache
+    assert agent_app.response_cache.hits == 0
+
+
+def test_sessions_are_scoped_to_the_user(
+    agent_app: AgentEngineApp, tmp_path: Path
+) -> None:
+    """Test another user sending the same session ID starts a new conversation."""
+    agent_app.session_store_path = str(tmp_path / "sessions.sqlite")
+    agent_app.checkpointer = agent_app.create_checkpointer()
+    agent_app.runnable = build_fake_agent(
+        ["Hello world", "Second answer"], checkpointer=agent_app.checkpointer
+    )
+
+    agent_app.query(input=make_input())
+    response = agent_app.query(input={**make_input(), "user_id": "other-user"})
+    contents = [message["kwargs"]["content"] for message in response["messages"]]
+    assert contents == ["Hi", "Second answer"]
+
+
+class FakeCloudMonitoringExporter(MetricExporter):
+    """Metric exporter recording the exported metrics."""
+
+    instances: List["FakeCloudMonitoringExporter"] = []
+
+    def __init__(self, project_id: str) -> None:
+        super().__init__()
+        self.project_id = project_id
+        self.exported: List[Any] = []
+        self.instances.append(self)
+
+    def export(self, metrics_data: Any, **kwargs: Any) -> MetricExportResult:
+        self.exported.append(metrics_data)
+        return MetricExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis: float = 10_000) -> bool:
+        return True
+
+    def shutdown(self, timeout_millis: float = 30_000, **kwargs: Any) -> None:
+        pass
+
+
+def test_set_up_instruments_before_importing_agent() -> None:
+    """Test the agent is imported once instrumented, with clients created aside."""
+    events = []
+
+    def import_workflow(name: str) -> Any:
+        if name != "workflow":
+            raise AttributeError(name)
+        events.append("import agent")
+        return build_fake_agent([]).builder
+
+    fake_agent_module = types.ModuleType("app.agent")
+    fake_agent_module.LLM = "fake-model"
+    fake_agent_module.TEMPERATURE = 0
+    fake_agent_module.__getattr__ = import_workflow  # type: ignore[attr-defined]
+
+    with patch.dict("sys.modules", {"app.agent": fake_agent_module}), patch(
+        "app.agent_engine_app.Traceloop.init",
+        side_effect=lambda **_: events.append("instrument"),
+    ), patch(
+        "app.agent_engine_app.CloudTraceLoggingSpanExporter"
+    ) as exporter_class, patch(
+        "app.agent_engine_app.CloudMonitoringMetricsExporter",
+        FakeCloudMonitoringExporter,
+    ), patch(
+        "app.agent_engine_app.google_cloud_logging.Client"
+    ) as logging_client:
+        exporter_class.return_value.create_clients.side_effect = (
+            lambda: events.append(threading.current_thread())
+        )
+        app = AgentEngineApp()
+        app.set_up()
+        # The logging client is only created when first needed
+        logging_client.assert_not_called()
+
+    assert events.index("instrument") < events.index("import agent")
+    client_threads = [e for e in events if isinstance(e, threading.Thread)]
+    assert client_threads and client_threads[0] is not threading.main_thread()
+    assert set(app.startup_report["phases"]) == {
+        "agent",
+        "exporter_clients",
+        "telemetry",
+    }
+    assert app.model_settings == {"model": "fake-model", "temperature": 0}
+    app.span_queue.shutdown()
+
+
+def test_exporter_metrics_go_to_cloud_monitoring() -> None:
+    """Test the span exporter metrics are exported to Cloud Monitoring."""
+    FakeCloudMonitoringExporter.instances.clear()
+    with patch(
+        "app.agent_engine_app.CloudMonitoringMetricsExporter",
+        FakeCloudMonitoringExporter,
+    ):
+        app = AgentEngineApp(project_id="test-project")
+        meter_provider = app.create_meter_provider()
+    assert meter_provider is not None
+    meter_provider.get_meter("test").create_counter("spans").add(1)
+    meter_provider.force_flush()
+    (exporter,) = FakeCloudMonitoringExporter.instances
+    assert exporter.project_id == "test-project"
+    assert exporter.exported
+    meter_provider.shutdown()
+
+
+def test_shutdown_flushes_spans_and_feedback(agent_app: AgentEngineApp) -> None:
+    """Test shutting the app down stops its span and feedback queues."""
+    span_exporter = Mock()
+    agent_app.span_queue = SpillingSpanProcessor(span_exporter)
+    agent_app._logger = Mock()
+    agent_app.register_feedback({"score": 1, "run_id": "run-1"})
+    agent_app.shutdown()
+    # Shutting down again, e.g. at exit, returns right away
+    agent_app.shutdown()
+    span_exporter.shutdown.assert_called_once()
+    # Queued feedback is written before the queue stops
+    agent_app._logger.batch.return_value.commit.assert_called_once()
+
+
+def test_set_up_installs_tail_sampler() -> None:
+    """Test a sample rate below 1 puts the tail sampler in front of the exporter."""
+    fake_agent_module = types.ModuleType("app.agent")
+    fake_agent_module.LLM = "fake-model"
+    fake_agent_module.TEMPERATURE = 0
+    fake_agent_module.workflow = build_fake_agent([]).builder
+
+    with patch.dict("sys.modules", {"app.agent": fake_agent_module}), patch(
+        "app.agent_engine_app.Traceloop.init"
+    ) as traceloop_init, patch(
+        "app.agent_engine_app.CloudTraceLoggingSpanExporter"
+    ), patch(
+        "app.agent_engine_app.CloudMonitoringMetricsExporter",
+        FakeCloudMonitoringExporter,
+    ):
+        app = AgentEngineApp(trace_sample_rate=0.1)
+        app.set_up()
+
+    assert isinstance(app.span_sampler, TailSamplingSpanProcessor)
+    assert app.span_sampler.sample_rate == 0.1
+    assert app.span_sampler.next_processor is app.span_queue
+    assert traceloop_init.call_args.kwargs["processor"] is app.span_sampler
+    app.span_queue.shutdown()
+
+
+def test_set_up_exports_through_spilling_queue(tmp_path: Path) -> None:
+    """Test spans are exported through the bounded queue spilling to disk."""
+    fake_agent_module = types.ModuleType("app.agent")
+    fake_agent_module.LLM = "fake-model"
+    fake_agent_module.TEMPERATURE = 0
+    fake_agent_module.workflow = build_fake_agent([]).builder
+    spill_path = str(tmp_path / "spans.spill")
+
+    with patch.dict("sys.modules", {"app.agent": fake_agent_module}), patch(
+        "app.agent_engine_app.Traceloop.init"
+    ) as traceloop_init, patch(
+        "app.agent_engine_app.CloudTraceLoggingSpanExporter"
+    ), patch(
+        "app.agent_engine_app.CloudMonitoringMetricsExporter",
+        FakeCloudMonitoringExporter,
+    ):
+        app = AgentEngineApp(trace_spill_path=spill_path)
+        app.set_up()
+
+    assert isinstance(app.span_queue, SpillingSpanProcessor)
+    assert app.span_queue.spill.path == spill_path
+    assert app.span_sampler is None
+    assert traceloop_init.call_args.kwargs["processor"] is app.span_queue
+    app.span_queue.shutdown()
+
+
+def test_register_feedback_keeps_trace() -> None:
+    """Test feedback marks the trace of its run to be kept."""
+    app = AgentEngineApp()
+    app._logger = Mock()
+    app.span_sampler = Mock()
+    app.register_feedback({"score": 1, "run_id": "run-1"})
+    app.span_sampler.keep_run.assert_called_once_with("run-1")
+    assert app.feedback_queue.flush(5)
+    app._logger.batch.return_value.log_struct.assert_called_once()
+    app.feedback_queue.shutdown()
+
+
+def test_register_feedback_batches_records() -> None:
+    """Test a list of feedback is validated up front and written in one request."""
+    app = AgentEngineApp()
+    app._logger = Mock()
+    with pytest.raises(ValueError):
+        app.register_feedback(
+            [{"score": 1, "run_id": "run-1"}, {"score": "bad", "run_id": "run-2"}]
+        )
+    app.register_feedback(
+        [{"score": 1, "run_id": "run-1"}, {"score": 0, "text": "no", "run_id": "run-2"}]
+    )
+    app.feedback_queue.shutdown()
+    batch = app._logger.batch.return_value
+    assert [call.args[0]["run_id"] for call in batch.log_struct.call_args_list] == [
+        "run-1",
+        "run-2",
+    ]
+    batch.commit.assert_called_once()
+
+
+def test_register_feedback_reports_dropped_records() -> None:
+    """Test feedback that does not fit in the queue is reported to the caller."""
+    app = AgentEngineApp()
+    app._logger = Mock()
+    app._feedback_queue = FeedbackQueue(
+        app._write_feedback, max_queue_size=1, flush_interval_seconds=60
+    )
+    with pytest.raises(RuntimeError, match="queued the first 1 of 2 records"):
+        app.register_feedback(
+            [{"score": 1, "run_id": "run-1"}, {"score": 0, "run_id": "run-2"}]
+        )
+    app.feedback_queue.shutdown()
+    batch = app._logger.batch.return_value
+    assert [call.args[0]["run_id"] for call in batch.log_struct.call_args_list] == [
+        "run-1"
+    ]
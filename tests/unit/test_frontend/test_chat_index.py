@@ -0,0 +1,72 @@
+# pylint: disable=W0621
+
+from pathlib import Path
+from typing import Dict, List
+
+from frontend.utils.chat_index import ChatIndex
+import pytest
+
+
+@pytest.fixture
+def index(tmp_path: Path) -> ChatIndex:
+    """An empty chat index."""
+    return ChatIndex(str(tmp_path / "chats" / "index.sqlite"))
+
+
+def session(title: str, update_time: str, messages: int) -> Dict:
+    """Create a session with the given number of messages."""
+    return {
+        "title": title,
+        "update_time": update_time,
+        "messages": [{"type": "human", "content": "hi"}] * messages,
+    }
+
+
+def test_list_sessions_by_update_time(index: ChatIndex) -> None:
+    """Test sessions are listed oldest first, without their messages."""
+    index.upsert("user", "b", session("Second", "2024-01-02T00:00:00", 4))
+    index.upsert("user", "a", session("First", "2024-01-01T00:00:00", 2))
+    index.upsert("other", "c", session("Other user", "2024-01-03T00:00:00", 1))
+    sessions = index.list("user")
+    assert list(sessions) == ["a", "b"]
+    assert sessions["a"] == {
+        "title": "First",
+        "update_time": "2024-01-01T00:00:00",
+        "message_count": 2,
+    }
+    assert sessions["b"]["message_count"] == 4
+
+
+def test_upsert_updates_and_delete_removes(index: ChatIndex) -> None:
+    """Test entries are replaced on write and removed on delete."""
+    index.upsert("user", "a", session("Chat", "2024-01-01T00:00:00", 2))
+    index.upsert("user", "a", session("Renamed", "2024-01-05T00:00:00", 6))
+    assert index.list("user")["a"]["title"] == "Renamed"
+    assert index.list("user")["a"]["message_count"] == 6
+    index.delete("user", "a")
+    assert index.list("user") == {}
+
+
+def test_sync_loads_only_missing_sessions(index: ChatIndex) -> None:
+    """Test sync indexes sessions saved without the index and drops deleted ones."""
+    index.upsert("user", "indexed", session("Indexed", "2024-01-02T00:00:00", 1))
+    index.upsert("user", "deleted", session("Deleted", "2024-01-03T00:00:00", 1))
+    loaded: List[str] = []
+
+    def load_session(session_id: str) -> Dict:
+        loaded.append(session_id)
+        return {"messages": [{"type": "human", "content": "hi"}]}
+
+    index.sync("user", ["indexed", "legacy"], load_session)
+    assert loaded == ["legacy"]
+    assert index.list("user") == {
+        "legacy": {"title": "legacy", "message_count": 1},
+        "indexed": {
+            "title": "Indexed",
+            "update_time": "2024-01-02T00:00:00",
+            "message_count": 1,
+        },
+    }
+    # Already indexed sessions are not loaded again
+    index.sync("user", ["indexed", "legacy"], load_session)
+    assert loaded == ["legacy"]
@@ -0,0 +1,91 @@
+# pylint: disable=W0621
+
+import os
+from pathlib import Path
+import sys
+from typing import Generator
+
+from frontend.utils.local_agents import (
+    LOCAL_SESSION_STORE_PATH,
+    get_local_agent,
+    invalidate_local_agents,
+)
+import pytest
+
+AGENT_SOURCE = '''
+VERSION = {version}
+
+
+class Agent:
+    def __init__(self, session_store_path=None):
+        self.session_store_path = session_store_path
+        self.version = VERSION
+        self.set_up_calls = 0
+        self.shutdown_calls = 0
+
+    def set_up(self):
+        self.set_up_calls += 1
+
+    def shutdown(self):
+        self.shutdown_calls += 1
+'''
+AGENT_PATH = "fake_agent_pkg.agent.Agent"
+
+
+def write_agent(package: Path, version: int) -> None:
+    """Write the agent module, with a modification time that always changes."""
+    module = package / "agent.py"
+    module.write_text(AGENT_SOURCE.format(version=version))
+    mtime = 1_700_000_000 + version
+    os.utime(module, (mtime, mtime))
+
+
+@pytest.fixture
+def package(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> Generator[Path, None, None]:
+    """An importable package holding an agent class."""
+    package = tmp_path / "fake_agent_pkg"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    write_agent(package, version=1)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield package
+    invalidate_local_agents()
+    sys.modules.pop("fake_agent_pkg", None)
+
+
+def test_agent_is_set_up_once(package: Path) -> None:
+    """Test the same set-up agent is returned on every turn."""
+    agent = get_local_agent(AGENT_PATH)
+    assert get_local_agent(AGENT_PATH) is agent
+    assert agent.set_up_calls == 1
+    assert agent.session_store_path is None
+
+
+def test_agents_are_keyed_by_session_mode(package: Path) -> None:
+    """Test agents keeping server-side sessions are separate instances."""
+    agent = get_local_agent(AGENT_PATH, server_side_sessions=True)
+    assert agent.session_store_path == LOCAL_SESSION_STORE_PATH
+    assert get_local_agent(AGENT_PATH) is not agent
+
+
+def test_source_change_reloads_agent(package: Path) -> None:
+    """Test an edited agent module is imported again."""
+    agent = get_local_agent(AGENT_PATH)
+    write_agent(package, version=2)
+    reloaded = get_local_agent(AGENT_PATH)
+    assert reloaded is not agent
+    assert (agent.version, reloaded.version) == (1, 2)
+    assert get_local_agent(AGENT_PATH) is reloaded
+    # The replaced agent flushed its queues, the new one is still running
+    assert (agent.shutdown_calls, reloaded.shutdown_calls) == (1, 0)
+
+
+def test_invalidate_local_agents(package: Path) -> None:
+    """Test invalidated agents are created and set up again."""
+    agent = get_local_agent(AGENT_PATH)
+    invalidate_local_agents(AGENT_PATH)
+    assert agent.shutdown_calls == 1
+    assert "fake_agent_pkg.agent" not in sys.modules
+    assert get_local_agent(AGENT_PATH) is not agent
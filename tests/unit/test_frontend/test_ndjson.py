@@ -0,0 +1,94 @@
+import json
+import random
+from typing import Any, Iterator, List
+from unittest.mock import MagicMock, Mock
+
+from frontend.utils.ndjson import NDJSONDecoder
+from frontend.utils.stream_handler import Client
+from google.api.httpbody_pb2 import HttpBody
+from vertexai.preview import reasoning_engines
+import orjson
+import pytest
+
+EVENTS = [
+    [{"type": "AIMessageChunk", "content": f"token {i} é ✓"}, {"step": i}]
+    for i in range(50)
+] + [{"tool_calls": [{"name": "search", "args": {"query": "x" * 5000}}]}]
+
+
+def ndjson(events: List[Any]) -> bytes:
+    """Encode events as newline-delimited JSON."""
+    return b"".join(orjson.dumps(event) + b"\n" for event in events)
+
+
+def fragment(data: bytes, rng: random.Random) -> Iterator[bytes]:
+    """Split data at random positions, including inside records and characters."""
+    start = 0
+    while start < len(data):
+        end = start + rng.choice([1, 2, 3, 7, 64, 1000, 10000])
+        yield data[start:end]
+        start = end
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_decoder_randomly_fragmented_stream(seed: int) -> None:
+    """Test every event is decoded once, in order, whatever the chunk boundaries."""
+    decoder = NDJSONDecoder()
+    decoded = []
+    for chunk in fragment(ndjson(EVENTS), random.Random(seed)):
+        decoded.extend(decoder.feed(chunk))
+    decoded.extend(decoder.close())
+    assert decoded == EVENTS
+
+
+def test_decoder_yields_records_as_soon_as_complete() -> None:
+    """Test a record is returned with the chunk holding its newline."""
+    decoder = NDJSONDecoder()
+    assert decoder.feed(b'{"a": ') == []
+    assert decoder.feed(b"1}") == []
+    assert decoder.feed(b'\n{"b": 2}\n\n[3') == [{"a": 1}, {"b": 2}]
+    assert decoder.feed("]\r\n") == [[3]]
+    assert decoder.close() == []
+
+
+def test_decoder_close_returns_unterminated_record() -> None:
+    """Test a last record without newline is decoded at the end of the stream."""
+    decoder = NDJSONDecoder()
+    assert decoder.feed(b'{"a": 1}\n{"b"') == [{"a": 1}]
+    assert decoder.feed(b": 2}") == []
+    assert decoder.close() == [{"b": 2}]
+
+
+def test_decoder_invalid_record() -> None:
+    """Test malformed records raise a JSON decoding error."""
+    with pytest.raises(json.JSONDecodeError):
+        NDJSONDecoder().feed(b"{oops}\n")
+
+
+def test_stream_events_decodes_http_body_chunks() -> None:
+    """Test events split across HttpBody chunks, or sharing one, are all yielded."""
+    client = Client.__new__(Client)
+    chunks = fragment(ndjson(EVENTS), random.Random(0))
+    client.agent = Mock()
+    client.agent.stream_query.return_value = [
+        HttpBody(content_type="application/json", data=chunk) for chunk in chunks
+    ]
+    assert list(client.stream_events({"messages": []})) == EVENTS
+
+
+def test_remote_stream_can_be_cancelled() -> None:
+    """Test remote streams are read from a response that can be cancelled."""
+    client = Client.__new__(Client)
+    client._response = None
+    client.agent = Mock(spec=reasoning_engines.ReasoningEngine)
+    client.agent.resource_name = "projects/p/locations/l/reasoningEngines/1"
+    client.agent.execution_api_client = Mock()
+    stream_query = client.agent.execution_api_client.stream_query_reasoning_engine
+    response = stream_query.return_value = MagicMock()
+    response.__iter__.return_value = iter([HttpBody(data=ndjson(EVENTS))])
+
+    events = client.stream_events({"messages": []})
+    assert next(events) == EVENTS[0]
+    assert stream_query.call_args.kwargs["request"].class_method == "stream_query"
+    client.cancel_stream()
+    response.cancel.assert_called_once()
@@ -0,0 +1,96 @@
+import threading
+import time
+from typing import Iterator
+
+from frontend.utils.prefetch import prefetch
+import pytest
+
+
+def test_prefetch_yields_items_in_order() -> None:
+    """Test every item is yielded once, in order, through a small queue."""
+    assert list(prefetch(iter(range(100)), max_queue_size=4)) == list(range(100))
+
+
+def test_prefetch_reads_ahead_of_consumer() -> None:
+    """Test items are produced while the consumer is busy."""
+    produced = []
+
+    def items() -> Iterator[int]:
+        for index in range(5):
+            produced.append(index)
+            yield index
+
+    stream = prefetch(items(), max_queue_size=8)
+    assert next(stream) == 0
+    deadline = time.monotonic() + 5
+    while len(produced) < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert produced == [0, 1, 2, 3, 4]
+    assert list(stream) == [1, 2, 3, 4]
+
+
+def test_prefetch_reraises_producer_errors() -> None:
+    """Test an error of the stream reaches the consumer after the earlier items."""
+
+    def items() -> Iterator[int]:
+        yield 1
+        raise ConnectionError("stream interrupted")
+
+    stream = prefetch(items())
+    assert next(stream) == 1
+    with pytest.raises(ConnectionError, match="stream interrupted"):
+        next(stream)
+
+
+def test_prefetch_close_stops_producer() -> None:
+    """Test closing the consumer stops the producer blocked on a full queue."""
+    finished = threading.Event()
+
+    def items() -> Iterator[int]:
+        try:
+            index = 0
+            while True:
+                yield index
+                index += 1
+        finally:
+            finished.set()
+
+    stream = prefetch(items(), max_queue_size=2)
+    assert next(stream) == 0
+    stream.close()
+    assert finished.wait(5)
+
+
+def test_prefetch_close_cancels_blocked_producer() -> None:
+    """Test closing the consumer cancels a producer waiting for its next item."""
+    cancelled = threading.Event()
+    finished = threading.Event()
+
+    def items() -> Iterator[int]:
+        try:
+            yield 0
+            # Blocked reading the connection until it is closed
+            if cancelled.wait(5):
+                raise ConnectionError("connection closed")
+        finally:
+            finished.set()
+
+    stream = prefetch(items(), cancel=cancelled.set)
+    assert next(stream) == 0
+    stream.close()
+    assert cancelled.is_set()
+    assert finished.wait(5)
+
+
+def test_prefetch_complete_stream_is_not_cancelled() -> None:
+    """Test streams read to the end, or failing, are not cancelled."""
+
+    def failing() -> Iterator[int]:
+        yield 0
+        raise ConnectionError("stream interrupted")
+
+    cancelled = threading.Event()
+    assert list(prefetch(iter(range(3)), cancel=cancelled.set)) == [0, 1, 2]
+    with pytest.raises(ConnectionError):
+        list(prefetch(failing(), cancel=cancelled.set))
+    assert not cancelled.is_set()
@@ -0,0 +1,110 @@
+# pylint: disable=W0621
+
+from pathlib import Path
+import sys
+from typing import Any, Dict, List
+
+from frontend.utils.session_log import (
+    COMPACT_MIN_RECORDS,
+    SessionLogWriter,
+    iter_session_log,
+    main,
+    read_session_log,
+)
+import pytest
+import yaml
+
+
+@pytest.fixture
+def log_path(tmp_path: Path) -> str:
+    """Path of a session log."""
+    return str(tmp_path / "user" / "session.jsonl")
+
+
+def message(kind: str, content: str) -> Dict[str, Any]:
+    """Create a chat message."""
+    return {"type": kind, "content": content, "additional_kwargs": {}}
+
+
+def conversation(turns: int) -> List[Dict[str, Any]]:
+    """Create the messages of a conversation."""
+    messages = []
+    for turn in range(turns):
+        messages.append(message("human", f"question {turn}"))
+        messages.append(message("ai", f"answer {turn}"))
+    return messages
+
+
+def test_write_appends_only_changes(log_path: str) -> None:
+    """Test each turn appends its new messages and the updated fields."""
+    writer = SessionLogWriter(log_path)
+    session = {"title": "Chat", "update_time": "t1", "messages": conversation(1)}
+    assert writer.write(session) == 3
+    session["messages"] = session["messages"] + conversation(2)[2:]
+    session["update_time"] = "t2"
+    assert writer.write(session) == 3
+    # Nothing changed
+    assert writer.write(session) == 0
+    assert read_session_log(log_path) == session
+
+
+def test_write_truncates_edited_messages(log_path: str) -> None:
+    """Test edited or deleted messages are replaced from the first change on."""
+    writer = SessionLogWriter(log_path)
+    session = {"title": "Chat", "messages": conversation(3)}
+    writer.write(session)
+    session["messages"][3]["content"] = "edited answer"
+    assert writer.write(session) == 4
+    assert list(iter_session_log(log_path))[-4] == {"truncate": 3}
+    session["messages"] = session["messages"][:2]
+    writer.write(session)
+    assert read_session_log(log_path) == session
+
+
+def test_write_compacts_superseded_records(log_path: str) -> None:
+    """Test the log is rewritten once it holds mostly superseded records."""
+    writer = SessionLogWriter(log_path)
+    session: Dict[str, Any] = {"title": "Chat", "messages": conversation(1)}
+    for version in range(COMPACT_MIN_RECORDS):
+        session["update_time"] = str(version)
+        writer.write(session)
+    # Compacted to 3 records, followed by the last update
+    assert len(list(iter_session_log(log_path))) == 4
+    assert read_session_log(log_path) == session
+
+
+def test_writer_resumes_existing_log(log_path: str) -> None:
+    """Test a new writer appends to the log left by a previous process."""
+    session = {"title": "Chat", "messages": conversation(2)}
+    SessionLogWriter(log_path).write(session)
+    # A record interrupted by a crash
+    with open(log_path, "ab") as f:
+        f.write(b'{"message":{"type":"hu')
+    assert read_session_log(log_path) == session
+
+    session["messages"] = conversation(3)
+    assert SessionLogWriter(log_path).write(session) == 2
+    assert read_session_log(log_path) == session
+
+
+def test_writers_of_the_same_log_see_each_other(log_path: str) -> None:
+    """Test a writer reads the log again after another writer changed it."""
+    first_tab, second_tab = SessionLogWriter(log_path), SessionLogWriter(log_path)
+    first_tab.write({"title": "Chat", "messages": conversation(1)})
+    second_tab.write({"title": "Chat", "messages": conversation(2)})
+    # Written against the log as left by the second tab
+    session = {"title": "Chat", "messages": conversation(1)}
+    assert first_tab.write(session) == 1
+    assert read_session_log(log_path) == session
+
+
+def test_export_command(
+    log_path: str, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test a log is exported to the YAML format of saved chats."""
+    session = {"title": "Chat", "messages": conversation(1)}
+    SessionLogWriter(log_path).write(session)
+    output = tmp_path / "chat.yaml"
+    monkeypatch.setattr(sys, "argv", ["session_log", "export", log_path, str(output)])
+    main()
+    assert yaml.safe_load(output.read_text()) == [session]
@@ -0,0 +1,72 @@
+from typing import List
+from unittest.mock import Mock
+
+from frontend.utils.stream_handler import StreamHandler
+import pytest
+
+
+class FakeClock:
+    """Clock advanced manually."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    """A manual clock."""
+    return FakeClock()
+
+
+def rendered(element: Mock) -> List[str]:
+    """Markdown painted into a Streamlit element mock."""
+    return [call.args[0] for call in element.markdown.call_args_list]
+
+
+def test_tokens_are_repainted_at_most_every_interval(clock: FakeClock) -> None:
+    """Test tokens arriving within the interval are painted together."""
+    handler = StreamHandler(Mock(), render_interval_ms=100, clock=clock)
+    for token in ["Hel", "lo", " wor", "ld"]:
+        handler.new_token(token)
+        clock.now += 0.03
+    # The first token is painted right away, the next ones after 100 ms
+    assert rendered(handler.container) == ["Hel"]
+    handler.new_token("!")
+    assert rendered(handler.container) == ["Hel", "Hello world!"]
+    handler.flush()
+    assert handler.container.markdown.call_count == 2
+    assert handler.text == "Hello world!"
+
+
+def test_flush_paints_last_tokens(clock: FakeClock) -> None:
+    """Test buffered tokens are painted at the end of the stream."""
+    handler = StreamHandler(Mock(), initial_text="> ", clock=clock)
+    handler.new_token("a")
+    handler.new_token("b")
+    handler.flush()
+    assert rendered(handler.container) == ["> a", "> ab"]
+
+
+def test_status_updates_paint_buffered_tokens(clock: FakeClock) -> None:
+    """Test status updates are painted right away, after the buffered tokens."""
+    handler = StreamHandler(Mock(), render_interval_ms=100, clock=clock)
+    handler.new_token("Let me ")
+    handler.new_token("check.")
+    handler.new_status("\n\ncall 1")
+    assert rendered(handler.container) == ["Let me ", "Let me check."]
+    handler.new_status("\n\nresult 1")
+    assert rendered(handler.tool_expander) == ["\n\ncall 1", "\n\nresult 1"]
+    assert handler.tools_logs == "\n\ncall 1\n\nresult 1"
+    handler.flush()
+    assert handler.container.markdown.call_count == 2
+
+
+def test_zero_interval_paints_every_update(clock: FakeClock) -> None:
+    """Test a zero interval keeps the per-token rendering."""
+    handler = StreamHandler(Mock(), render_interval_ms=0, clock=clock)
+    for token in "abc":
+        handler.new_token(token)
+    assert rendered(handler.container) == ["a", "ab", "abc"]
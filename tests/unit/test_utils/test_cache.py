@@ -0,0 +1,115 @@
+# pylint: disable=W0621
+
+import itertools
+import pickle
+from pathlib import Path
+from unittest.mock import patch
+
+from app.utils.cache import (
+    CacheBackend,
+    InMemoryCacheBackend,
+    ResponseCache,
+    SQLiteCacheBackend,
+    make_cache_key,
+)
+from langchain_core.messages import AIMessage, HumanMessage
+import pytest
+
+MODEL_SETTINGS = {"model": "gemini-1.5-pro-002", "temperature": 0}
+
+
+def test_cache_key_ignores_ids_and_message_representation() -> None:
+    """Test equivalent histories map to the same key."""
+    as_dicts = [
+        {"type": "human", "content": "Hi", "id": "1"},
+        {
+            "type": "ai",
+            "content": "",
+            "tool_calls": [{"name": "search", "args": {"q": "sf"}, "id": "call-1"}],
+        },
+    ]
+    as_messages = [
+        HumanMessage(content="Hi"),
+        AIMessage(
+            content="",
+            id="run-2",
+            tool_calls=[{"name": "search", "args": {"q": "sf"}, "id": "call-2"}],
+        ),
+    ]
+    assert make_cache_key("query", as_dicts, MODEL_SETTINGS) == make_cache_key(
+        "query", as_messages, MODEL_SETTINGS
+    )
+
+
+def test_cache_key_depends_on_content_operation_and_model() -> None:
+    """Test the key changes with any input that influences the response."""
+    messages = [("human", "Hi")]
+    key = make_cache_key("query", messages, MODEL_SETTINGS)
+    assert key != make_cache_key("query", [("human", "Hello")], MODEL_SETTINGS)
+    assert key != make_cache_key("stream", messages, MODEL_SETTINGS)
+    assert key != make_cache_key(
+        "query", messages, {**MODEL_SETTINGS, "temperature": 1}
+    )
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend_factory(request: pytest.FixtureRequest, tmp_path: Path) -> object:
+    """Create backends of every type with the given limits."""
+
+    def factory(max_entries: int = 10, ttl_seconds: float = 60) -> object:
+        if request.param == "memory":
+            return InMemoryCacheBackend(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        return SQLiteCacheBackend(
+            path=str(tmp_path / "cache.sqlite"),
+            max_entries=max_entries,
+            ttl_seconds=ttl_seconds,
+        )
+
+    return factory
+
+
+def test_backend_lru_eviction(backend_factory: object) -> None:
+    """Test the least recently used entry is evicted first."""
+    backend = backend_factory(max_entries=2)
+    with patch("app.utils.cache.time.time", side_effect=itertools.count()):
+        backend.set("a", b"1")
+        backend.set("b", b"2")
+        assert backend.get("a") == b"1"
+        backend.set("c", b"3")
+        assert backend.get("b") is None
+        assert backend.get("a") == b"1"
+        assert backend.get("c") == b"3"
+
+
+def test_backend_ttl_expiry(backend_factory: object) -> None:
+    """Test expired entries are not returned."""
+    backend = backend_factory(ttl_seconds=10)
+    with patch("app.utils.cache.time.time", return_value=100.0):
+        backend.set("a", b"1")
+    with patch("app.utils.cache.time.time", return_value=105.0):
+        assert backend.get("a") == b"1"
+    with patch("app.utils.cache.time.time", return_value=111.0):
+        assert backend.get("a") is None
+
+
+def test_response_cache_round_trip_and_pickle(backend_factory: object) -> None:
+    """Test responses round trip, hits are counted and caches are picklable."""
+    cache = ResponseCache(backend=backend_factory())
+    assert cache.get("key") is None
+    cache.set("key", [[{"type": "AIMessageChunk", "content": "Hi"}, {}]])
+    assert cache.get("key") == [[{"type": "AIMessageChunk", "content": "Hi"}, {}]]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    restored = pickle.loads(pickle.dumps(cache))
+    assert restored.get("key") is not None
+
+
+def test_incomplete_backend_fails_on_creation() -> None:
+    """Test a backend missing a method cannot be instantiated."""
+
+    class GetOnlyBackend(CacheBackend):
+        def get(self, key: str) -> None:
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnlyBackend()  # type: ignore[abstract]
@@ -0,0 +1,102 @@
+# pylint: disable=W0621
+
+import asyncio
+from pathlib import Path
+from typing import Any, Dict
+
+from app.utils.checkpoint import SQLiteCheckpointSaver
+from langchain_core.messages import AIMessage, BaseMessage
+from langgraph.graph import END, MessagesState, StateGraph
+import pytest
+
+
+def count_messages(state: MessagesState) -> Dict[str, BaseMessage]:
+    """Answer with the number of messages seen so far."""
+    return {"messages": AIMessage(content=str(len(state["messages"])))}
+
+
+@pytest.fixture
+def saver(tmp_path: Path) -> SQLiteCheckpointSaver:
+    """Create a checkpointer backed by a temporary database."""
+    return SQLiteCheckpointSaver(path=str(tmp_path / "checkpoints.sqlite"))
+
+
+def build_graph(saver: SQLiteCheckpointSaver) -> Any:
+    """Build a single-node graph persisting its state in `saver`."""
+    workflow = StateGraph(MessagesState)
+    workflow.add_node("agent", count_messages)
+    workflow.set_entry_point("agent")
+    workflow.add_edge("agent", END)
+    return workflow.compile(checkpointer=saver)
+
+
+def thread(thread_id: str) -> Dict[str, Any]:
+    """Build the config of a conversation thread."""
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def test_state_accumulates_per_thread(saver: SQLiteCheckpointSaver) -> None:
+    """Test only new messages are needed once the thread has state."""
+    graph = build_graph(saver)
+    new_message = {"messages": [{"type": "human", "content": "hi"}]}
+    graph.invoke(new_message, thread("a"))
+    result = graph.invoke(new_message, thread("a"))
+    assert result["messages"][-1].content == "3"
+
+    result = graph.invoke(new_message, thread("b"))
+    assert result["messages"][-1].content == "1"
+
+
+def test_state_survives_new_saver_instance(saver: SQLiteCheckpointSaver) -> None:
+    """Test state is read back from disk by a fresh checkpointer."""
+    build_graph(saver).invoke({"messages": [("human", "hi")]}, thread("a"))
+    restored = SQLiteCheckpointSaver(path=saver.path)
+    state = build_graph(restored).get_state(thread("a"))
+    assert [message.content for message in state.values["messages"]] == ["hi", "1"]
+    assert len(list(restored.list(thread("a")))) > 1
+    assert len(list(restored.list(thread("a"), limit=1))) == 1
+
+
+def test_async_graph(saver: SQLiteCheckpointSaver) -> None:
+    """Test the async methods used by ainvoke/astream."""
+    graph = build_graph(saver)
+
+    async def run() -> Any:
+        await graph.ainvoke({"messages": [("human", "hi")]}, thread("a"))
+        return await graph.ainvoke({"messages": [("human", "again")]}, thread("a"))
+
+    assert asyncio.run(run())["messages"][-1].content == "3"
+
+
+def test_delete_thread(saver: SQLiteCheckpointSaver) -> None:
+    """Test deleting a thread removes its state."""
+    graph = build_graph(saver)
+    graph.invoke({"messages": [("human", "hi")]}, thread("a"))
+    saver.delete_thread("a")
+    assert saver.get_tuple(thread("a")) is None
+
+
+def test_list_limit_and_filter(saver: SQLiteCheckpointSaver) -> None:
+    """Test listing applies limit and metadata filter, newest first."""
+    graph = build_graph(saver)
+    for text in ["hi", "again"]:
+        graph.invoke({"messages": [("human", text)]}, thread("a"))
+    checkpoints = list(saver.list(thread("a")))
+    assert [c.checkpoint["id"] for c in saver.list(thread("a"), limit=2)] == [
+        c.checkpoint["id"] for c in checkpoints[:2]
+    ]
+    inputs = list(saver.list(thread("a"), filter={"source": "input"}, limit=1))
+    assert len(inputs) == 1
+    assert inputs[0].metadata["source"] == "input"
+    assert inputs[0].checkpoint["id"] == next(
+        c.checkpoint["id"] for c in checkpoints if c.metadata["source"] == "input"
+    )
+
+
+def test_list_allows_writes_while_iterating(saver: SQLiteCheckpointSaver) -> None:
+    """Test the saver can be used while a listing is in progress."""
+    graph = build_graph(saver)
+    graph.invoke({"messages": [("human", "hi")]}, thread("a"))
+    for _ in saver.list(thread("a")):
+        graph.invoke({"messages": [("human", "hi")]}, thread("b"))
+    assert saver.get_tuple(thread("b")) is not None
@@ -0,0 +1,118 @@
+from typing import Any, Dict, List
+from unittest.mock import Mock
+
+from app.utils.context import (
+    ContextWindow,
+    approximate_token_count,
+    emit_context_stats,
+    with_context_stats,
+)
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph import END, MessagesState, StateGraph
+
+
+def one_token_per_character(message: BaseMessage) -> int:
+    """Deterministic token counter for tests."""
+    return len(message.content)
+
+
+def make_conversation() -> List[BaseMessage]:
+    """Build a conversation with a tool loop in the last turn."""
+    return [
+        HumanMessage(content="aaaa", id="1"),
+        AIMessage(content="bbbb", id="2"),
+        HumanMessage(content="cc", id="3"),
+        AIMessage(
+            content="",
+            id="4",
+            tool_calls=[{"name": "search", "args": {}, "id": "call-1"}],
+        ),
+        ToolMessage(content="dd", tool_call_id="call-1", id="5"),
+        AIMessage(content="e", id="6"),
+    ]
+
+
+def test_conversation_within_budget_is_untouched() -> None:
+    """Test nothing is dropped when the history fits."""
+    window = ContextWindow(max_tokens=100, token_counter=one_token_per_character)
+    messages = make_conversation()
+    kept, stats = window.trim(messages)
+    assert kept == messages
+    assert stats == {"kept_tokens": 13, "dropped_tokens": 0, "dropped_messages": 0}
+
+
+def test_trim_keeps_tool_call_and_result_together() -> None:
+    """Test the window opens on a human message, never on a tool result."""
+    window = ContextWindow(max_tokens=4, token_counter=one_token_per_character)
+    kept, _ = window.trim(make_conversation())
+    # No human message fits: the window opens on the tool call, not its result
+    assert [message.id for message in kept] == ["4", "5", "6"]
+
+    window = ContextWindow(max_tokens=6, token_counter=one_token_per_character)
+    kept, stats = window.trim(make_conversation())
+    assert [message.id for message in kept] == ["3", "4", "5", "6"]
+    assert stats == {"kept_tokens": 5, "dropped_tokens": 8, "dropped_messages": 2}
+
+
+def test_last_message_always_kept() -> None:
+    """Test the latest message is kept even when it exceeds the budget."""
+    window = ContextWindow(max_tokens=1, token_counter=one_token_per_character)
+    kept, _ = window.trim([HumanMessage(content="long question", id="1")])
+    assert len(kept) == 1
+
+
+def test_token_counts_cached_by_message_id() -> None:
+    """Test each message is only counted once across steps."""
+    counter = Mock(side_effect=one_token_per_character)
+    window = ContextWindow(max_tokens=100, token_counter=counter)
+    messages = make_conversation()
+    window.trim(messages[:3])
+    window.trim(messages)
+    assert counter.call_count == len(messages)
+
+
+def test_reused_message_id_counted_again() -> None:
+    """Test a message ID reused for another content does not reuse its count."""
+    window = ContextWindow(max_tokens=100, token_counter=one_token_per_character)
+    assert window.count(HumanMessage(content="aaaa", id="1")) == 4
+    assert window.count(HumanMessage(content="a" * 40, id="1")) == 40
+
+
+def test_streamed_messages_carry_context_stats() -> None:
+    """Test the statistics of a streamed model call are emitted after its message."""
+    stats = {"kept_tokens": 2, "dropped_tokens": 0, "dropped_messages": 0}
+    llm = GenericFakeChatModel(messages=iter([AIMessage(content="hello world")]))
+
+    def call_model(state: MessagesState, config: RunnableConfig) -> Dict[str, Any]:
+        response = llm.invoke(state["messages"], with_context_stats(config, stats))
+        return {"messages": response}
+
+    workflow = StateGraph(MessagesState)
+    workflow.add_node("agent", call_model)
+    workflow.set_entry_point("agent")
+    workflow.add_edge("agent", END)
+    chunks = list(
+        emit_context_stats(
+            workflow.compile().stream(
+                {"messages": [HumanMessage(content="hi")]}, stream_mode="messages"
+            )
+        )
+    )
+
+    assert "".join(message.content for message, _ in chunks) == "hello world"
+    last_message, _ = chunks[-1]
+    assert last_message.id == chunks[0][0].id
+    assert last_message.response_metadata == {"context_window": stats}
+    assert all(
+        "context_window" not in message.response_metadata
+        for message, _ in chunks[:-1]
+    )
+
+
+def test_approximate_token_count_charges_media_flat() -> None:
+    """Test inline media is not counted by its encoded size."""
+    image = {"type": "image_url", "image_url": {"url": "data:image/png;base64," + "a" * 10000}}
+    message = HumanMessage(content=[image, {"type": "text", "text": "a" * 40}])
+    assert approximate_token_count(message) < 300
@@ -0,0 +1,244 @@
+# pylint: disable=W0621, W0212
+
+from pathlib import Path
+import threading
+from typing import List, Sequence
+from unittest.mock import patch
+
+from app.utils.export_queue import (
+    SpillFile,
+    SpillingSpanProcessor,
+    dump_span,
+    load_span,
+)
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.trace import Status, StatusCode
+import pytest
+
+
+class FakeExporter(SpanExporter):
+    """Exporter recording span names, failing while `down` is set."""
+
+    def __init__(self) -> None:
+        self.names: List[str] = []
+        self.down = threading.Event()
+        self.exported = threading.Event()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        if self.down.is_set():
+            return SpanExportResult.FAILURE
+        self.names.extend(span.name for span in spans)
+        self.exported.set()
+        return SpanExportResult.SUCCESS
+
+
+def make_spans(count: int, prefix: str = "span") -> List[ReadableSpan]:
+    """Create finished spans."""
+    tracer = TracerProvider().get_tracer(__name__)
+    spans = []
+    for index in range(count):
+        with tracer.start_as_current_span(f"{prefix}-{index}") as span:
+            span.set_attribute("gen_ai.prompt.0.content", "hello")
+            span.add_event("retry", {"attempt": 1})
+        spans.append(span)
+    return spans
+
+
+@pytest.fixture
+def spill_path(tmp_path: Path) -> str:
+    """Path of a spill file."""
+    return str(tmp_path / "spill" / "spans.bin")
+
+
+def test_dump_and_load_span() -> None:
+    """Test spans round trip through their spilled representation."""
+    (span,) = make_spans(1)
+    span._status = Status(StatusCode.ERROR, "failed")
+    loaded = load_span(dump_span(span))
+    assert loaded.to_json() == span.to_json()
+    assert loaded.instrumentation_scope == span.instrumentation_scope
+
+
+def test_spill_file_append_read_commit(spill_path: str) -> None:
+    """Test records are read in order and only consumed when committed."""
+    spill = SpillFile(spill_path, size=4096)
+    for index in range(3):
+        assert spill.append(f"record-{index}".encode())
+    payloads, offset = spill.read(2)
+    assert payloads == [b"record-0", b"record-1"]
+    assert spill.read(2)[0] == payloads
+    spill.commit(offset, 2)
+    assert spill.records == 1
+    payloads, offset = spill.read(10)
+    assert payloads == [b"record-2"]
+    spill.commit(offset, 1)
+    # Fully consumed files are written again from the start
+    assert spill.used_bytes == 0
+    assert spill.append(b"record-3")
+    assert spill.read(10)[0] == [b"record-3"]
+
+
+def test_spill_file_full(spill_path: str) -> None:
+    """Test appends fail once the file is full."""
+    spill = SpillFile(spill_path, size=128)
+    appended = 0
+    while spill.append(b"x" * 20):
+        appended += 1
+    # 12 bytes of file header, 8 bytes of record header and 4 of end marker
+    assert appended == 4
+    assert spill.records == 4
+
+
+def test_spill_file_recovers_after_crash(spill_path: str) -> None:
+    """Test records and read offset survive reopening, ignoring torn records."""
+    spill = SpillFile(spill_path, size=4096)
+    for index in range(3):
+        spill.append(f"record-{index}".encode())
+    spill.commit(spill.read(1)[1], 1)
+    # A record whose payload was not fully written
+    torn_offset = spill.write_offset
+    spill.append(b"record-3")
+    spill._map[torn_offset + 10] ^= 0xFF
+    spill._map.flush()
+    del spill
+
+    reopened = SpillFile(spill_path, size=4096)
+    assert reopened.read(10)[0] == [b"record-1", b"record-2"]
+    assert reopened.write_offset == torn_offset
+    # Ghost records after a reset are not recovered
+    reopened.commit(reopened.read(10)[1], 2)
+    reopened.append(b"new")
+    assert SpillFile(spill_path, size=4096).read(10)[0] == [b"new"]
+
+
+def test_spill_file_compacts_backlog(spill_path: str) -> None:
+    """Test records are moved to the start once the read offset passes half."""
+    spill = SpillFile(spill_path, size=4096)
+    record = b"x" * 100
+    while spill.append(record):
+        pass
+    payloads, offset = spill.read(spill.records - 2)
+    spill.commit(offset, len(payloads))
+    # The space of the consumed records is reused
+    assert spill.read_offset == 12
+    assert spill.append(record)
+    del spill
+
+    reopened = SpillFile(spill_path, size=4096)
+    assert reopened.read(10)[0] == [record] * 3
+
+
+def test_processor_exports_batches() -> None:
+    """Test queued spans are exported in batches without spilling."""
+    exporter = FakeExporter()
+    processor = SpillingSpanProcessor(
+        exporter, max_export_batch_size=4, schedule_delay_millis=10_000
+    )
+    for span in make_spans(8):
+        processor.on_end(span)
+    assert processor.force_flush(5000)
+    assert exporter.names == [f"span-{index}" for index in range(8)]
+    assert processor.stats()["exported_spans"] == 8
+    processor.shutdown()
+
+
+def test_processor_spills_while_backend_down(spill_path: str) -> None:
+    """Test a burst during an outage is spilled, then drained on recovery."""
+    exporter = FakeExporter()
+    exporter.down.set()
+    processor = SpillingSpanProcessor(
+        exporter,
+        max_queue_size=4,
+        max_export_batch_size=4,
+        schedule_delay_millis=50,
+        spill_path=spill_path,
+        max_backoff_seconds=0.05,
+    )
+    for span in make_spans(20):
+        processor.on_end(span)
+    stats = processor.stats()
+    assert stats["queue_depth"] <= 4
+    assert stats["spilled_spans"] >= 16
+    assert stats["spill_bytes"] > 0
+    assert stats["dropped_spans"] == 0
+
+    exporter.down.clear()
+    assert processor.force_flush(5000)
+    assert sorted(exporter.names) == sorted(f"span-{index}" for index in range(20))
+    assert processor.stats()["spill_bytes"] == 0
+    processor.shutdown()
+
+
+def test_processor_drops_when_spill_full(spill_path: str) -> None:
+    """Test spans not fitting in memory nor on disk are counted as dropped."""
+    exporter = FakeExporter()
+    exporter.down.set()
+    processor = SpillingSpanProcessor(
+        exporter,
+        max_queue_size=2,
+        schedule_delay_millis=10_000,
+        spill_path=spill_path,
+        spill_bytes=len(dump_span(make_spans(1)[0])) * 3,
+        shutdown_timeout_millis=0,
+    )
+    for span in make_spans(10):
+        processor.on_end(span)
+    stats = processor.stats()
+    assert stats["queue_depth"] == 2
+    assert stats["spilled_spans"] == 2
+    assert stats["dropped_spans"] == 6
+    processor.shutdown()
+
+
+def test_processor_resumes_spilled_spans_after_restart(spill_path: str) -> None:
+    """Test spans left on disk by a previous process are exported."""
+    exporter = FakeExporter()
+    exporter.down.set()
+    processor = SpillingSpanProcessor(
+        exporter,
+        schedule_delay_millis=10_000,
+        spill_path=spill_path,
+        shutdown_timeout_millis=0,
+    )
+    for span in make_spans(3):
+        processor.on_end(span)
+    # The backend is still down: queued spans are kept on disk
+    processor.shutdown()
+
+    exporter = FakeExporter()
+    processor = SpillingSpanProcessor(
+        exporter, schedule_delay_millis=10_000, spill_path=spill_path
+    )
+    assert exporter.exported.wait(5)
+    assert processor.force_flush(5000)
+    assert sorted(exporter.names) == ["span-0", "span-1", "span-2"]
+    processor.shutdown()
+
+
+def test_shutdown_does_not_wait_for_hung_export(spill_path: str) -> None:
+    """Test shutdown returns when the backend hangs, the worker spills later."""
+    exporter = FakeExporter()
+    released = threading.Event()
+    exporting = threading.Event()
+
+    def hang(spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        exporting.set()
+        released.wait(5)
+        return SpanExportResult.FAILURE
+
+    exporter.export = hang  # type: ignore[method-assign]
+    processor = SpillingSpanProcessor(
+        exporter,
+        max_export_batch_size=1,
+        spill_path=spill_path,
+        shutdown_timeout_millis=0,
+    )
+    processor.on_end(make_spans(1)[0])
+    assert exporting.wait(5)
+    with patch("app.utils.export_queue._SHUTDOWN_GRACE_SECONDS", 0.1):
+        processor.shutdown()
+    assert processor._worker.is_alive()
+    released.set()
+    processor._worker.join(5)
+    assert processor.stats()["spilled_spans"] == 1
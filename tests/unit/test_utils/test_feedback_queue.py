@@ -0,0 +1,90 @@
+# pylint: disable=W0212
+
+import threading
+from typing import Any, Dict, List
+
+from app.utils.feedback_queue import FeedbackQueue
+import pytest
+
+
+class FakeWriter:
+    """Records written batches, failing while `down` is set."""
+
+    def __init__(self) -> None:
+        self.batches: List[List[Dict[str, Any]]] = []
+        self.down = threading.Event()
+
+    def __call__(self, entries: List[Dict[str, Any]]) -> None:
+        if self.down.is_set():
+            raise ConnectionError("backend down")
+        self.batches.append(entries)
+
+
+def entries(count: int, start: int = 0) -> List[Dict[str, Any]]:
+    """Create feedback entries."""
+    return [{"score": 1, "run_id": f"run-{i}"} for i in range(start, start + count)]
+
+
+def test_put_returns_before_write() -> None:
+    """Test entries are acknowledged without waiting for the write."""
+    writer = FakeWriter()
+    queue = FeedbackQueue(writer, flush_interval_seconds=60)
+    assert queue.put(entries(3)) == 3
+    assert writer.batches == []
+    assert queue.flush(5)
+    assert writer.batches == [entries(3)]
+    queue.shutdown()
+
+
+def test_size_triggered_batches() -> None:
+    """Test full batches are written without waiting for the interval."""
+    writer = FakeWriter()
+    queue = FeedbackQueue(writer, max_batch_size=4, flush_interval_seconds=60)
+    queue.put(entries(10))
+    queue.shutdown()
+    assert [len(batch) for batch in writer.batches] == [4, 4, 2]
+    assert queue.stats() == {
+        "queue_depth": 0,
+        "written_entries": 10,
+        "dropped_entries": 0,
+    }
+
+
+def test_time_triggered_write() -> None:
+    """Test a partial batch is written after the flush interval."""
+    writer = FakeWriter()
+    queue = FeedbackQueue(writer, flush_interval_seconds=0.05)
+    queue.put(entries(1))
+    queue._idle.clear()
+    assert queue._idle.wait(5)
+    assert writer.batches == [entries(1)]
+    queue.shutdown()
+
+
+def test_failed_writes_are_retried_in_order() -> None:
+    """Test entries of a failed write are written first once the backend is back."""
+    writer = FakeWriter()
+    writer.down.set()
+    queue = FeedbackQueue(writer, max_batch_size=2, max_backoff_seconds=0.05)
+    queue.put(entries(2))
+    queue.put(entries(2, start=2))
+    writer.down.clear()
+    assert queue.flush(5)
+    written = [entry for batch in writer.batches for entry in batch]
+    assert written == entries(4)
+    queue.shutdown()
+
+
+def test_full_queue_drops_entries() -> None:
+    """Test entries beyond the queue size are dropped and counted."""
+    writer = FakeWriter()
+    writer.down.set()
+    queue = FeedbackQueue(
+        writer, max_queue_size=3, flush_interval_seconds=60, shutdown_timeout_seconds=0
+    )
+    assert queue.put(entries(5)) == 3
+    assert queue.stats()["dropped_entries"] == 2
+    queue.shutdown()
+    assert queue.stats()["dropped_entries"] == 5
+    with pytest.raises(RuntimeError):
+        queue.put(entries(1))
@@ -0,0 +1,177 @@
+from typing import Any, Dict, List
+
+from app.utils.prompt_delta import (
+    DELTA_BASE_SUFFIX,
+    SESSION_ID_ATTRIBUTE,
+    PromptDeltaEncoder,
+    common_prefix_length,
+    restore_attributes,
+)
+import pytest
+
+
+def conversation_prompts(turns: int) -> List[Dict[str, Any]]:
+    """Prompt attributes of the LLM spans of a growing conversation."""
+    history = ""
+    prompts = []
+    for turn in range(turns):
+        history += f"user: question {turn} " + "lorem ipsum " * 100 + "\n"
+        prompts.append(
+            {
+                SESSION_ID_ATTRIBUTE: "session-1",
+                "gen_ai.prompt.0.content": history,
+                "gen_ai.completion.0.content": f"answer {turn}",
+            }
+        )
+        history += f"assistant: answer {turn}\n"
+    return prompts
+
+
+@pytest.mark.parametrize(
+    "a,b,expected",
+    [("", "", 0), ("abc", "abd", 2), ("abc", "abcdef", 3), ("xyz", "abc", 0)],
+)
+def test_common_prefix_length(a: str, b: str, expected: int) -> None:
+    """Test the common prefix length of two strings."""
+    assert common_prefix_length(a, b) == expected
+    assert common_prefix_length(b, a) == expected
+
+
+def test_encode_keeps_only_new_suffix() -> None:
+    """Test a prompt extending the previous one is replaced by its suffix."""
+    encoder = PromptDeltaEncoder()
+    first, second = conversation_prompts(2)
+    full_second = second["gen_ai.prompt.0.content"]
+    encoder.encode(dict(first), "span-1", "trace-1")
+    encoded = encoder.encode(dict(second), "span-2", "trace-2")
+
+    prefix_length = len(first["gen_ai.prompt.0.content"])
+    assert encoded["gen_ai.prompt.0.content"] == full_second[prefix_length:]
+    assert encoded["gen_ai.prompt.0.content" + DELTA_BASE_SUFFIX] == (
+        f"span-1:{prefix_length}"
+    )
+    # Other attributes are left as is
+    assert encoded["gen_ai.completion.0.content"] == "answer 1"
+
+
+def test_encode_scopes() -> None:
+    """Test prompts are only compared within a session, or a trace without one."""
+    encoder = PromptDeltaEncoder()
+    first, second = conversation_prompts(2)
+    encoder.encode(dict(first), "span-1", "trace-1")
+    other_session = dict(second, **{SESSION_ID_ATTRIBUTE: "session-2"})
+    assert encoder.encode(dict(other_session), "span-2", "trace-1") == other_session
+
+    no_session = [dict(p, **{SESSION_ID_ATTRIBUTE: "None"}) for p in (first, second)]
+    encoder.encode(dict(no_session[0]), "span-3", "trace-3")
+    assert encoder.encode(dict(no_session[1]), "span-4", "trace-4") == no_session[1]
+    encoded = encoder.encode(dict(no_session[1]), "span-5", "trace-4")
+    assert encoded["gen_ai.prompt.0.content"] == ""
+
+
+def test_encode_skips_short_prefixes() -> None:
+    """Test prompts sharing a short prefix are logged in full."""
+    encoder = PromptDeltaEncoder(min_prefix_chars=1024)
+    encoder.encode({"gen_ai.prompt.0.content": "a" * 100 + "b" * 2000}, "s1", "t")
+    attributes = {"gen_ai.prompt.0.content": "a" * 100 + "c" * 2000}
+    assert encoder.encode(dict(attributes), "s2", "t") == attributes
+
+
+def test_encode_writes_full_copy_after_max_chain() -> None:
+    """Test chains of deltas are bounded by periodic full copies."""
+    encoder = PromptDeltaEncoder(max_chain=2)
+    encoded = [
+        encoder.encode(dict(prompt), f"span-{index}", "trace")
+        for index, prompt in enumerate(conversation_prompts(5))
+    ]
+    has_delta = ["gen_ai.prompt.0.content" + DELTA_BASE_SUFFIX in e for e in encoded]
+    assert has_delta == [False, True, True, False, True]
+
+
+def test_encode_bounds_sessions() -> None:
+    """Test only the prompts of the most recent sessions are kept."""
+    encoder = PromptDeltaEncoder(max_sessions=1)
+    first, second = conversation_prompts(2)
+    encoder.encode(dict(first), "span-1", "trace-1")
+    encoder.encode({SESSION_ID_ATTRIBUTE: "session-2"}, "span-2", "trace-2")
+    assert encoder.encode(dict(second), "span-3", "trace-3") == second
+
+
+def test_restore_attributes_follows_chain() -> None:
+    """Test delta-encoded attributes are restored from their base spans."""
+    encoder = PromptDeltaEncoder()
+    prompts = conversation_prompts(4)
+    logged = {
+        f"span-{index}": encoder.encode(dict(prompt), f"span-{index}", "trace")
+        for index, prompt in enumerate(prompts)
+    }
+    total_logged = sum(len(a["gen_ai.prompt.0.content"]) for a in logged.values())
+    total_full = sum(len(p["gen_ai.prompt.0.content"]) for p in prompts)
+    assert total_logged < total_full / 2
+
+    for index, prompt in enumerate(prompts):
+        assert restore_attributes(logged[f"span-{index}"], logged.get) == prompt
+
+
+def test_encode_same_span_twice() -> None:
+    """Test a span exported again is not encoded against itself."""
+    encoder = PromptDeltaEncoder()
+    first, second = conversation_prompts(2)
+    logged = {"span-1": encoder.encode(dict(first), "span-1", "trace")}
+    encoder.encode(dict(second), "span-2", "trace")
+    logged["span-2"] = encoder.encode(dict(second), "span-2", "trace")
+    assert DELTA_BASE_SUFFIX not in "".join(logged["span-2"])
+    assert restore_attributes(logged["span-2"], logged.get) == second
+
+
+def test_pending_prompts_are_bases_once_committed() -> None:
+    """Test prompts collected in `pending` are only used once committed."""
+    encoder = PromptDeltaEncoder()
+    first, second, third = conversation_prompts(3)
+    pending: Dict[str, Any] = {}
+    encoder.encode(dict(first), "span-1", "trace", pending)
+    # Later spans of the same batch are encoded against the pending prompts
+    encoded = encoder.encode(dict(second), "span-2", "trace", pending)
+    assert encoded["gen_ai.prompt.0.content" + DELTA_BASE_SUFFIX].startswith("span-1:")
+    # Spans of another batch are not, until the batch is committed
+    encoded = encoder.encode(dict(third), "span-3", "trace", {})
+    assert "gen_ai.prompt.0.content" + DELTA_BASE_SUFFIX not in encoded
+    encoder.commit(pending)
+    encoded = encoder.encode(dict(third), "span-3", "trace")
+    assert encoded["gen_ai.prompt.0.content" + DELTA_BASE_SUFFIX].startswith("span-2:")
+
+
+def test_restore_attributes_from_offloaded_spans() -> None:
+    """Test spans whose attributes were stored in GCS are read back to restore."""
+    encoder = PromptDeltaEncoder()
+    prompts = conversation_prompts(3)
+    encoded = [
+        encoder.encode(dict(prompt), f"span-{index}", "trace")
+        for index, prompt in enumerate(prompts)
+    ]
+    # The first two spans were too large for Cloud Logging
+    stored = {f"gs://bucket/span-{index}.json": encoded[index] for index in (0, 1)}
+    logged = {
+        f"span-{index}": {
+            SESSION_ID_ATTRIBUTE: "session-1",
+            "uri_payload": f"gs://bucket/span-{index}.json",
+            "url_payload": f"https://storage.cloud.google.com/bucket/span-{index}.json",
+        }
+        for index in (0, 1)
+    }
+    logged["span-2"] = encoded[2]
+
+    for index, prompt in enumerate(prompts):
+        restored = restore_attributes(
+            logged[f"span-{index}"], logged.get, stored.__getitem__
+        )
+        assert restored == prompt
+
+
+def test_restore_attributes_missing_base() -> None:
+    """Test a missing base span is reported."""
+    with pytest.raises(KeyError):
+        restore_attributes(
+            {"gen_ai.prompt.0.content": "", "gen_ai.prompt.0.content.delta_base": "x:3"},
+            lambda span_id: None,
+        )
@@ -0,0 +1,156 @@
+# pylint: disable=W0621, W0212
+
+from typing import Any, Tuple
+
+from app.utils.sampling import RUN_ID_ATTRIBUTE, TailSamplingSpanProcessor
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+from opentelemetry.trace import Status, StatusCode, Tracer
+import pytest
+
+
+def make_tracer(
+    **kwargs: Any,
+) -> Tuple[Tracer, TailSamplingSpanProcessor, InMemorySpanExporter]:
+    """Create a tracer whose spans go through a tail sampler to memory."""
+    exporter = InMemorySpanExporter()
+    sampler = TailSamplingSpanProcessor(SimpleSpanProcessor(exporter), **kwargs)
+    provider = TracerProvider()
+    provider.add_span_processor(sampler)
+    return provider.get_tracer(__name__), sampler, exporter
+
+
+def run_trace(
+    tracer: Tracer,
+    run_id: str = "None",
+    error: bool = False,
+    duration_ns: int = 1_000_000,
+    children: int = 2,
+    start_ns: int = 1_000_000_000,
+) -> None:
+    """Record a request trace: a root span with child spans."""
+    root = tracer.start_span(
+        "request", attributes={RUN_ID_ATTRIBUTE: run_id}, start_time=start_ns
+    )
+    for index in range(children):
+        child = tracer.start_span(
+            f"child-{index}",
+            context=trace.set_span_in_context(root),
+            start_time=start_ns,
+        )
+        if error and index == 0:
+            child.set_status(Status(StatusCode.ERROR, "failed"))
+        child.end(end_time=start_ns + duration_ns // 2)
+    root.end(end_time=start_ns + duration_ns)
+
+
+@pytest.fixture
+def sampler_parts() -> Tuple[Tracer, TailSamplingSpanProcessor, InMemorySpanExporter]:
+    """A tail sampler dropping every uneventful trace."""
+    return make_tracer(sample_rate=0.0, min_latency_samples=10)
+
+
+def test_traces_exported_whole_at_the_end() -> None:
+    """Test spans are held until the root ends, then exported together."""
+    tracer, _, exporter = make_tracer(sample_rate=1.0)
+    root = tracer.start_span("request")
+    child = tracer.start_span("child", context=trace.set_span_in_context(root))
+    child.end()
+    assert exporter.get_finished_spans() == ()
+    root.end()
+    assert [span.name for span in exporter.get_finished_spans()] == ["child", "request"]
+
+
+def test_uneventful_traces_dropped(sampler_parts: Any) -> None:
+    """Test uneventful traces are dropped at a zero sample rate."""
+    tracer, sampler, exporter = sampler_parts
+    for _ in range(5):
+        run_trace(tracer)
+    assert exporter.get_finished_spans() == ()
+    assert sampler.stats() == {
+        "kept_traces": 0,
+        "dropped_traces": 5,
+        "buffered_traces": 0,
+    }
+
+
+def test_error_traces_kept(sampler_parts: Any) -> None:
+    """Test a trace with a failed span is kept whole."""
+    tracer, _, exporter = sampler_parts
+    run_trace(tracer, error=True, children=3)
+    assert len(exporter.get_finished_spans()) == 4
+
+
+def test_slow_traces_kept(sampler_parts: Any) -> None:
+    """Test traces slower than the percentile of recent traces are kept."""
+    tracer, _, exporter = sampler_parts
+    for _ in range(20):
+        run_trace(tracer, duration_ns=1_000_000)
+    assert exporter.get_finished_spans() == ()
+    run_trace(tracer, duration_ns=50_000_000)
+    assert len(exporter.get_finished_spans()) == 3
+
+
+def test_feedback_before_trace_end(sampler_parts: Any) -> None:
+    """Test a trace whose run ID received feedback is kept."""
+    tracer, sampler, exporter = sampler_parts
+    sampler.keep_run("run-1")
+    run_trace(tracer, run_id="run-1")
+    assert len(exporter.get_finished_spans()) == 3
+
+
+def test_feedback_after_trace_dropped(sampler_parts: Any) -> None:
+    """Test feedback arriving after the response recovers the dropped trace."""
+    tracer, sampler, exporter = sampler_parts
+    run_trace(tracer, run_id="run-1")
+    run_trace(tracer, run_id="run-2")
+    assert exporter.get_finished_spans() == ()
+    sampler.keep_run("run-1")
+    spans = exporter.get_finished_spans()
+    assert len(spans) == 3
+    assert {span.attributes.get(RUN_ID_ATTRIBUTE) for span in spans} >= {"run-1"}
+    assert sampler.stats()["kept_traces"] == 1
+
+
+@pytest.mark.parametrize("sample_rate", [0.25, 0.5])
+def test_sample_rate(sample_rate: float) -> None:
+    """Test the share of uneventful traces kept follows the sample rate."""
+    tracer, sampler, _ = make_tracer(sample_rate=sample_rate)
+    for _ in range(2000):
+        run_trace(tracer, children=0)
+    assert sampler.stats()["kept_traces"] / 2000 == pytest.approx(sample_rate, abs=0.05)
+
+
+def test_bounded_buffers() -> None:
+    """Test in-progress traces and spans per trace are bounded."""
+    tracer, sampler, exporter = make_tracer(
+        sample_rate=1.0, max_traces=2, max_spans_per_trace=3
+    )
+    roots = [tracer.start_span(f"request-{index}") for index in range(3)]
+    for root in roots:
+        tracer.start_span("child", context=trace.set_span_in_context(root)).end()
+    # The oldest trace was decided early to make room
+    assert sampler.stats()["buffered_traces"] == 2
+    assert len(exporter.get_finished_spans()) == 1
+
+    for _ in range(3):
+        tracer.start_span("child", context=trace.set_span_in_context(roots[1])).end()
+    assert sampler.stats()["buffered_traces"] == 1
+    # Spans ending after the decision follow it
+    roots[0].end()
+    assert exporter.get_finished_spans()[-1].name == "request-0"
+
+
+def test_shutdown_decides_buffered_traces(sampler_parts: Any) -> None:
+    """Test buffered traces are decided on shutdown."""
+    tracer, sampler, exporter = sampler_parts
+    root = tracer.start_span("request")
+    child = tracer.start_span("child", context=trace.set_span_in_context(root))
+    child.set_status(Status(StatusCode.ERROR))
+    child.end()
+    sampler.shutdown()
+    assert [span.name for span in exporter.get_finished_spans()] == ["child"]
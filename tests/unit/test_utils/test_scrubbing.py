@@ -0,0 +1,73 @@
+import base64
+import hashlib
+import json
+
+from app.utils.scrubbing import describe_base64, scrub_attributes, scrub_base64
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 8
+PDF = b"%PDF-1.7\n" + b"0" * 4096
+
+
+def b64(data: bytes) -> str:
+    """Encode bytes as base64 text."""
+    return base64.b64encode(data).decode()
+
+
+def test_describe_base64() -> None:
+    """Test the description holds the MIME type, decoded size and digest."""
+    digest = hashlib.sha256(PNG).hexdigest()[:16]
+    expected = f"[image/png, {len(PNG)} bytes, sha256:{digest}]"
+    assert describe_base64(b64(PNG)) == expected
+    assert describe_base64(b64(PNG), "image/x-custom").startswith("[image/x-custom,")
+    assert describe_base64("not base64!") is None
+
+
+def test_scrub_data_url() -> None:
+    """Test image data URLs, as sent to the model, are replaced."""
+    parts = [
+        {"type": "text", "text": "What is in this image?"},
+        {
+            "type": "image_url",
+            "image_url": {"url": f"data:image/png;base64,{b64(PNG)}"},
+        },
+    ]
+    scrubbed = json.loads(scrub_base64(json.dumps(parts)))
+    assert scrubbed[0] == parts[0]
+    assert scrubbed[1]["image_url"]["url"] == describe_base64(b64(PNG))
+
+
+def test_scrub_data_field_with_mime_type() -> None:
+    """Test the data field of media parts is replaced, also in escaped JSON."""
+    part = {"type": "media", "data": b64(PDF), "mime_type": "application/pdf"}
+    value = json.dumps({"input": json.dumps([part])})
+    scrubbed = json.loads(json.loads(scrub_base64(value))["input"])
+    assert scrubbed == [
+        {
+            "type": "media",
+            "data": describe_base64(b64(PDF), "application/pdf"),
+            "mime_type": "application/pdf",
+        }
+    ]
+
+
+def test_scrub_keeps_short_and_unrelated_values() -> None:
+    """Test short payloads and text that is not base64 are left untouched."""
+    short = f"data:image/png;base64,{b64(b'tiny')}"
+    text = json.dumps({"data": "lorem ipsum " * 100})
+    assert scrub_base64(short) == short
+    assert scrub_base64(text) == text
+
+
+def test_scrub_attributes() -> None:
+    """Test string attributes are scrubbed in place, other values are kept."""
+    attributes = {
+        "gen_ai.prompt.0.content": f"see data:image/png;base64,{b64(PNG)}",
+        "llm.usage.total_tokens": 12,
+        "llm.request.functions": ("search",),
+    }
+    scrub_attributes(attributes)
+    assert attributes == {
+        "gen_ai.prompt.0.content": f"see {describe_base64(b64(PNG))}",
+        "llm.usage.total_tokens": 12,
+        "llm.request.functions": ("search",),
+    }
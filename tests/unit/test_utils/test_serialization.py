@@ -0,0 +1,74 @@
+import io
+
+from app.utils.serialization import DebugSink, dumps_chunk, encode_chunk
+from langchain_core.messages import AIMessageChunk, ToolMessage
+import orjson
+
+
+def test_encode_ai_message_chunk() -> None:
+    """Test AI chunks are encoded into the compact wire shape."""
+    chunk = (
+        AIMessageChunk(content="Hel", id="run-1"),
+        {"langgraph_node": "agent", "langgraph_step": 1, "checkpoint_ns": "x"},
+    )
+    encoded = encode_chunk(chunk)
+    assert encoded == [
+        {"type": "AIMessageChunk", "content": "Hel", "id": "run-1"},
+        {"langgraph_node": "agent", "langgraph_step": 1},
+    ]
+
+
+def test_encode_tool_call_and_tool_message() -> None:
+    """Test tool calls and tool results keep the fields clients rely on."""
+    ai_chunk = AIMessageChunk(
+        content="",
+        tool_call_chunks=[
+            {"name": "search", "args": '{"query": "sf"}', "id": "call-1", "index": 0}
+        ],
+    )
+    message, _ = encode_chunk((ai_chunk, {}))
+    assert message["tool_calls"][0]["name"] == "search"
+    assert message["tool_calls"][0]["args"] == {"query": "sf"}
+
+    tool_message = ToolMessage(content="foggy", tool_call_id="call-1", name="search")
+    message, _ = encode_chunk((tool_message, {"langgraph_node": "tools"}))
+    assert message == {
+        "type": "tool",
+        "content": "foggy",
+        "tool_call_id": "call-1",
+        "name": "search",
+        "status": "success",
+    }
+
+
+def test_encode_context_window() -> None:
+    """Test the trimming statistics of a model call reach the client."""
+    stats = {"kept_tokens": 2, "dropped_tokens": 0, "dropped_messages": 0}
+    chunk = AIMessageChunk(
+        content="", id="run-1", response_metadata={"context_window": stats}
+    )
+    message, _ = encode_chunk((chunk, {}))
+    assert message == {
+        "type": "AIMessageChunk",
+        "content": "",
+        "id": "run-1",
+        "context_window": stats,
+    }
+
+
+def test_encode_chunk_fallback() -> None:
+    """Test non message chunks fall back to the LangChain serializer."""
+    assert encode_chunk({"key": "value"}) == {"key": "value"}
+
+
+def test_debug_sink_writes_json_lines() -> None:
+    """Test the debug sink writes one JSON line per chunk."""
+    stream = io.BytesIO()
+    sink = DebugSink(stream=stream)
+    encoded = encode_chunk((AIMessageChunk(content="a"), {}))
+    sink.write(encoded)
+    sink.write(encoded)
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 2
+    assert orjson.loads(lines[0]) == encoded
+    assert dumps_chunk(encoded).endswith(b"\n")
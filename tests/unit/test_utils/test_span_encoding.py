@@ -0,0 +1,73 @@
+import json
+
+from app.utils.span_encoding import (
+    encode_attributes,
+    encoded_size,
+    entry_size,
+    join_encoded,
+    span_to_dict,
+)
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import Event, ReadableSpan
+from opentelemetry.trace import Link, SpanContext, SpanKind, Status, StatusCode
+import orjson
+
+
+def make_span() -> ReadableSpan:
+    """Create a finished span using every field of the log entry."""
+    return ReadableSpan(
+        name="call_model",
+        context=SpanContext(trace_id=2**100 + 7, span_id=2**60 + 3, is_remote=False),
+        parent=SpanContext(trace_id=2**100 + 7, span_id=42, is_remote=False),
+        resource=Resource({"service.name": "agent"}),
+        attributes={
+            "gen_ai.prompt.0.content": 'Hello "world"\nè',
+            "llm.request.functions": ("search", "answer"),
+            "llm.usage.total_tokens": 12,
+            "llm.is_streaming": False,
+        },
+        events=[Event("retry", {"attempt": 2}, timestamp=1_700_000_000_500_000_000)],
+        links=[
+            Link(SpanContext(trace_id=1, span_id=2, is_remote=True), {"kind": "batch"})
+        ],
+        kind=SpanKind.CLIENT,
+        status=Status(StatusCode.ERROR, "quota exceeded"),
+        start_time=1_700_000_000_000_000_000,
+        end_time=1_700_000_001_000_000_000,
+    )
+
+
+def test_span_to_dict_matches_to_json() -> None:
+    """Test the span dictionary has the shape of the SDK JSON serialization."""
+    span = make_span()
+    assert span_to_dict(span) == json.loads(span.to_json())
+
+
+def test_encode_attributes() -> None:
+    """Test each attribute value is returned JSON-encoded."""
+    span_dict = span_to_dict(make_span())
+    encoded_attributes = encode_attributes(span_dict["attributes"])
+    assert encoded_attributes.keys() == span_dict["attributes"].keys()
+    for key, value in encoded_attributes.items():
+        assert orjson.loads(value) == span_dict["attributes"][key]
+
+
+def test_encoded_size_is_exact() -> None:
+    """Test the incremental size matches the size of the assembled object."""
+    for attributes in (
+        {},
+        {"a": 1},
+        {"key": "value", "clé": "è" * 10, "list": [1, "two", 3.0], "flag": True},
+    ):
+        encoded_attributes = encode_attributes(attributes)
+        joined = join_encoded(encoded_attributes)
+        assert encoded_size(encoded_attributes) == len(joined)
+        assert orjson.loads(joined) == attributes
+
+
+def test_entry_size() -> None:
+    """Test the entry size adds the other fields to the attributes size."""
+    span_dict = span_to_dict(make_span())
+    encoded_attributes = encode_attributes(span_dict["attributes"])
+    size = entry_size(span_dict, encoded_size(encoded_attributes))
+    assert size == len(orjson.dumps(span_dict))
@@ -0,0 +1,45 @@
+import logging
+from unittest.mock import patch
+
+from app.utils.startup import StartupProfiler
+import pytest
+
+
+def test_phases_and_total_are_reported() -> None:
+    """Test each phase is timed and the total covers all of them."""
+    with patch(
+        "app.utils.startup.time.perf_counter", side_effect=[0.0, 1.0, 3.0, 3.0, 3.5, 4.0]
+    ):
+        profiler = StartupProfiler(target_seconds=5.0)
+        with profiler.phase("agent"):
+            pass
+        with profiler.phase("telemetry"):
+            pass
+        report = profiler.report()
+    assert report == {
+        "phases": {"agent": 2.0, "telemetry": 0.5},
+        "total_seconds": 4.0,
+        "target_seconds": 5.0,
+        "within_target": True,
+    }
+
+
+def test_phase_recorded_on_error() -> None:
+    """Test a failing phase is still timed."""
+    profiler = StartupProfiler()
+    with pytest.raises(ValueError):
+        with profiler.phase("agent"):
+            raise ValueError("boom")
+    assert "agent" in profiler.phases
+    assert "within_target" not in profiler.report()
+
+
+def test_log_warns_above_target(caplog: pytest.LogCaptureFixture) -> None:
+    """Test exceeding the target is logged as a warning."""
+    profiler = StartupProfiler(target_seconds=0.0)
+    with profiler.phase("agent"):
+        pass
+    with caplog.at_level(logging.INFO):
+        report = profiler.log()
+    assert report["within_target"] is False
+    assert caplog.records[-1].levelno == logging.WARNING
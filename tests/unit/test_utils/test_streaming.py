@@ -0,0 +1,235 @@
+import asyncio
+import contextvars
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List
+from unittest.mock import patch
+
+from app.utils.streaming import ChunkCoalescer, acoalesce_chunks, coalesce_chunks
+from langchain_core.messages import AIMessageChunk, ToolMessage
+import pytest
+
+
+def token_chunks(message_id: str, tokens: List[str]) -> List[Any]:
+    """Build a stream of content chunks for one message."""
+    return [
+        (AIMessageChunk(content=token, id=message_id), {"langgraph_node": "agent"})
+        for token in tokens
+    ]
+
+
+def test_first_chunk_emitted_immediately() -> None:
+    """Test the first chunk of a message is never buffered."""
+    coalescer = ChunkCoalescer(max_delay_ms=1000, max_bytes=1000)
+    first, second = token_chunks("run-1", ["Hello", " world"])
+    assert coalescer.add(first) == [first]
+    assert coalescer.add(second) == []
+    merged = coalescer.flush()
+    assert merged[0][0].content == " world"
+
+
+def test_first_chunk_without_id_emitted_immediately() -> None:
+    """Test the first chunk is emitted even when the message has no id."""
+    coalescer = ChunkCoalescer(max_delay_ms=1000, max_bytes=1000)
+    first, second = [
+        (AIMessageChunk(content=token), {}) for token in ["Hello", " world"]
+    ]
+    assert coalescer.add(first) == [first]
+    assert coalescer.add(second) == []
+
+
+def test_chunks_merged_until_size_window() -> None:
+    """Test content chunks are merged until the size window is reached."""
+    coalescer = ChunkCoalescer(max_delay_ms=1000, max_bytes=10)
+    chunks = token_chunks("run-1", ["a"] + ["bcd"] * 10)
+    result = list(coalesce_chunks(chunks, coalescer))
+    assert len(result) < len(chunks)
+    assert "".join(message.content for message, _ in result) == "a" + "bcd" * 10
+    assert all(metadata == {"langgraph_node": "agent"} for _, metadata in result)
+
+
+def test_chunks_flushed_after_time_window() -> None:
+    """Test buffered content is emitted once the time window elapsed."""
+    coalescer = ChunkCoalescer(max_delay_ms=50, max_bytes=1000)
+    chunks = token_chunks("run-1", ["a", "b", "c"])
+    with patch("app.utils.streaming.time.monotonic", side_effect=[0.0, 0.01, 0.1]):
+        assert coalescer.add(chunks[0]) == [chunks[0]]
+        assert coalescer.add(chunks[1]) == []
+        ready = coalescer.add(chunks[2])
+    assert [message.content for message, _ in ready] == ["bc"]
+
+
+def test_tool_traffic_and_new_message_flush_buffer() -> None:
+    """Test tool calls, tool results and new messages are never merged."""
+    coalescer = ChunkCoalescer(max_delay_ms=1000, max_bytes=1000)
+    tool_call = (
+        AIMessageChunk(
+            content="",
+            id="run-1",
+            tool_call_chunks=[{"name": "search", "args": "{}", "id": "1", "index": 0}],
+        ),
+        {},
+    )
+    tool_result = (ToolMessage(content="foggy", tool_call_id="1"), {})
+    chunks = (
+        token_chunks("run-1", ["a", "b"])
+        + [tool_call, tool_result]
+        + token_chunks("run-2", ["c", "d", "e"])
+    )
+    result = list(coalesce_chunks(chunks, coalescer))
+    assert [message.content for message, _ in result] == [
+        "a",
+        "b",
+        "",
+        "foggy",
+        "c",
+        "de",
+    ]
+    assert result[2][0].tool_call_chunks
+
+
+def test_disabled_coalescer_passes_through() -> None:
+    """Test a zero time window disables coalescing."""
+    chunks = token_chunks("run-1", ["a", "b", "c"])
+    result = list(coalesce_chunks(chunks, ChunkCoalescer(max_delay_ms=0)))
+    assert result == chunks
+
+
+def paused_stream(pause_seconds: float) -> Iterator[Any]:
+    """Two tokens, a pause of the model, then a last token."""
+    first, second, third = token_chunks("run-1", ["a", "b", "c"])
+    yield first
+    yield second
+    time.sleep(pause_seconds)
+    yield third
+
+
+def test_buffer_flushed_during_model_pause() -> None:
+    """Test buffered content is emitted when the window elapses between chunks."""
+    coalescer = ChunkCoalescer(max_delay_ms=50, max_bytes=1000)
+    started = time.monotonic()
+    emitted = [
+        (message.content, time.monotonic() - started)
+        for message, _ in coalesce_chunks(paused_stream(1.0), coalescer)
+    ]
+    assert [content for content, _ in emitted] == ["a", "b", "c"]
+    # "b" is sent once the window elapsed, not after the pause
+    assert emitted[1][1] < 0.5
+
+
+def test_stream_read_in_caller_context() -> None:
+    """Test the stream sees the context variables of the caller."""
+    variable: contextvars.ContextVar[str] = contextvars.ContextVar("variable")
+    variable.set("request")
+
+    def stream() -> Iterator[Any]:
+        yield (AIMessageChunk(content=variable.get(), id="run-1"), {})
+
+    chunks = coalesce_chunks(stream(), ChunkCoalescer())
+    assert [message.content for message, _ in chunks] == ["request"]
+
+
+def test_stream_without_buffering_read_in_caller_thread() -> None:
+    """Test no worker thread is started while nothing is buffered."""
+    threads = []
+
+    def stream() -> Iterator[Any]:
+        for token in ["a", "b"]:
+            threads.append(threading.current_thread())
+            yield (AIMessageChunk(content=token, id=f"run-{token}"), {})
+
+    chunks = coalesce_chunks(stream(), ChunkCoalescer())
+    assert [message.content for message, _ in chunks] == ["a", "b"]
+    assert threads == [threading.main_thread()] * 2
+
+
+def test_stream_closed_when_consumer_stops() -> None:
+    """Test the stream is closed when the consumer stops before its end."""
+    closed = threading.Event()
+
+    def stream() -> Iterator[Any]:
+        try:
+            yield from token_chunks("run-1", ["a"])
+        finally:
+            closed.set()
+
+    chunks = coalesce_chunks(stream(), ChunkCoalescer())
+    next(chunks)
+    chunks.close()
+    assert closed.is_set()
+
+
+def test_async_stream_steps_share_context() -> None:
+    """Test context variables set by one step of the stream are seen by the next."""
+    variable: contextvars.ContextVar[str] = contextvars.ContextVar("variable")
+
+    async def stream() -> AsyncIterator[Any]:
+        token = variable.set("step")
+        yield (AIMessageChunk(content="a", id="run-1"), {})
+        yield (AIMessageChunk(content=variable.get(), id="run-2"), {})
+        variable.reset(token)
+
+    async def collect() -> List[Any]:
+        return [
+            message.content
+            async for message, _ in acoalesce_chunks(stream(), ChunkCoalescer())
+        ]
+
+    assert asyncio.run(collect()) == ["a", "step"]
+
+
+def test_async_stream_closed_when_consumer_stops() -> None:
+    """Test the async stream is closed when the consumer stops early."""
+    closed = []
+
+    async def stream() -> AsyncIterator[Any]:
+        try:
+            for chunk in token_chunks("run-1", ["a", "b", "c"]):
+                yield chunk
+        finally:
+            closed.append(True)
+
+    async def consume_first() -> None:
+        chunks = acoalesce_chunks(stream(), ChunkCoalescer())
+        await chunks.__anext__()
+        await chunks.aclose()
+
+    asyncio.run(consume_first())
+    assert closed == [True]
+
+
+def test_async_buffer_flushed_during_model_pause() -> None:
+    """Test the async stream also flushes the buffer during a pause."""
+
+    async def stream() -> AsyncIterator[Any]:
+        first, second, third = token_chunks("run-1", ["a", "b", "c"])
+        yield first
+        yield second
+        await asyncio.sleep(1.0)
+        yield third
+
+    async def collect() -> List[Any]:
+        started = time.monotonic()
+        return [
+            (message.content, time.monotonic() - started)
+            async for message, _ in acoalesce_chunks(
+                stream(), ChunkCoalescer(max_delay_ms=50, max_bytes=1000)
+            )
+        ]
+
+    emitted = asyncio.run(collect())
+    assert [content for content, _ in emitted] == ["a", "b", "c"]
+    assert emitted[1][1] < 0.5
+
+
+def test_stream_errors_reach_consumer() -> None:
+    """Test an error raised by the stream is re-raised after the earlier chunks."""
+
+    def stream() -> Iterator[Any]:
+        yield from token_chunks("run-1", ["a"])
+        raise ValueError("model failed")
+
+    chunks = coalesce_chunks(stream(), ChunkCoalescer())
+    assert next(chunks)[0].content == "a"
+    with pytest.raises(ValueError, match="model failed"):
+        next(chunks)
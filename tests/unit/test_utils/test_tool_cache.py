@@ -0,0 +1,155 @@
+import asyncio
+from typing import List, Tuple
+
+from app.utils.tool_cache import ToolCache
+from langchain_core.messages import AIMessage
+from langchain_core.tools import BaseTool, ToolException, tool
+from langgraph.prebuilt import ToolNode
+
+CALLS: List[str] = []
+
+
+@tool
+def lookup(query: str, limit: int = 1) -> str:
+    """Looks something up."""
+    CALLS.append(query)
+    return f"result for {query}"
+
+
+def setup_function() -> None:
+    """Reset the recorded calls."""
+    CALLS.clear()
+
+
+def test_repeated_calls_hit_cache() -> None:
+    """Test identical arguments are only executed once."""
+    cache = ToolCache()
+    cached = cache.wrap(lookup)
+    assert cached.name == "lookup"
+    assert cached.args == lookup.args
+
+    assert cached.invoke({"query": "sf", "limit": 2}) == "result for sf"
+    assert cached.invoke({"limit": 2, "query": "sf"}) == "result for sf"
+    assert cached.invoke({"query": "ny"}) == "result for ny"
+    assert CALLS == ["sf", "ny"]
+    assert cache.stats() == {"lookup": {"hits": 1, "misses": 2, "size": 2}}
+
+
+def test_size_bound_evicts_old_results() -> None:
+    """Test per tool size bounds evict old results."""
+    cache = ToolCache()
+    cached = cache.wrap(lookup, max_entries=1)
+    cached.invoke({"query": "a"})
+    cached.invoke({"query": "b"})
+    cached.invoke({"query": "a"})
+    assert CALLS == ["a", "b", "a"]
+
+
+def test_disabled_tool_is_not_wrapped() -> None:
+    """Test non-idempotent tools are returned untouched."""
+    cache = ToolCache()
+    assert cache.wrap(lookup, enabled=False) is lookup
+    assert not cache.stats()
+
+
+def test_tool_node_with_cached_tool() -> None:
+    """Test cached tools work in a ToolNode, sync and async."""
+    cache = ToolCache()
+    node = ToolNode([cache.wrap(lookup)])
+    message = AIMessage(
+        content="",
+        tool_calls=[{"name": "lookup", "args": {"query": "sf"}, "id": "call-1"}],
+    )
+    result = node.invoke({"messages": [message]})
+    assert result["messages"][0].content == "result for sf"
+    result = asyncio.run(node.ainvoke({"messages": [message]}))
+    assert result["messages"][0].content == "result for sf"
+    assert CALLS == ["sf"]
+
+
+def test_default_arguments_share_a_key() -> None:
+    """Test omitted arguments are keyed like their default values."""
+    cache = ToolCache()
+    cached = cache.wrap(lookup)
+    cached.invoke({"query": "sf"})
+    cached.invoke({"query": "sf", "limit": 1})
+    assert CALLS == ["sf"]
+
+
+def test_none_results_are_cached() -> None:
+    """Test tools returning None are only executed once."""
+
+    @tool
+    def record(query: str) -> None:
+        """Records a query."""
+        CALLS.append(query)
+
+    cache = ToolCache()
+    cached = cache.wrap(record)
+    assert cached.invoke({"query": "sf"}) is None
+    assert cached.invoke({"query": "sf"}) is None
+    assert CALLS == ["sf"]
+    assert cache.stats()["record"]["hits"] == 1
+
+
+def test_zero_ttl_is_not_replaced_by_default() -> None:
+    """Test an explicit zero time to live is kept."""
+    cache = ToolCache(ttl_seconds=300)
+    cache.wrap(lookup, ttl_seconds=0)
+    assert cache.stores["lookup"].ttl_seconds == 0
+
+
+def test_failed_calls_are_handled_but_not_cached() -> None:
+    """Test the tool error handling is kept and errors are not cached."""
+
+    @tool
+    def flaky(query: str) -> str:
+        """Fails."""
+        CALLS.append(query)
+        raise ToolException("unavailable")
+
+    flaky.handle_tool_error = True
+    cache = ToolCache()
+    cached = cache.wrap(flaky)
+    assert cached.invoke({"query": "sf"}) == "unavailable"
+    assert cached.invoke({"query": "sf"}) == "unavailable"
+    assert CALLS == ["sf", "sf"]
+
+
+def test_content_and_artifact_tool() -> None:
+    """Test the artifact of a tool is cached with its content."""
+
+    @tool(response_format="content_and_artifact")
+    def fetch(query: str) -> Tuple[str, List[str]]:
+        """Fetches documents."""
+        CALLS.append(query)
+        return f"1 document for {query}", [query]
+
+    cache = ToolCache()
+    cached = cache.wrap(fetch)
+    call = {"name": "fetch", "args": {"query": "sf"}, "id": "1", "type": "tool_call"}
+    for _ in range(2):
+        message = cached.invoke(call)
+        assert message.content == "1 document for sf"
+        assert message.artifact == ["sf"]
+    assert CALLS == ["sf"]
+
+
+def test_tool_without_args_schema() -> None:
+    """Test a tool without schema keeps the arguments of its `_run` method."""
+
+    class Echo(BaseTool):
+        name: str = "echo"
+        description: str = "Echoes the query."
+
+        def _run(self, query: str) -> str:
+            CALLS.append(query)
+            return f"echo {query}"
+
+    echo = Echo()
+    assert echo.args_schema is None
+    cached = ToolCache().wrap(echo)
+    assert list(cached.args) == ["query"]
+    for _ in range(2):
+        assert cached.invoke({"query": "sf"}) == "echo sf"
+    assert CALLS == ["sf"]
@@ -1,12 +1,31 @@
 # pylint: disable=W0621, W0613, W0212
 
-from typing import Any, Generator
+import base64
+import datetime
+import gzip
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Generator, List, Tuple
 from unittest.mock import Mock, patch
 
-from app.utils.tracing import CloudTraceLoggingSpanExporter
+from app.utils.exporter_metrics import ExporterMetrics
+from app.utils.span_encoding import encode_attributes
+from app.utils.tracing import (
+    CloudTraceLoggingSpanExporter,
+    read_payload,
+    split_entries,
+)
+from google.api_core.exceptions import PreconditionFailed
 from google.cloud import logging as google_cloud_logging
 from google.cloud import storage
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
 from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExportResult
+from opentelemetry.trace import SpanContext
+import orjson
 import pytest
 
 
@@ -72,58 +91,482 @@ def test_init(exporter: CloudTraceLoggingSpanExporter) -> None:
     assert exporter.debug is False
 
 
+def test_clients_created_once_across_threads(
+    patch_auth: Any, mock_storage_client: Mock
+) -> None:
+    """Test concurrent first uses of the lazy clients create them once."""
+    exporter = CloudTraceLoggingSpanExporter(project_id="test-project")
+    barrier = threading.Barrier(8)
+
+    def use_bucket(_: int) -> Any:
+        barrier.wait()
+        return exporter.bucket
+
+    with patch(
+        "google.cloud.storage.Client", return_value=mock_storage_client
+    ) as storage_client, ThreadPoolExecutor(max_workers=8) as executor:
+        buckets = list(executor.map(use_bucket, range(8)))
+    storage_client.assert_called_once()
+    mock_storage_client.bucket.assert_called_once_with("test-project-logs-data")
+    assert all(bucket is buckets[0] for bucket in buckets)
+
+
+def wait_for_uploads(exporter: CloudTraceLoggingSpanExporter) -> None:
+    """Wait for the pending uploads and keep the exporter usable."""
+    exporter._uploader.shutdown(wait=True)
+    exporter._uploader = ThreadPoolExecutor(max_workers=1)
+
+
 def test_store_in_gcs(exporter: CloudTraceLoggingSpanExporter) -> None:
     """Test the store_in_gcs method of CloudTraceLoggingSpanExporter."""
-    span_id = "test-span-id"
-    content = "test-content"
-    uri = exporter.store_in_gcs(content, span_id)
-    assert uri == f"gs://test-bucket/spans/{span_id}.json"
-    exporter.bucket.blob.assert_called_once_with(f"spans/{span_id}.json")
+    content = b'{"key": "value"}'
+    digest = hashlib.sha256(content).hexdigest()
+    uri = exporter.store_in_gcs(content)
+    assert uri == f"gs://test-bucket/spans/{digest}.json"
+    exporter.bucket.blob.assert_called_once_with(f"spans/{digest}.json")
+    exporter.shutdown()
+    blob = exporter.bucket.blob.return_value
+    assert blob.content_encoding == "gzip"
+    upload = blob.upload_from_string
+    upload.assert_called_once()
+    assert gzip.decompress(upload.call_args.args[0]) == content
+    assert upload.call_args.kwargs["if_generation_match"] == 0
+
+
+def test_store_in_gcs_deduplicates_payloads(
+    exporter: CloudTraceLoggingSpanExporter,
+) -> None:
+    """Test identical payloads are uploaded once and share the same URI."""
+    first = exporter.store_in_gcs(b'{"prompt": "same"}')
+    wait_for_uploads(exporter)
+    second = exporter.store_in_gcs(b'{"prompt": "same"}')
+    third = exporter.store_in_gcs(b'{"prompt": "other"}')
+    exporter.shutdown()
+    assert first == second != third
+    assert exporter.bucket.blob.return_value.upload_from_string.call_count == 2
+
+
+def test_store_in_gcs_existing_object(exporter: CloudTraceLoggingSpanExporter) -> None:
+    """Test a payload already stored by another process counts as stored."""
+    upload = exporter.bucket.blob.return_value.upload_from_string
+    upload.side_effect = PreconditionFailed("exists")
+    with patch("logging.error") as log_error:
+        exporter.store_in_gcs(b"{}")
+        wait_for_uploads(exporter)
+    log_error.assert_not_called()
+    exporter.store_in_gcs(b"{}")
+    upload.assert_called_once()
+
+
+def test_store_in_gcs_checks_bucket_once(
+    exporter: CloudTraceLoggingSpanExporter,
+) -> None:
+    """Test the bucket existence check is not repeated for every payload."""
+    exporter.store_in_gcs(b"a")
+    exporter.store_in_gcs(b"b")
+    exporter.bucket.exists.assert_called_once()
+
+
+def test_store_in_gcs_missing_bucket(exporter: CloudTraceLoggingSpanExporter) -> None:
+    """Test payloads are not uploaded when the bucket does not exist."""
+    exporter.bucket.exists.return_value = False
+    assert exporter.store_in_gcs(b"a") == "GCS bucket not found"
+    exporter.bucket.blob.assert_not_called()
+
+
+def test_store_in_gcs_failed_upload_releases_slot(
+    exporter: CloudTraceLoggingSpanExporter,
+) -> None:
+    """Test a failed background upload does not block later uploads."""
+    exporter._upload_slots = threading.BoundedSemaphore(1)
+    upload = exporter.bucket.blob.return_value.upload_from_string
+    upload.side_effect = RuntimeError("unavailable")
+    exporter.store_in_gcs(b"a")
+    exporter.store_in_gcs(b"b")
+    exporter.shutdown()
+    assert upload.call_count == 2
+
+
+def test_store_in_gcs_retries_failed_payload(
+    exporter: CloudTraceLoggingSpanExporter,
+) -> None:
+    """Test a payload whose upload failed is uploaded again next time."""
+    upload = exporter.bucket.blob.return_value.upload_from_string
+    upload.side_effect = [RuntimeError("unavailable"), None]
+    exporter.store_in_gcs(b"a")
+    wait_for_uploads(exporter)
+    exporter.store_in_gcs(b"a")
+    exporter.shutdown()
+    assert upload.call_count == 2
+
+
+def test_read_payload(mock_storage_client: Mock) -> None:
+    """Test stored payloads are read back from their URI or URL."""
+    blob = mock_storage_client.bucket.return_value.blob.return_value
+    blob.download_as_bytes.return_value = gzip.compress(b'{"key": "value"}')
+    uri = "gs://test-bucket/spans/abc.json"
+    assert read_payload(uri, mock_storage_client) == {"key": "value"}
+    mock_storage_client.bucket.assert_called_with("test-bucket")
+    mock_storage_client.bucket.return_value.blob.assert_called_with("spans/abc.json")
+
+    # Uncompressed payloads from earlier versions
+    blob.download_as_bytes.return_value = b'{"key": "value"}'
+    url = "https://storage.mtls.cloud.google.com/test-bucket/spans/abc.json"
+    assert read_payload(url, mock_storage_client) == {"key": "value"}
+    mock_storage_client.bucket.return_value.blob.assert_called_with("spans/abc.json")
+
+
+def make_span(span_id: int = 456, **attributes: Any) -> ReadableSpan:
+    """Create a finished span with the given attributes."""
+    return ReadableSpan(
+        name="span",
+        context=SpanContext(trace_id=123, span_id=span_id, is_remote=False),
+        attributes=attributes,
+        start_time=1_700_000_000_000_000_000,
+        end_time=1_700_000_001_000_000_000,
+    )
 
 
-@patch("json.dumps")
 def test_process_large_attributes_small_payload(
-    mock_json_dumps: Mock, exporter: CloudTraceLoggingSpanExporter
+    exporter: CloudTraceLoggingSpanExporter,
 ) -> None:
     """Test processing of small payload attributes."""
-    mock_json_dumps.return_value = "a" * 100  # Small payload
     span_dict = {"attributes": {"key": "value"}}
     result = exporter._process_large_attributes(span_dict, "span-id")
     assert result == span_dict
+    exporter.bucket.blob.assert_not_called()
 
 
-@patch("json.dumps")
 def test_process_large_attributes_large_payload(
-    mock_json_dumps: Mock, exporter: CloudTraceLoggingSpanExporter
+    exporter: CloudTraceLoggingSpanExporter,
 ) -> None:
     """Test processing of large payload attributes."""
-    mock_json_dumps.return_value = "a" * (400 * 1024 + 1)  # Large payload
     span_dict = {
         "attributes": {
-            "key1": "value1",
+            "key1": "a" * (400 * 1024),
             "traceloop.association.properties.key2": "value2",
         }
     }
     result = exporter._process_large_attributes(span_dict, "span-id")
-    assert "uri_payload" in result["attributes"]
-    assert "url_payload" in result["attributes"]
+    assert result["attributes"]["uri_payload"].startswith("gs://test-bucket/spans/")
+    assert result["attributes"]["url_payload"] == result["attributes"][
+        "uri_payload"
+    ].replace("gs://", "https://storage.mtls.cloud.google.com/")
     assert "key1" not in result["attributes"]
     assert "traceloop.association.properties.key2" in result["attributes"]
 
 
+def uploaded_contents(exporter: CloudTraceLoggingSpanExporter) -> List[bytes]:
+    """Wait for the uploads and return the uploaded contents, decompressed."""
+    exporter.shutdown()
+    upload = exporter.bucket.blob.return_value.upload_from_string
+    return [gzip.decompress(call.args[0]) for call in upload.call_args_list]
+
+
+def test_process_large_attributes_reuses_encoded_values(
+    exporter: CloudTraceLoggingSpanExporter,
+) -> None:
+    """Test the stored payload is assembled from the already encoded values."""
+    attributes = {
+        "key1": "a" * (400 * 1024),
+        "key2": [1, 2],
+        "traceloop.association.properties.key3": "value3",
+    }
+    encoded_attributes = encode_attributes(attributes)
+    with patch("app.utils.span_encoding.orjson.dumps", wraps=orjson.dumps) as dumps:
+        exporter._process_large_attributes(
+            {"attributes": attributes}, "span-id", encoded_attributes
+        )
+    # Only the keys are encoded again, not the values
+    assert all(len(call.args[0]) <= 4 for call in dumps.call_args_list)
+    assert encoded_attributes["key1"] in uploaded_contents(exporter)
+
+
+def test_process_large_attributes_shares_large_values(
+    exporter: CloudTraceLoggingSpanExporter,
+) -> None:
+    """Test large values are stored once and referenced from each payload."""
+    system = "Be helpful. " * 30_000
+    for question in ("first", "second"):
+        span_dict = {"attributes": {"system": system, "question": question}}
+        exporter._process_large_attributes(span_dict, "span-id")
+        wait_for_uploads(exporter)
+
+    contents = uploaded_contents(exporter)
+    encoded_system = orjson.dumps(system)
+    assert contents.count(encoded_system) == 1
+    digest = hashlib.sha256(encoded_system).hexdigest()
+    system_uri = f"gs://test-bucket/spans/{digest}.json"
+    payloads = [orjson.loads(c) for c in contents if c != encoded_system]
+    assert payloads == [
+        {"system": {"uri_payload": system_uri}, "question": question}
+        for question in ("first", "second")
+    ]
+
+
+def test_read_payload_resolves_shared_values(mock_storage_client: Mock) -> None:
+    """Test values stored as their own object are put back in the attributes."""
+    objects = {
+        "spans/payload.json": gzip.compress(
+            b'{"system":{"uri_payload":"gs://test-bucket/spans/system.json"},"n":1}'
+        ),
+        "spans/system.json": gzip.compress(b'"Be helpful."'),
+    }
+
+    def blob(name: str) -> Mock:
+        return Mock(download_as_bytes=Mock(return_value=objects[name]))
+
+    mock_storage_client.bucket.return_value.blob.side_effect = blob
+    payload = read_payload("gs://test-bucket/spans/payload.json", mock_storage_client)
+    assert payload == {"system": "Be helpful.", "n": 1}
+
+
+def test_export_encodes_span_once(exporter: CloudTraceLoggingSpanExporter) -> None:
+    """Test the span is converted without a JSON round trip."""
+    span = make_span(key="value")
+    exporter.client = Mock()
+    exporter._translate_to_cloud_trace = Mock(return_value=[])
+    with patch.object(ReadableSpan, "to_json") as to_json:
+        exporter.export([span])
+    to_json.assert_not_called()
+    entry = exporter.logger.batch.return_value.log_struct.call_args.args[0]
+    assert entry["attributes"] == {"key": "value"}
+    assert entry["span_id"] == "1c8"
+    assert entry["trace"] == "projects/test-project/traces/7b"
+
+
 @patch.object(CloudTraceLoggingSpanExporter, "_process_large_attributes")
 def test_export(
     mock_process_large_attributes: Mock, exporter: CloudTraceLoggingSpanExporter
 ) -> None:
     """Test the export method of CloudTraceLoggingSpanExporter."""
-    mock_span = Mock(spec=ReadableSpan)
-    mock_span.get_span_context.return_value.trace_id = 123
-    mock_span.get_span_context.return_value.span_id = 456
-    mock_span.to_json.return_value = '{"key": "value"}'
-
-    mock_process_large_attributes.return_value = {"processed": "data"}
+    entry = {
+        "processed": "data",
+        "attributes": {},
+        "trace": "projects/test-project/traces/7b",
+        "span_id": "1c8",
+    }
+    mock_process_large_attributes.return_value = entry
+    exporter.client = Mock()
+    exporter._translate_to_cloud_trace = Mock(return_value=[])
 
-    exporter.export([mock_span])
+    exporter.export([make_span(key="value")])
 
     mock_process_large_attributes.assert_called_once()
-    exporter.logger.log_struct.assert_called_once()
+    batch = exporter.logger.batch.return_value
+    batch.log_struct.assert_called_once_with(
+        entry, severity="INFO", insert_id="7b-1c8"
+    )
+    batch.commit.assert_called_once()
+
+
+def test_export_retry_writes_identical_entries(
+    exporter: CloudTraceLoggingSpanExporter,
+) -> None:
+    """Test a retried span gets the insert ID and timestamp of the first write."""
+    exporter.client = Mock()
+    exporter._translate_to_cloud_trace = Mock(return_value=[])
+    batch = exporter.logger.batch.return_value
+    batch.commit.side_effect = [RuntimeError("quota"), None]
+    span = make_span(key="value")
+    assert exporter.export([span]) == SpanExportResult.FAILURE
+    assert exporter.export([span]) == SpanExportResult.SUCCESS
+
+    first, second = (call.kwargs for call in batch.log_struct.call_args_list)
+    assert first == second
+    assert first["insert_id"] == "7b-1c8"
+    assert first["timestamp"] == datetime.datetime(
+        2023, 11, 14, 22, 13, 21, tzinfo=datetime.timezone.utc
+    )
+
+
+@patch.object(CloudTraceLoggingSpanExporter, "_process_large_attributes")
+def test_export_writes_one_request_per_batch(
+    mock_process_large_attributes: Mock, exporter: CloudTraceLoggingSpanExporter
+) -> None:
+    """Test a batch of spans results in a single logging write."""
+    mock_span = make_span(key="value")
+    mock_process_large_attributes.side_effect = lambda span_dict, **kwargs: span_dict
+    exporter.client = Mock()
+    exporter._translate_to_cloud_trace = Mock(return_value=[])
+
+    assert exporter.export([mock_span] * 10) == SpanExportResult.SUCCESS
+    exporter.client.batch_write_spans.assert_called_once()
+
+    exporter.logger.batch.assert_called_once()
+    batch = exporter.logger.batch.return_value
+    assert batch.log_struct.call_count == 10
+    batch.commit.assert_called_once()
+
+
+@patch.object(CloudTraceLoggingSpanExporter, "_process_large_attributes")
+def test_export_logging_failure(
+    mock_process_large_attributes: Mock, exporter: CloudTraceLoggingSpanExporter
+) -> None:
+    """Test a failed logging write is reported as a failed export."""
+    mock_span = make_span(key="value")
+    mock_process_large_attributes.return_value = {"processed": "data", "attributes": {}}
+    exporter.client = Mock()
+    exporter._translate_to_cloud_trace = Mock(return_value=[])
+    exporter.logger.batch.return_value.commit.side_effect = RuntimeError("quota")
+
+    assert exporter.export([mock_span]) == SpanExportResult.FAILURE
+
+
+def test_split_entries_respects_count_and_size() -> None:
+    """Test entries are grouped within the request limits, keeping order."""
+    entries = [({"n": n}, 40) for n in range(10)]
+    groups = list(split_entries(entries, max_entries=3, max_bytes=100))
+    assert [[entry["n"] for entry in group] for group in groups] == [
+        [0, 1],
+        [2, 3],
+        [4, 5],
+        [6, 7],
+        [8, 9],
+    ]
+    groups = list(split_entries(entries, max_entries=3, max_bytes=1000))
+    assert [len(group) for group in groups] == [3, 3, 3, 1]
+    # An entry larger than the limit still gets a group of its own
+    assert list(split_entries([({"n": 0}, 500)], max_bytes=100)) == [[{"n": 0}]]
+
+
+def test_export_delta_encodes_prompts(exporter: CloudTraceLoggingSpanExporter) -> None:
+    """Test a prompt extending the previous prompt of the session is logged as a delta."""
+    history = "system: be helpful\n" + "user: hi\n" * 200
+    first = make_span(
+        **{
+            "traceloop.association.properties.session_id": "session-1",
+            "gen_ai.prompt.0.content": history,
+        }
+    )
+    second = make_span(
+        span_id=457,
+        **{
+            "traceloop.association.properties.session_id": "session-1",
+            "gen_ai.prompt.0.content": history + "assistant: hello\nuser: bye\n",
+        },
+    )
+    exporter.client = Mock()
+    exporter._translate_to_cloud_trace = Mock(return_value=[])
+    exporter.export([first, second])
+
+    calls = exporter.logger.batch.return_value.log_struct.call_args_list
+    first_entry, second_entry = (call.args[0]["attributes"] for call in calls)
+    assert first_entry["gen_ai.prompt.0.content"] == history
+    assert second_entry["gen_ai.prompt.0.content"] == "assistant: hello\nuser: bye\n"
+    assert second_entry["gen_ai.prompt.0.content.delta_base"] == f"1c8:{len(history)}"
+
+
+def test_export_delta_bases_only_written_spans(
+    exporter: CloudTraceLoggingSpanExporter,
+) -> None:
+    """Test spans whose log write failed are not used as delta bases."""
+    history = "system: be helpful\n" + "user: hi\n" * 200
+    first = make_span(
+        **{
+            "traceloop.association.properties.session_id": "session-1",
+            "gen_ai.prompt.0.content": history,
+        }
+    )
+    second = make_span(
+        span_id=457,
+        **{
+            "traceloop.association.properties.session_id": "session-1",
+            "gen_ai.prompt.0.content": history + "user: bye\n",
+        },
+    )
+    exporter.client = Mock()
+    exporter._translate_to_cloud_trace = Mock(return_value=[])
+    batch = exporter.logger.batch.return_value
+    batch.commit.side_effect = [RuntimeError("quota"), None, None]
+    assert exporter.export([first]) == SpanExportResult.FAILURE
+    exporter.export([second])
+    second_entry = batch.log_struct.call_args.args[0]["attributes"]
+    assert second_entry["gen_ai.prompt.0.content"] == history + "user: bye\n"
+
+    # Exporting a span again does not encode it against itself
+    exporter.export([second])
+    assert batch.log_struct.call_args.args[0]["attributes"] == second_entry
+
+
+def test_export_scrubs_inline_media(exporter: CloudTraceLoggingSpanExporter) -> None:
+    """Test inline images are logged as a description instead of being offloaded."""
+    image = base64.b64encode(b"\x89PNG" + b"\x00" * (400 * 1024)).decode()
+    content = json.dumps(
+        [{"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image}"}}]
+    )
+    exporter.client = Mock()
+    exporter._translate_to_cloud_trace = Mock(return_value=[])
+    exporter.export([make_span(**{"gen_ai.prompt.0.content": content})])
+
+    entry = exporter.logger.batch.return_value.log_struct.call_args.args[0]
+    (part,) = json.loads(entry["attributes"]["gen_ai.prompt.0.content"])
+    assert part["image_url"]["url"].startswith("[image/png, 409604 bytes, sha256:")
+    exporter.bucket.blob.assert_not_called()
+
+
+def collect_metrics(reader: InMemoryMetricReader) -> Dict[str, List[Any]]:
+    """Data points of the collected metrics, by metric name."""
+    points: Dict[str, List[Any]] = {}
+    metrics_data = reader.get_metrics_data()
+    for resource_metrics in metrics_data.resource_metrics:
+        for scope_metrics in resource_metrics.scope_metrics:
+            for metric in scope_metrics.metrics:
+                points.setdefault(metric.name, []).extend(metric.data.data_points)
+    return points
+
+
+@pytest.fixture
+def metered_exporter(
+    exporter: CloudTraceLoggingSpanExporter,
+) -> Generator[Tuple[CloudTraceLoggingSpanExporter, InMemoryMetricReader], None, None]:
+    """The exporter, recording its metrics in memory."""
+    reader = InMemoryMetricReader()
+    exporter.metrics = ExporterMetrics(MeterProvider(metric_readers=[reader]))
+    exporter.client = Mock()
+    exporter._translate_to_cloud_trace = Mock(return_value=[])
+    yield exporter, reader
+
+
+def test_export_metrics(metered_exporter: Any) -> None:
+    """Test export latency, batch size, span size and offloads are recorded."""
+    exporter, reader = metered_exporter
+    spans = [make_span(key="value"), make_span(key="a" * (300 * 1024))]
+    assert exporter.export(spans) == SpanExportResult.SUCCESS
+    exporter.shutdown()
+
+    points = collect_metrics(reader)
+    durations = {
+        point.attributes["sink"]: point.count
+        for point in points["span_exporter.export.duration"]
+    }
+    assert durations == {"cloud_logging": 1, "cloud_trace": 1}
+    (batch,) = points["span_exporter.batch.spans"]
+    assert batch.sum == 2
+    (span_bytes,) = points["span_exporter.span.encoded_bytes"]
+    assert span_bytes.count == 2
+    assert span_bytes.max < 10 * 1024
+    assert points["span_exporter.offload.count"][0].value == 1
+    assert points["span_exporter.offload.bytes"][0].value > 300 * 1024
+    # The large value and the payload referencing it
+    assert points["span_exporter.gcs_upload.duration"][0].count == 2
+    assert "span_exporter.failures" not in points
+
+
+def test_export_failure_metrics(metered_exporter: Any) -> None:
+    """Test failures are counted per sink."""
+    exporter, reader = metered_exporter
+    exporter.logger.batch.return_value.commit.side_effect = RuntimeError("quota")
+    exporter.client.batch_write_spans.side_effect = RuntimeError("unavailable")
+    exporter.bucket.blob.return_value.upload_from_string.side_effect = RuntimeError(
+        "unavailable"
+    )
+    spans = [make_span(key="a" * (300 * 1024))]
+    assert exporter.export(spans) == SpanExportResult.FAILURE
+    exporter.shutdown()
+
+    failures = {
+        point.attributes["sink"]: point.value
+        for point in collect_metrics(reader)["span_exporter.failures"]
+    }
+    assert failures == {"cloud_logging": 1, "cloud_trace": 1, "gcs": 2}